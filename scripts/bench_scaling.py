@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+# allow imports from src/ and scripts/
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from src.prop47_state.panel import PanelCube
+from src.prop47_state.scm import fit_one, placebo_fits, placebo_loop, solve_scm_weights
+from build_state_panel import COLUMNS, combine_partials, year_partials
+
+OUTCOME = "theft_per_100k_coveredpop"
+STAGES = ["build", "panel", "solve_native", "solve_cvxpy", "fit_one", "placebo_fits", "placebo_loop"]
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Time build_state_panel, solve_scm_weights, fit_one and the placebo loops on synthetic "
+                    "panels across sizes; append one JSON line per (stage, size) to --out."
+    )
+    p.add_argument("--states", nargs="+", type=int, default=[10, 30, 100, 300, 1000, 3000])
+    p.add_argument("--months", nargs="+", type=int, default=[60, 120, 240, 600])
+    p.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    p.add_argument("--agencies-per-state", type=int, default=10, help="Agencies per state in the build benchmark")
+    p.add_argument("--missing-rate", type=float, default=0.05,
+                   help="Share of agency-years reporting < 12 months; share of states with a gap in the state panel")
+    p.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (min and median are recorded)")
+    p.add_argument("--no-memory", action="store_true", help="Skip the extra tracemalloc run for peak memory")
+    p.add_argument("--max-agency-rows", type=int, default=5_000_000, help="Skip the build stage above this size")
+    p.add_argument("--max-cvxpy-donors", type=int, default=300, help="Skip solve_cvxpy above this many donors")
+    p.add_argument("--max-placebo-states", type=int, default=300, help="Skip the placebo stages above this many states")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", type=str, default="outputs/bench/scaling.jsonl")
+    p.add_argument("--compare", type=str, default=None,
+                   help="Earlier results file: print time ratios (this run / that run) for matching records")
+    return p.parse_args()
+
+
+# -----------------------------
+# Synthetic panels
+# -----------------------------
+
+def state_names(n_states: int) -> List[str]:
+    """'CA' (the treated unit in every benchmark) followed by S0001, S0002, ..."""
+    return ["CA"] + [f"S{i:04d}" for i in range(1, n_states)]
+
+
+def month_range(n_months: int, end: str = "2024-12-01") -> pd.DatetimeIndex:
+    return pd.date_range(end=pd.Timestamp(end), periods=n_months, freq="MS")
+
+
+def synthetic_agency_months(n_states: int, agencies_per_state: int, n_months: int,
+                            missing_rate: float = 0.05, seed: int = 0) -> pd.DataFrame:
+    """
+    Long agency-month frame with the raw file columns (COLUMNS), covering the
+    whole years spanned by the last n_months months. A missing_rate share of
+    agency-years report fewer than 12 months.
+    """
+    rng = np.random.default_rng(seed)
+    years = np.unique(month_range(n_months).year)
+    n_ag = n_states * agencies_per_state
+    n_ay = n_ag * years.size
+
+    state = np.repeat(np.array(state_names(n_states), dtype=object), agencies_per_state)
+    ori = np.array([f"{s[:2]}{i:07d}" for i, s in enumerate(state)], dtype=object)
+    pop = rng.integers(1_000, 200_000, size=n_ag).astype(float)
+
+    reported = np.where(rng.random(n_ay) < missing_rate, rng.integers(0, 12, size=n_ay), 12)
+    rate = rng.gamma(4.0, 0.5, size=n_ag)
+    return pd.DataFrame({
+        "state_abb": np.repeat(np.tile(state, years.size), 12),
+        "ori": np.repeat(np.tile(ori, years.size), 12),
+        "year": np.repeat(np.repeat(years, n_ag), 12),
+        "month": np.tile(np.arange(1, 13), n_ay),
+        "number_of_months_reported": np.repeat(reported, 12),
+        "population": np.repeat(np.tile(pop, years.size), 12),
+        "actual_theft_total": rng.poisson(np.repeat(np.tile(rate * pop / 1e4, years.size), 12)).astype(float),
+        "actual_index_violent": rng.poisson(np.repeat(np.tile(rate * pop / 4e4, years.size), 12)).astype(float),
+    })[COLUMNS]
+
+
+def synthetic_state_months(n_states: int, n_months: int, missing_rate: float = 0.05,
+                           n_factors: int = 3, seed: int = 0) -> pd.DataFrame:
+    """
+    Long state-month panel (state_abb, date, coverage_rate and the two rate
+    outcomes) from a low-rank factor model with seasonality. A missing_rate
+    share of states (never CA) get a run of NaN outcome months.
+    """
+    rng = np.random.default_rng(seed)
+    dates = month_range(n_months)
+    F = np.cumsum(rng.normal(0.0, 1.0, size=(n_months, n_factors)), axis=0)
+    season = np.sin(2 * np.pi * (dates.month.to_numpy() - 1) / 12.0)
+
+    def outcome(level: float) -> np.ndarray:
+        mu = rng.normal(level, level / 5, size=n_states)
+        lam = rng.normal(0.0, level / 40, size=(n_states, n_factors))
+        amp = rng.normal(level / 20, level / 100, size=n_states)
+        Y = mu[None, :] + F @ lam.T + season[:, None] * amp[None, :] + rng.normal(0.0, level / 50, size=(n_months, n_states))
+        return Y
+
+    theft, violent = outcome(150.0), outcome(35.0)
+    gap_states = np.flatnonzero(rng.random(n_states) < missing_rate)
+    for s in gap_states[gap_states > 0]:
+        start = rng.integers(0, max(1, n_months - 6))
+        theft[start:start + 6, s] = np.nan
+        violent[start:start + 6, s] = np.nan
+
+    return pd.DataFrame({
+        "state_abb": np.tile(np.array(state_names(n_states), dtype=object), n_months),
+        "date": np.repeat(dates.to_numpy(), n_states),
+        "coverage_rate": np.clip(rng.normal(0.97, 0.02, size=n_months * n_states), 0.0, 1.0),
+        "theft_per_100k_coveredpop": theft.reshape(-1),
+        "violent_per_100k_coveredpop": violent.reshape(-1),
+    })
+
+
+def spec_window(dates: pd.DatetimeIndex) -> Dict[str, pd.Timestamp]:
+    """Pre-period = first 60% of months, fit window to 80%, evaluation to the end."""
+    n = len(dates)
+    return {
+        "pre_start": dates[0], "date_min": dates[0],
+        "t0": dates[int(0.6 * n)], "fit_end": dates[int(0.8 * n) - 1], "full_end": dates[-1],
+    }
+
+
+# -----------------------------
+# Measurement
+# -----------------------------
+
+def measure(fn: Callable[[], Any], repeat: int, memory: bool) -> Dict[str, Any]:
+    """
+    Min/median wall time over `repeat` runs after one untimed warm-up run
+    (first-call costs such as cvxpy problem compilation). peak_mb is the Python + NumPy heap
+    peak of one extra run under tracemalloc (Arrow buffers are not traced);
+    max_rss_mb is the process high-water mark so far, for a coarse upper bound.
+    """
+    fn()
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    out = {"seconds_min": min(times), "seconds_median": float(np.median(times)), "repeat": repeat}
+    if memory:
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        out["peak_mb"] = peak / 2**20
+    out["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return out
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_metadata() -> Dict[str, Any]:
+    return {
+        "run_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def bench_size(n_states: int, n_months: int, args: argparse.Namespace,
+               memory: bool) -> List[Dict[str, Any]]:
+    size = {"n_states": n_states, "n_months": n_months, "missing_rate": args.missing_rate}
+    records = []
+
+    def record(stage: str, fn: Optional[Callable[[], Any]], skip: Optional[str] = None, **extra) -> None:
+        rec = {"stage": stage, **size, **extra}
+        if skip:
+            rec.update(status="skipped", note=skip)
+        else:
+            try:
+                rec.update(measure(fn, args.repeat, memory), status="ok")
+            except Exception as e:
+                rec.update(status="error", note=f"{type(e).__name__}: {e}")
+        records.append(rec)
+        timing = f"{rec['seconds_min']:.4f}s" if rec["status"] == "ok" else rec["status"]
+        mem = f"  peak={rec['peak_mb']:.1f}MB" if "peak_mb" in rec else ""
+        print(f"  {stage:<13} states={n_states:<5} months={n_months:<4} {timing}{mem}")
+
+    stages = set(args.stages)
+
+    if "build" in stages:
+        n_rows = n_states * args.agencies_per_state * 12 * len(np.unique(month_range(n_months).year))
+        extra = {"agencies_per_state": args.agencies_per_state, "n_agency_rows": n_rows}
+        if n_rows > args.max_agency_rows:
+            record("build", None, skip=f"{n_rows} agency rows > --max-agency-rows", **extra)
+        else:
+            raw = synthetic_agency_months(n_states, args.agencies_per_state, n_months, args.missing_rate, args.seed)
+            with tempfile.TemporaryDirectory(prefix="prop47_bench_") as tmp:
+                paths = []
+                for year, g in raw.groupby("year"):
+                    fp = Path(tmp) / f"offenses_known_monthly_{year}.parquet"
+                    g.to_parquet(fp, index=False)
+                    paths.append(fp)
+                del raw
+                record("build", lambda: combine_partials([year_partials(fp, set()) for fp in paths]), **extra)
+
+    df = synthetic_state_months(n_states, n_months, args.missing_rate, seed=args.seed)
+    cube = PanelCube.from_frame(df, outcomes=[OUTCOME])
+    if "panel" in stages:
+        record("panel", lambda: PanelCube.from_frame(df, outcomes=[OUTCOME]))
+
+    win = spec_window(cube.dates)
+    donors = [s for s in cube.states if s != "CA"]
+    r = cube.rows(win["pre_start"], win["t0"] - pd.offsets.MonthBegin(1))
+    pre = np.asarray(cube.values[r, :, 0])
+    keep = np.isfinite(pre).all(axis=0)
+    y_pre, X_pre = pre[:, 0], pre[:, 1:][:, keep[1:]]
+    n_donors = X_pre.shape[1]
+
+    if "solve_native" in stages:
+        record("solve_native", lambda: solve_scm_weights(y_pre, X_pre, solver="native"), n_donors=n_donors)
+    if "solve_cvxpy" in stages:
+        skip = f"{n_donors} donors > --max-cvxpy-donors" if n_donors > args.max_cvxpy_donors else None
+        record("solve_cvxpy", lambda: solve_scm_weights(y_pre, X_pre, solver="cvxpy"), skip=skip, n_donors=n_donors)
+
+    fit_kw = dict(treated="CA", outcome=OUTCOME, donors=donors, min_donors=1, solver="native", **win)
+    if "fit_one" in stages:
+        record("fit_one", lambda: fit_one(cube, **fit_kw), n_donors=n_donors)
+
+    placebo_stages = [s for s in ("placebo_fits", "placebo_loop") if s in stages]
+    if placebo_stages:
+        tr = fit_one(cube, **fit_kw)
+        skip = f"{n_states} states > --max-placebo-states" if n_states > args.max_placebo_states else None
+        if "placebo_fits" in stages:
+            record("placebo_fits", lambda: placebo_fits(cube, tr, tr.donors_complete_pre, min_donors=1),
+                   skip=skip, n_donors=n_donors)
+        if "placebo_loop" in stages:
+            record("placebo_loop", lambda: placebo_loop(cube, tr, tr.donors_complete_pre, min_donors=1, solver="native"),
+                   skip=skip, n_donors=n_donors)
+    return records
+
+
+def compare(records: List[Dict[str, Any]], prev_path: Path) -> None:
+    prev = {}
+    with open(prev_path) as f:
+        for line in f:
+            r = json.loads(line)
+            if r.get("status") == "ok":
+                prev[(r["stage"], r["n_states"], r["n_months"])] = r["seconds_min"]
+    print(f"Compared with {prev_path} (ratio = this run / earlier run, min times):")
+    for r in records:
+        key = (r["stage"], r["n_states"], r["n_months"])
+        if r["status"] == "ok" and key in prev:
+            print(f"  {key[0]:<13} states={key[1]:<5} months={key[2]:<4} {r['seconds_min'] / prev[key]:.2f}x")
+
+
+def main() -> None:
+    args = parse_args()
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    meta = run_metadata()
+    print(f"Benchmark run {meta['run_at']} (commit {meta['git_commit']})")
+
+    records = []
+    for n_states in args.states:
+        for n_months in args.months:
+            size_records = [{**meta, **rec} for rec in bench_size(n_states, n_months, args, memory=not args.no_memory)]
+            # append per size so an interrupted sweep keeps what it measured
+            with open(out, "a") as f:
+                for rec in size_records:
+                    f.write(json.dumps(rec, default=str) + "\n")
+            records.extend(size_records)
+
+    print(f"Appended {len(records)} records to {out}")
+    if args.compare:
+        compare(records, Path(args.compare))
+
+
+if __name__ == "__main__":
+    main()
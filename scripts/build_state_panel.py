@@ -1,10 +1,21 @@
 from __future__ import annotations
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+import sys
 import pandas as pd
 import numpy as np
 
+# allow imports from src/
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT))
+
+from src.prop47_state.qc import QCRules, StateQC, describe_pools
+from src.prop47_state.store import write_store
+
 COLUMNS = [
     "state_abb",
     "ori",
@@ -18,13 +29,19 @@ COLUMNS = [
 
 MISSING_TOKENS = {"", "none", "nan", "null"}
 
+# Bump whenever year_partials (or anything it calls) changes its output,
+# so cached per-year partials built by older code are not reused.
+PARTIALS_VERSION = "2"
+
 
 def flag_missing(group: pd.DataFrame) -> pd.DataFrame:
     """
     Uses number_of_months_reported to mark n_missing months as missing.
     Assumption: the 'missing' months are the lowest-crime months in that ORI-year.
+    A missing number_of_months_reported flags nothing (every month is kept).
     """
-    n_missing = int(12 - group["number_of_months_reported"].iloc[0])
+    n_reported = group["number_of_months_reported"].iloc[0]
+    n_missing = 0 if pd.isna(n_reported) else int(12 - n_reported)
     n_missing = max(0, min(n_missing, len(group)))
 
     group = group.sort_values(["actual_theft_total", "actual_index_violent"], ascending=True).copy()
@@ -34,73 +51,212 @@ def flag_missing(group: pd.DataFrame) -> pd.DataFrame:
     return group
 
 
-def parse_args() -> argparse.Namespace:
-    p = argparse.ArgumentParser()
-    p.add_argument("--raw-dir", type=str, required=True, help="Directory containing offenses_known_monthly_{year}.parquet")
-    p.add_argument("--out", type=str, default="data/processed/state_month_covered.parquet")
-    p.add_argument("--start-year", type=int, default=2010)
-    p.add_argument("--end-year", type=int, default=2024)
-    p.add_argument("--drop-states", type=str, default="AR,HI,IN,MI,MS,MT,NE,NH,NY,OH,PA,SD,UT,WV,OR,CZ,PR,GU")
-    return p.parse_args()
-
-
-def main() -> None:
-    args = parse_args()
-    raw_dir = Path(args.raw_dir)
-    out_path = Path(args.out)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
+def flag_missing_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vectorized equivalent of df.groupby(["ori", "year"]).apply(flag_missing).
+    One stable sort by (ori, year, theft, violent), then a within-group rank is
+    compared against 12 - number_of_months_reported (taken from the first row of
+    each ORI-year in input order; NaN flags nothing). Row order and index match
+    the groupby version.
+    """
+    keys = ["ori", "year"]
+    df = df.loc[df["ori"].notna() & df["year"].notna()]
 
-    drop_states = {s.strip() for s in args.drop_states.split(",") if s.strip()}
+    n_reported = df.groupby(keys, sort=False)["number_of_months_reported"].transform("first")
+    n_missing = 12 - n_reported
 
-    frames = []
-    for year in range(args.start_year, args.end_year + 1):
-        fp = raw_dir / f"offenses_known_monthly_{year}.parquet"
-        if not fp.exists():
-            raise FileNotFoundError(f"Missing file: {fp}")
+    df = df.sort_values(keys + ["actual_theft_total", "actual_index_violent"], ascending=True).copy()
+    rank = df.groupby(keys, sort=False).cumcount()
+    df["month_missing"] = (rank < n_missing.loc[df.index]).to_numpy()
+    return df
 
-        df = pd.read_parquet(fp, columns=COLUMNS)
 
-        s = df["state_abb"].astype("string").str.strip()
-        s_lower = s.str.lower()
+def read_year(fp: Path, drop_states: set) -> pd.DataFrame:
+    """
+    Read one raw year with column projection and the state exclusion pushed into
+    the parquet reader. The pushed-down filter only removes exact matches; the
+    stripped / case-insensitive check below still applies to what remains.
+    """
+    pushdown = sorted(drop_states | MISSING_TOKENS)
+    df = pd.read_parquet(fp, columns=COLUMNS, filters=[("state_abb", "not in", pushdown)])
 
-        bad = (
-            s.isna()
-            | s_lower.isin(MISSING_TOKENS)
-            | s.isin(drop_states)
-        )
-        df = df.loc[~bad].copy()
+    s = df["state_abb"].astype("string").str.strip()
+    s_lower = s.str.lower()
 
-        df = df.groupby(["ori", "year"], group_keys=False).apply(flag_missing)
-        frames.append(df)
+    bad = (
+        s.isna()
+        | s_lower.isin(MISSING_TOKENS)
+        | s.isin(drop_states)
+    )
+    return df.loc[~bad].copy()
 
-    state_month = pd.concat(frames, ignore_index=True)
 
+def add_dates(df: pd.DataFrame) -> pd.DataFrame:
     # date parsing (handles either month names or month numbers)
-    if np.issubdtype(state_month["month"].dtype, np.number):
-        month_num = state_month["month"].astype(int)
-        state_month["date"] = pd.to_datetime(
-            state_month["year"].astype(int).astype(str) + "-" + month_num.astype(str).str.zfill(2) + "-01"
+    if pd.api.types.is_numeric_dtype(df["month"]):
+        month_num = df["month"].astype(int)
+        df["date"] = pd.to_datetime(
+            df["year"].astype(int).astype(str) + "-" + month_num.astype(str).str.zfill(2) + "-01"
         )
     else:
-        state_month["date"] = pd.to_datetime(
-            state_month["year"].astype(int).astype(str) + " " + state_month["month"].astype(str),
+        df["date"] = pd.to_datetime(
+            df["year"].astype(int).astype(str) + " " + df["month"].astype(str),
             format="%Y %B",
             errors="coerce",
         )
-        state_month["date"] = state_month["date"].dt.to_period("M").dt.to_timestamp()
+        df["date"] = df["date"].dt.to_period("M").dt.to_timestamp()
+    return df
 
-    # covered population
-    state_month["pop_covered"] = state_month["population"] * (~state_month["month_missing"]).astype(int)
 
-    # aggregate
-    out = (
-        state_month
+def year_agency_frame(fp: Path, drop_states: set) -> pd.DataFrame:
+    """
+    One raw year, read and sorted once, reduced to what every missing-month
+    strategy needs: n_reported (taken from the first row of each ORI-year in
+    input order, as in flag_missing_frame) and rank, the month's position in
+    its ORI-year by (theft, violent) ascending.
+    """
+    keys = ["ori", "year"]
+    df = read_year(fp, drop_states)
+    df = df.loc[df["ori"].notna() & df["year"].notna()]
+
+    n_reported = df.groupby(keys, sort=False)["number_of_months_reported"].transform("first")
+    df = df.assign(n_reported=n_reported).sort_values(keys + ["actual_theft_total", "actual_index_violent"], ascending=True)
+    df["rank"] = df.groupby(keys, sort=False).cumcount()
+    df = add_dates(df)
+    return df[["state_abb", "ori", "year", "date", "population", "n_reported", "rank",
+               "actual_theft_total", "actual_index_violent"]]
+
+
+# Missing-month strategies. Each maps an agency-month frame (year_agency_frame
+# rows, possibly several years) to (pop_weight, count_weight): the share of the
+# agency's population that counts as covered in that month, and the weight of
+# its crimes in the state-month sums. Add an entry to MISSING_STRATEGIES to
+# make a new strategy available to --missing-strategies.
+
+def missing_lowest(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """The n missing months of an ORI-year are its lowest-crime months (flag_missing); the baseline."""
+    # written as "not flagged" so a NaN n_reported keeps every month, as in flag_missing_frame
+    covered = ~(df["rank"].to_numpy() < 12 - df["n_reported"].to_numpy(dtype=float))
+    return covered.astype(float), np.ones(len(df))
+
+
+def missing_drop_partial(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Partially reported ORI-years are dropped whole: neither population nor crimes count."""
+    full = (df["n_reported"].to_numpy() >= 12).astype(float)
+    return full, full
+
+
+def missing_mar(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Missing at random: which months are missing is unknown, so every month
+    keeps its crimes and counts n_reported / 12 of the agency's population.
+    """
+    n = df["n_reported"].to_numpy(dtype=float)
+    # a NaN n_reported keeps the whole population, as in flag_missing_frame
+    share = np.where(np.isnan(n), 1.0, np.clip(n, 0.0, 12.0) / 12.0)
+    return share, np.ones(len(df))
+
+
+def missing_seasonal(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The missing months are those furthest below the agency's own seasonal
+    profile: each month's crimes (theft + violent) are divided by that
+    calendar month's mean share of the annual total over the agency's fully
+    reported years, and the n missing lowest ratios are flagged. Agencies
+    with no full year get a flat profile (the lowest-crime months).
+    """
+    crimes = (df["actual_theft_total"].fillna(0.0) + df["actual_index_violent"].fillna(0.0)).to_numpy(dtype=float)
+    moy = df["date"].dt.month.fillna(0).to_numpy(dtype=np.int64)
+    code, _ = pd.factorize(df["ori"])
+    oy = [code, df["year"].to_numpy()]
+    full = df["n_reported"].to_numpy() >= 12
+
+    annual = pd.Series(crimes).groupby(oy).transform("sum").to_numpy()
+    ok = full & (annual > 0) & (moy > 0)
+    cell = code.astype(np.int64) * 13 + moy
+    n_cells = (code.max() + 1) * 13 if code.size else 0
+    share_sum = np.bincount(cell[ok], weights=crimes[ok] / annual[ok], minlength=n_cells)
+    share_n = np.bincount(cell[ok], minlength=n_cells)
+    profile = np.where(share_n > 0, share_sum / np.maximum(share_n, 1), 1.0 / 12.0)[cell]
+
+    ratio = crimes / np.maximum(profile, 1e-9)
+    # ties keep the (theft, violent) order of year_agency_frame
+    rank = pd.Series(ratio).groupby(oy).rank(method="first").to_numpy() - 1
+    # "not flagged", so a NaN n_reported keeps every month (see missing_lowest)
+    covered = ~(rank < 12 - df["n_reported"].to_numpy(dtype=float))
+    return covered.astype(float), np.ones(len(df))
+
+
+MISSING_STRATEGIES: Dict[str, Callable[[pd.DataFrame], Tuple[np.ndarray, np.ndarray]]] = {
+    "lowest": missing_lowest,
+    "drop_partial": missing_drop_partial,
+    "mar": missing_mar,
+    "seasonal": missing_seasonal,
+}
+
+
+def strategy_partials(df: pd.DataFrame, strategy: str = "lowest") -> pd.DataFrame:
+    """State-month sums (total_pop, covered_pop, theft, violent) under one missing-month strategy."""
+    pop_w, count_w = MISSING_STRATEGIES[strategy](df)
+    pop = df["population"].to_numpy(dtype=float)
+    sums = pd.DataFrame({
+        "state_abb": df["state_abb"].to_numpy(),
+        "date": df["date"].to_numpy(),
+        "population": pop,
+        "pop_covered": pop * pop_w,
+        "theft": df["actual_theft_total"].to_numpy(dtype=float) * count_w,
+        "violent": df["actual_index_violent"].to_numpy(dtype=float) * count_w,
+    })
+    return (
+        sums
         .groupby(["state_abb", "date"], as_index=False)
         .agg(
             total_pop=("population", "sum"),
             covered_pop=("pop_covered", "sum"),
-            theft=("actual_theft_total", "sum"),
-            violent=("actual_index_violent", "sum"),
+            theft=("theft", "sum"),
+            violent=("violent", "sum"),
+        )
+    )
+
+
+def year_partials(fp: Path, drop_states: set) -> pd.DataFrame:
+    """
+    Reduce one raw year file to state-month sums (total_pop, covered_pop, theft, violent)
+    under the baseline ("lowest") strategy. Only one year of agency-months is held in memory at a time.
+    """
+    return strategy_partials(year_agency_frame(fp, drop_states), "lowest")
+
+
+def build_variants(paths: Dict[int, Path], drop_states: set, strategies: List[str],
+                   workers: int = 1) -> Dict[str, pd.DataFrame]:
+    """
+    One state-month panel per missing-month strategy from a single read and
+    sort of each raw year. Strategies that look across years (seasonal) see
+    every year's agency-months, so all years are held in memory together.
+    """
+    unknown = [s for s in strategies if s not in MISSING_STRATEGIES]
+    if unknown:
+        raise ValueError(f"Unknown missing-month strategies {unknown} (known: {list(MISSING_STRATEGIES)})")
+    fps = list(paths.values())
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            frames = list(ex.map(year_agency_frame, fps, [drop_states] * len(fps)))
+    else:
+        frames = [year_agency_frame(fp, drop_states) for fp in fps]
+    frame = pd.concat(frames, ignore_index=True)
+    return {s: combine_partials([strategy_partials(frame, s)]) for s in strategies}
+
+
+def combine_partials(partials: List[pd.DataFrame]) -> pd.DataFrame:
+    """Merge per-year partial sums into the state-month panel and derive rates."""
+    out = (
+        pd.concat(partials, ignore_index=True)
+        .groupby(["state_abb", "date"], as_index=False)
+        .agg(
+            total_pop=("total_pop", "sum"),
+            covered_pop=("covered_pop", "sum"),
+            theft=("theft", "sum"),
+            violent=("violent", "sum"),
         )
     )
 
@@ -117,9 +273,253 @@ def main() -> None:
         (out["violent"] / out["covered_pop"]) * 100000.0,
         np.nan,
     )
+    return out
+
+
+def year_agency_months(fp: Path, drop_states: set) -> pd.DataFrame:
+    """
+    One raw year as a compact agency-month panel: ori and state_abb as
+    categoricals, float32 counts and per-100k rates. Rates use the agency's
+    population and are NaN for flagged missing months (or zero population),
+    so the month drops out of donor completeness like an unreported state-month.
+    """
+    df = read_year(fp, drop_states)
+    df = flag_missing_frame(df)
+    df = add_dates(df)
+
+    pop = df["population"].to_numpy(dtype=float)
+    ok = (~df["month_missing"].to_numpy()) & (pop > 0)
+    out = pd.DataFrame({
+        "ori": df["ori"].astype(str).to_numpy(),
+        "state_abb": df["state_abb"].astype(str).str.strip().to_numpy(),
+        "date": df["date"].to_numpy(),
+        "population": pop.astype(np.float32),
+        "reported": ok,
+        "theft": df["actual_theft_total"].to_numpy(dtype=np.float32),
+        "violent": df["actual_index_violent"].to_numpy(dtype=np.float32),
+    })
+    for col, count in (("theft_per_100k_coveredpop", "theft"), ("violent_per_100k_coveredpop", "violent")):
+        rate = np.full(len(out), np.nan, dtype=np.float32)
+        rate[ok] = out[count].to_numpy()[ok] / pop[ok] * 100000.0
+        out[col] = rate
+    return out
+
+
+def combine_agency_months(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    out = pd.concat(parts, ignore_index=True).sort_values(["ori", "date"], kind="stable", ignore_index=True)
+    out["ori"] = out["ori"].astype("category")
+    out["state_abb"] = out["state_abb"].astype("category")
+    return out
+
+
+def file_sha256(fp: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(fp, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def partials_key(fp: Path, drop_states: set) -> str:
+    """Cache key for one year's partials: source content hash + drop-state set + code version."""
+    h = hashlib.sha256()
+    h.update(PARTIALS_VERSION.encode())
+    h.update(file_sha256(fp).encode())
+    h.update(",".join(sorted(drop_states)).encode())
+    return h.hexdigest()[:16]
+
+
+def cached_year_partials(paths: Dict[int, Path], drop_states: set, cache_dir: Path,
+                         workers: int = 1, force: bool = False) -> Dict[int, pd.DataFrame]:
+    """
+    Return {year: partials}, recomputing only years whose key has no cache entry
+    (or every year if force). Entries are {cache_dir}/{year}_{key}.parquet; stale
+    entries for a recomputed year are removed. Prints which years hit and missed.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    partials = {}
+    missing = {}
+    for year, fp in paths.items():
+        entry = cache_dir / f"{year}_{partials_key(fp, drop_states)}.parquet"
+        if entry.exists() and not force:
+            partials[year] = pd.read_parquet(entry)
+        else:
+            missing[year] = entry
+
+    years = list(missing)
+    if workers > 1 and len(years) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            built = list(ex.map(year_partials, [paths[y] for y in years], [drop_states] * len(years)))
+    else:
+        built = [year_partials(paths[y], drop_states) for y in years]
+
+    for year, part in zip(years, built):
+        for stale in cache_dir.glob(f"{year}_*.parquet"):
+            stale.unlink()
+        part.to_parquet(missing[year], index=False)
+        partials[year] = part
+
+    hits = sorted(set(paths) - set(missing))
+    print(f"Year cache ({cache_dir}): hits={hits}  misses={years}")
+    return {y: partials[y] for y in paths}
+
+
+def clear_partials_cache(cache_dir: Path) -> int:
+    n = 0
+    for entry in cache_dir.glob("*_*.parquet"):
+        entry.unlink()
+        n += 1
+    return n
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser()
+    p.add_argument("--raw-dir", type=str, default=None, help="Directory containing offenses_known_monthly_{year}.parquet")
+    p.add_argument("--out", type=str, default="data/processed/state_month_covered.parquet")
+    p.add_argument("--store-out", type=str, default="data/processed/state_month_store",
+                   help="Compact Hive-partitioned store (+ _metadata.json and a memory-mappable cube.npy)")
+    p.add_argument("--no-store", action="store_true", help="Write only the flat --out parquet")
+    p.add_argument("--partition-by", type=str, default="state_abb", choices=["state_abb", "year"])
+    p.add_argument("--float32-tol", type=float, default=0.0,
+                   help="Store non-integer outcomes as float32 when the max relative round-trip error is <= this "
+                        "(0 = only exact downcasts; integer counts always go to int32)")
+    p.add_argument("--from-panel", type=str, default=None,
+                   help="Skip the raw build and write the store and state_qc table from this existing flat panel")
+    p.add_argument("--qc-out", type=str, default=None,
+                   help="Per-state QC statistics and DonorPool0/DonorPool1 flags, accumulated during the build "
+                        "(default: state_qc.parquet next to the flat panel)")
+    p.add_argument("--qc-pre-start", type=str, default=QCRules.pre_start)
+    p.add_argument("--qc-t0", type=str, default=QCRules.t0, help="QC pre period is [--qc-pre-start, --qc-t0)")
+    p.add_argument("--qc-t0-late", type=str, default=QCRules.t0_late,
+                   help="Coverage swing compares the 12 months before --qc-t0 with the 12 after this")
+    p.add_argument("--min-coverage-pre", type=float, default=QCRules.min_coverage_pre)
+    p.add_argument("--max-coverage-swing", type=float, default=QCRules.max_coverage_swing)
+    p.add_argument("--max-abs-corr", type=float, default=QCRules.max_abs_corr,
+                   help="DonorPool1 drops states with |corr(coverage, theft rate)| above this in the QC pre period")
+    p.add_argument("--start-year", type=int, default=2010)
+    p.add_argument("--end-year", type=int, default=2024)
+    p.add_argument("--drop-states", type=str, default="CZ,PR,GU",
+                   help="Codes never aggregated. Low-coverage states stay in the panel; the run scripts drop them "
+                        "using the state_qc table written next to it")
+    p.add_argument("--workers", type=int, default=1, help="Years processed concurrently (1 = in-process)")
+    p.add_argument("--cache-dir", type=str, default="data/cache/year_partials",
+                   help="Per-year partial aggregates, reused when a year's inputs are unchanged")
+    p.add_argument("--no-cache", action="store_true", help="Recompute every year without reading or writing the cache")
+    p.add_argument("--force", action="store_true", help="Recompute every year and refresh its cache entry")
+    p.add_argument("--clear-cache", action="store_true", help="Delete all cached year partials before building")
+    p.add_argument("--missing-strategies", type=str, default=None,
+                   help=f"Also build one panel variant per strategy (comma list of {', '.join(MISSING_STRATEGIES)}) "
+                        "from a single read of the raw years")
+    p.add_argument("--variants-out", type=str, default="data/processed/state_month_variants",
+                   help="Variant stores go to {variants-out}/missing_strategy={name}/")
+    p.add_argument("--agency-out", type=str, default=None,
+                   help="Also write the compact agency-month (ORI) panel here, e.g. data/processed/agency_month_covered.parquet")
+    return p.parse_args()
+
+
+def write_panel_store(out: pd.DataFrame, args: argparse.Namespace) -> None:
+    meta = write_store(out, args.store_out, partition_by=args.partition_by, float32_tol=args.float32_tol)
+    print(f"Wrote: {args.store_out}  rows={meta['rows']:,}  partitions={len(meta['partitions'])}  "
+          f"dtypes={ {c: t for c, t in meta['columns'].items() if t != 'category'} }")
+
+
+def qc_rules(args: argparse.Namespace) -> QCRules:
+    return QCRules(pre_start=args.qc_pre_start, t0=args.qc_t0, t0_late=args.qc_t0_late,
+                   min_coverage_pre=args.min_coverage_pre, max_coverage_swing=args.max_coverage_swing,
+                   max_abs_corr=args.max_abs_corr)
+
+
+def qc_out_path(args: argparse.Namespace, panel_path: Path) -> Path:
+    """--qc-out, else state_qc.parquet beside the panel (the run scripts' --state-qc default for the default --out)."""
+    return Path(args.qc_out) if args.qc_out else panel_path.parent / "state_qc.parquet"
+
+
+def write_state_qc(qc: StateQC, path: Path) -> None:
+    table = qc.table()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table.to_parquet(path, index=False)
+    print(f"Wrote: {path}  states={len(table)}")
+    for rule, states in describe_pools(table).items():
+        print(f"  {rule}: {states}")
+
+
+def main() -> None:
+    args = parse_args()
+    if args.from_panel:
+        panel = pd.read_parquet(args.from_panel)
+        qc = StateQC(qc_rules(args))
+        for _, part in panel.groupby(pd.to_datetime(panel["date"]).dt.year, sort=True):
+            qc.update(part)
+        write_state_qc(qc, qc_out_path(args, Path(args.from_panel)))
+        write_panel_store(panel, args)
+        return
+    if args.raw_dir is None:
+        raise SystemExit("--raw-dir is required unless --from-panel is given")
+    raw_dir = Path(args.raw_dir)
+    out_path = Path(args.out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    drop_states = {s.strip() for s in args.drop_states.split(",") if s.strip()}
+
+    paths = {}
+    for year in range(args.start_year, args.end_year + 1):
+        fp = raw_dir / f"offenses_known_monthly_{year}.parquet"
+        if not fp.exists():
+            raise FileNotFoundError(f"Missing file: {fp}")
+        paths[year] = fp
+
+    cache_dir = Path(args.cache_dir)
+    if args.clear_cache and cache_dir.exists():
+        print(f"Cleared {clear_partials_cache(cache_dir)} cached year partials from {cache_dir}")
+
+    # partials are merged in year order regardless of completion order
+    if args.no_cache:
+        fps = list(paths.values())
+        if args.workers > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as ex:
+                partials = list(ex.map(year_partials, fps, [drop_states] * len(fps)))
+        else:
+            partials = [year_partials(fp, drop_states) for fp in fps]
+    else:
+        by_year = cached_year_partials(paths, drop_states, cache_dir, workers=args.workers, force=args.force)
+        partials = list(by_year.values())
+
+    # QC statistics stream over the same per-year state-month partials (a
+    # state-month never spans two raw years), so the panel is not re-read
+    qc = StateQC(qc_rules(args))
+    for part in partials:
+        qc.update(part)
+
+    out = combine_partials(partials)
 
     out.to_parquet(out_path, index=False)
     print(f"Wrote: {out_path}  rows={len(out):,}  states={out['state_abb'].nunique():,}")
+    write_state_qc(qc, qc_out_path(args, out_path))
+    if not args.no_store:
+        write_panel_store(out, args)
+
+    if args.missing_strategies:
+        strategies = [x.strip() for x in args.missing_strategies.split(",") if x.strip()]
+        variants_dir = Path(args.variants_out)
+        for name, panel in build_variants(paths, drop_states, strategies, workers=args.workers).items():
+            meta = write_store(panel, variants_dir / f"missing_strategy={name}", partition_by=args.partition_by,
+                               float32_tol=args.float32_tol)
+            print(f"Wrote: {variants_dir / f'missing_strategy={name}'}  rows={meta['rows']:,}  "
+                  f"mean coverage={panel['coverage_rate'].mean():.4f}")
+
+    if args.agency_out:
+        agency_path = Path(args.agency_out)
+        agency_path.parent.mkdir(parents=True, exist_ok=True)
+        fps = list(paths.values())
+        if args.workers > 1:
+            with ProcessPoolExecutor(max_workers=args.workers) as ex:
+                parts = list(ex.map(year_agency_months, fps, [drop_states] * len(fps)))
+        else:
+            parts = [year_agency_months(fp, drop_states) for fp in fps]
+        agency = combine_agency_months(parts)
+        agency.to_parquet(agency_path, index=False)
+        print(f"Wrote: {agency_path}  rows={len(agency):,}  agencies={agency['ori'].nunique():,}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# allow imports from src/ and scripts/
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from src.prop47_state.scm import build_wide, mstart, normalize_panel_df, solve_scm_weights_info
+from run_state_scm import DEFAULT_SPECS, STATE_QC_DEFAULT, dq_exclusions
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Compare the native simplex LS solver against cvxpy on every DEFAULT_SPECS problem "
+                    "(treated fit plus each in-space placebo). A native solve that is not 'optimal' (stalled or "
+                    "max_iter) counts as a failure; tests/test_simplex.py asserts the same."
+    )
+    p.add_argument("--panel", type=str, default="data/processed/state_month_covered.parquet")
+    p.add_argument("--treated", type=str, default="CA")
+    p.add_argument("--date-min", type=str, default="2010-01-01")
+    p.add_argument("--fit-end", type=str, default="2019-12-01")
+    p.add_argument("--weight-tol", type=float, default=1e-4, help="Max abs weight difference")
+    p.add_argument("--obj-tol", type=float, default=1e-6, help="Max relative objective excess of native over cvxpy")
+    return p.parse_args()
+
+
+def spec_problems(df: pd.DataFrame, treated: str, outcome: str, t0, pre_start, date_min, fit_end):
+    """Yield (label, y_pre, X_pre) for the treated fit and each leave-one-out placebo of a spec."""
+    states = sorted(df["state_abb"].unique())
+    Y = build_wide(df, states, outcome, mstart(date_min), mstart(fit_end))
+    Y = Y.loc[:, Y.notna().all()]
+    pre = Y.loc[(Y.index >= mstart(pre_start)) & (Y.index < mstart(t0))]
+    for s in [treated] + [c for c in pre.columns if c != treated]:
+        donors = [c for c in pre.columns if c not in (s, treated)]
+        yield s, pre[s].to_numpy(), pre[donors].to_numpy()
+
+
+def main() -> None:
+    args = parse_args()
+    df = normalize_panel_df(pd.read_parquet(args.panel))
+    df = df[~df["state_abb"].isin(dq_exclusions(None, STATE_QC_DEFAULT, treated=args.treated))]
+
+    failures = 0
+    for spec_id, outcome, t0, pre_start in DEFAULT_SPECS:
+        worst_w, worst_obj, t_cvx, t_nat, n = 0.0, 0.0, 0.0, 0.0, 0
+        for label, y_pre, X_pre in spec_problems(df, args.treated, outcome, t0, pre_start, args.date_min, args.fit_end):
+            t = time.perf_counter()
+            w_c, info_c = solve_scm_weights_info(y_pre, X_pre, solver="cvxpy")
+            t_cvx += time.perf_counter() - t
+            t = time.perf_counter()
+            w_n, info_n = solve_scm_weights_info(y_pre, X_pre, solver="native")
+            t_nat += time.perf_counter() - t
+            n += 1
+
+            dw = float(np.max(np.abs(w_c - w_n)))
+            dobj = (info_n.objective - info_c.objective) / max(info_c.objective, 1e-12)
+            worst_w, worst_obj = max(worst_w, dw), max(worst_obj, dobj)
+            if dw > args.weight_tol or dobj > args.obj_tol or info_n.status != "optimal":
+                failures += 1
+                print(f"  FAIL {spec_id}/{label}: max|dw|={dw:.2e} rel_dobj={dobj:.2e} "
+                      f"status={info_n.status} kkt={info_n.kkt_residual:.1e}")
+
+        print(f"{spec_id}: problems={n}  max|dw|={worst_w:.2e}  max rel obj excess={worst_obj:.2e}  "
+              f"cvxpy={t_cvx:.2f}s  native={t_nat:.3f}s")
+
+    if failures:
+        raise SystemExit(f"{failures} problem(s) outside tolerance")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
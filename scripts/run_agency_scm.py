@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import time
+import pandas as pd
+
+# allow imports from src/ and scripts/
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from src.prop47_state.figures import FigureQueue
+from src.prop47_state.panel import PanelCube
+from src.prop47_state.qc import POOLS
+from src.prop47_state.scm import SOLVERS, fit_one, plot_gap, plot_treated_vs_synth
+from run_state_scm import STATE_QC_DEFAULT, dq_exclusions
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Agency-level (ORI) synthetic control: each treated agency against every out-of-state "
+                    "agency complete over the fit window (thousands of donors)."
+    )
+    p.add_argument("--panel", type=str, default="data/processed/agency_month_covered.parquet",
+                   help="Agency-month panel from build_state_panel.py --agency-out")
+    p.add_argument("--treated", nargs="+", required=True, help="Treated ORI(s), fitted one at a time")
+    p.add_argument("--outcome", type=str, default="theft_per_100k_coveredpop")
+    p.add_argument("--t0", type=str, default="2014-11-01")
+    p.add_argument("--pre-start", type=str, default="2010-01-01")
+    p.add_argument("--date-min", type=str, default="2010-01-01")
+    p.add_argument("--fit-end", type=str, default="2019-12-01")
+    p.add_argument("--full-end", type=str, default="2024-12-01")
+    p.add_argument("--dq-excluded", type=str, default=None,
+                   help="States whose agencies never enter the donor pool (overrides --state-qc/--pool)")
+    p.add_argument("--state-qc", type=str, default=STATE_QC_DEFAULT)
+    p.add_argument("--pool", type=str, default="Pool0", choices=list(POOLS))
+    p.add_argument("--include-treated-state", action="store_true",
+                   help="Allow donors from the treated agencies' own state(s) (excluded by default: spillovers)")
+    p.add_argument("--min-population", type=float, default=0.0,
+                   help="Drop donor agencies whose mean population is below this")
+    p.add_argument("--min-donors", type=int, default=5)
+    p.add_argument("--solver", type=str, default="native", choices=list(SOLVERS),
+                   help="native scales to thousands of donors; cvxpy builds a dense problem")
+    p.add_argument("--outdir", type=str, default="outputs/agency")
+    p.add_argument("--no-plots", action="store_true")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    outdir = Path(args.outdir)
+    fig_dir = outdir / "figures"
+    tab_dir = outdir / "tables"
+    fig_dir.mkdir(parents=True, exist_ok=True)
+    tab_dir.mkdir(parents=True, exist_ok=True)
+
+    t = time.perf_counter()
+    df = pd.read_parquet(args.panel, columns=["ori", "state_abb", "date", "population", args.outcome])
+    df["ori"] = df["ori"].astype(str)
+    df["state_abb"] = df["state_abb"].astype(str)
+
+    treated = list(dict.fromkeys(args.treated))
+    oris = set(df["ori"].unique())
+    missing = [o for o in treated if o not in oris]
+    if missing:
+        raise SystemExit(f"Treated ORI(s) not in panel: {missing}")
+
+    # one row per agency: its (last) state and mean population, for donor screening
+    agencies = df.groupby("ori", sort=True).agg(state_abb=("state_abb", "last"), population=("population", "mean"))
+    treated_states = set(agencies.loc[treated, "state_abb"])
+    dq_excluded = dq_exclusions(args.dq_excluded, args.state_qc, args.pool)
+    blocked = dq_excluded | (set() if args.include_treated_state else treated_states)
+    pool = agencies[~agencies["state_abb"].isin(blocked) & (agencies["population"] >= args.min_population)]
+
+    treated_set = set(treated)
+    donors = [d for d in pool.index if d not in treated_set]
+    keep = set(donors) | treated_set
+    cube = PanelCube.from_frame(df[df["ori"].isin(keep)], outcomes=[args.outcome], unit_col="ori")
+    print(f"Loaded {args.panel}: agencies={len(cube.states):,} months={len(cube.dates)} "
+          f"donor pool={len(donors):,} ({time.perf_counter() - t:.1f}s)")
+
+    figures = FigureQueue(enabled=not args.no_plots)
+    rows = []
+    for ori in treated:
+        tr = fit_one(cube, treated=ori, outcome=args.outcome, donors=donors,
+                     pre_start=args.pre_start, t0=args.t0, date_min=args.date_min,
+                     fit_end=args.fit_end, full_end=args.full_end,
+                     min_donors=args.min_donors, solver=args.solver)
+        info = tr.solver_info
+
+        w_out = tr.weights.rename_axis("donor").reset_index(name="weight")
+        w_out["state_abb"] = agencies.loc[w_out["donor"], "state_abb"].to_numpy()
+        w_out.to_csv(tab_dir / f"{ori}_weights.csv", index=False)
+
+        figures.add(plot_treated_vs_synth, fig_dir / f"{ori}_treated_vs_synth.png",
+                    res=tr, title=f"{ori}: treated vs synthetic ({args.outcome})")
+        figures.add(plot_gap, fig_dir / f"{ori}_gap.png",
+                    res=tr, title=f"{ori}: gap (treated - synth) ({args.outcome})")
+
+        rows.append({
+            "treated": ori,
+            "state_abb": agencies.at[ori, "state_abb"],
+            "outcome": args.outcome,
+            "t0": str(tr.t0.date()),
+            "pre_start": str(tr.pre_start.date()),
+            "n_donors_requested": len(tr.donors_requested),
+            "n_donors_complete_pre": len(tr.donors_complete_pre),
+            "n_donors_active": len(tr.donors_active),
+            "pre_rmspe": tr.pre_rmspe,
+            "post1_rmspe": tr.post1_rmspe,
+            "post2_rmspe": tr.post2_rmspe,
+            "ratio_post1": tr.ratio_post1,
+            "ratio_post2": tr.ratio_post2,
+            "avg_gap_post1": tr.avg_gap_post1,
+            "avg_gap_covid": tr.avg_gap_covid,
+            "avg_gap_post2": tr.avg_gap_post2,
+            "solver": info.solver if info else None,
+            "solver_iters": info.n_iter if info else None,
+            "solver_status": tr.solver_status,
+            "fit_seconds": tr.fit_seconds,
+        })
+        print(f"{ori}: donors complete={len(tr.donors_complete_pre):,} active={len(tr.donors_active)} "
+              f"pre_rmspe={tr.pre_rmspe:.3f} ratio_post1={tr.ratio_post1:.3f} ({tr.fit_seconds:.2f}s)")
+
+    summary = pd.DataFrame(rows)
+    summary.to_csv(tab_dir / "agency_summary.csv", index=False)
+    print(f"Wrote: {tab_dir / 'agency_summary.csv'}")
+
+    if not args.no_plots:
+        counts = figures.render()
+        print(f"Figures: rendered={counts['rendered']} unchanged={counts['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import time
+import pandas as pd
+
+# allow imports from src/ and scripts/
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from src.prop47_state.figures import FigureQueue
+from src.prop47_state.qc import POOLS
+from src.prop47_state.scm import SOLVERS, plot_event_time
+from src.prop47_state.staggered import Assignment, cross_fit_matrix, fit_batch
+from src.prop47_state.store import load_panel
+from run_state_scm import STATE_QC_DEFAULT, dq_exclusions
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Fit many treated units at once (staggered adoption, or every state as treated for the "
+                    "N x N cross-fit matrix) against one shared panel; writes a stacked summary and event-time gaps."
+    )
+    p.add_argument("--panel", type=str, default="data/processed/state_month_covered.parquet",
+                   help="Flat panel parquet or a store directory written by build_state_panel.py")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--assignments", type=str,
+                     help="CSV with columns treated, t0 and optionally pre_start and donors (';'-separated)")
+    src.add_argument("--all-treated", action="store_true",
+                     help="Every panel state as treated at --t0, donors all other states (cross-fit matrix)")
+    p.add_argument("--t0", type=str, default="2014-11-01", help="t0 for --all-treated")
+    p.add_argument("--outcome", type=str, default="theft_per_100k_coveredpop")
+    p.add_argument("--pre-start", type=str, default="2010-01-01", help="Default pre_start for every assignment")
+    p.add_argument("--date-min", type=str, default="2010-01-01")
+    p.add_argument("--fit-end", type=str, default="2019-12-01")
+    p.add_argument("--full-end", type=str, default="2024-12-01")
+    p.add_argument("--keep-treated-donors", action="store_true",
+                   help="Do not drop other treated units from each donor pool (implied by --all-treated)")
+    p.add_argument("--min-donors", type=int, default=5)
+    p.add_argument("--solver", type=str, default="native", choices=list(SOLVERS))
+    p.add_argument("--jobs", type=int, default=1, help="Worker processes (assignments are chunked per window)")
+    p.add_argument("--dq-excluded", type=str, default=None,
+                   help="Comma list of states kept out of the panel (overrides --state-qc/--pool)")
+    p.add_argument("--state-qc", type=str, default=STATE_QC_DEFAULT)
+    p.add_argument("--pool", type=str, default="Pool0", choices=list(POOLS))
+    p.add_argument("--outdir", type=str, default="outputs/batch")
+    p.add_argument("--no-plots", action="store_true")
+    return p.parse_args()
+
+
+def read_assignments(path: str) -> list:
+    a = pd.read_csv(path, dtype=str).fillna("")
+    missing = {"treated", "t0"} - set(a.columns)
+    if missing:
+        raise SystemExit(f"{path}: missing column(s) {sorted(missing)}")
+    return [
+        Assignment(
+            treated=r["treated"].strip(), t0=r["t0"],
+            donors=tuple(d.strip() for d in r["donors"].split(";") if d.strip()) if r.get("donors") else None,
+            pre_start=r["pre_start"] if r.get("pre_start") else None,
+        )
+        for r in a.to_dict(orient="records")
+    ]
+
+
+def main() -> None:
+    args = parse_args()
+    outdir = Path(args.outdir)
+    fig_dir = outdir / "figures"
+    tab_dir = outdir / "tables"
+    fig_dir.mkdir(parents=True, exist_ok=True)
+    tab_dir.mkdir(parents=True, exist_ok=True)
+
+    assignments = None if args.all_treated else read_assignments(args.assignments)
+    keep = [] if assignments is None else [a.treated for a in assignments]
+    dq_excluded = dq_exclusions(args.dq_excluded, args.state_qc, args.pool) - set(keep)
+    cube = load_panel(args.panel, outcomes=[args.outcome], exclude_states=dq_excluded,
+                      date_min=args.date_min, date_max=args.full_end)
+    if assignments is None:
+        assignments = [Assignment(s, args.t0) for s in cube.states]
+    missing = sorted({a.treated for a in assignments} - set(cube.states))
+    if missing:
+        raise SystemExit(f"Treated unit(s) not in panel: {missing}")
+
+    t = time.perf_counter()
+    batch = fit_batch(cube, assignments, args.outcome, pre_start=args.pre_start, date_min=args.date_min,
+                      fit_end=args.fit_end, full_end=args.full_end, min_donors=args.min_donors,
+                      solver=args.solver, exclude_treated=not (args.all_treated or args.keep_treated_donors),
+                      jobs=args.jobs)
+    n_err = int(batch.summary["error"].notna().sum())
+    print(f"Fitted {len(assignments)} treated units ({n_err} failed) in {time.perf_counter() - t:.2f}s")
+
+    batch.summary.to_csv(tab_dir / "batch_summary.csv", index=False)
+    batch.weights.to_csv(tab_dir / "batch_weights.csv", index=False)
+    batch.gaps.to_csv(tab_dir / "batch_gaps.csv", index=False)
+    batch.event_time.to_csv(tab_dir / "event_time_gaps.csv", index=False)
+    cross_fit_matrix(batch.weights).to_csv(tab_dir / "cross_fit_weights.csv")
+    print(f"Wrote: {tab_dir}/batch_summary.csv, batch_weights.csv, batch_gaps.csv, "
+          f"event_time_gaps.csv, cross_fit_weights.csv")
+
+    if not args.no_plots and not batch.event_time.empty:
+        figures = FigureQueue()
+        figures.add(plot_event_time, fig_dir / "event_time_gaps.png", event_time=batch.event_time,
+                    title=f"Mean gap by months since t0 ({len(assignments) - n_err} units, {args.outcome})")
+        counts = figures.render()
+        print(f"Figures: rendered={counts['rendered']} unchanged={counts['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
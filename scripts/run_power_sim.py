@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+
+# allow imports from src/ and scripts/
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from src.prop47_state.qc import POOLS
+from src.prop47_state.scm import SOLVERS
+from src.prop47_state.simulate import EFFECT_SHAPES, SimConfig, rejection_rates, run_simulation
+from src.prop47_state.store import load_panel
+from run_state_scm import STATE_QC_DEFAULT, dq_exclusions
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Monte Carlo power and size of the in-space placebo test: inject known effects into the "
+                    "treated outcome after t0, refit, and report rejection rates by effect size and pre-RMSPE "
+                    "multiplier. Results stream to OUTDIR/reps; rerun the same command to resume or extend."
+    )
+    p.add_argument("--panel", type=str, default="data/processed/state_month_covered.parquet",
+                   help="Flat panel parquet or a store directory written by build_state_panel.py")
+    p.add_argument("--outdir", type=str, default="outputs/power")
+    p.add_argument("--reps", type=int, default=1000, help="Replications (raise it on a finished study to extend it)")
+    p.add_argument("--jobs", type=int, default=1, help="Worker processes (batches of --batch-size replications)")
+    p.add_argument("--batch-size", type=int, default=50, help="Replications per task and per streamed part file (free to change when resuming)")
+    p.add_argument("--seed", type=int, default=47)
+    p.add_argument("--outcome", type=str, default="theft_per_100k_coveredpop")
+    p.add_argument("--treated", type=str, default="CA",
+                   help="State that receives the injected effect, or 'random' for a uniform draw per replication "
+                        "(placebo-in-placebo: the effect-0 rows are then the test's size)")
+    p.add_argument("--exclude", type=str, default=None,
+                   help="Comma list of states that are neither drawn nor donors (default with --treated random: CA)")
+    p.add_argument("--t0", nargs="+", type=str, default=["2014-11-01"], help="t0 per replication, drawn uniformly")
+    p.add_argument("--pre-start", type=str, default="2010-01-01")
+    p.add_argument("--date-min", type=str, default="2010-01-01")
+    p.add_argument("--fit-end", type=str, default="2019-12-01")
+    p.add_argument("--full-end", type=str, default="2024-12-01")
+    p.add_argument("--effects", nargs="+", type=float, default=[0.0, 0.05, 0.10, 0.20],
+                   help="Effect sizes: fractions of the treated pre-period mean (or outcome units with --absolute)")
+    p.add_argument("--absolute", action="store_true", help="Effects are in outcome units")
+    p.add_argument("--shape", type=str, default="step", choices=list(EFFECT_SHAPES))
+    p.add_argument("--ramp-months", type=int, default=12)
+    p.add_argument("--noise-scale", type=float, default=0.0,
+                   help="Post-t0 noise sd as a multiple of the treated pre-RMSPE (0 = none). Placebos get no "
+                        "noise, so > 0 inflates the effect-0 rejection rate")
+    p.add_argument("--pre-mults", nargs="+", type=float, default=[2.0, 1.5])
+    p.add_argument("--alphas", nargs="+", type=float, default=[0.05, 0.10])
+    p.add_argument("--min-donors", type=int, default=5)
+    p.add_argument("--solver", type=str, default="native", choices=list(SOLVERS))
+    p.add_argument("--dq-excluded", type=str, default=None,
+                   help="Comma list of states kept out of the panel (overrides --state-qc/--pool)")
+    p.add_argument("--state-qc", type=str, default=STATE_QC_DEFAULT)
+    p.add_argument("--pool", type=str, default="Pool0", choices=list(POOLS))
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    outdir = Path(args.outdir)
+    treated = None if args.treated == "random" else args.treated
+    if args.exclude is not None:
+        exclude = [s.strip() for s in args.exclude.split(",") if s.strip()]
+    else:
+        exclude = ["CA"] if treated is None else []
+
+    dq_excluded = dq_exclusions(args.dq_excluded, args.state_qc, args.pool, treated=treated)
+    cube = load_panel(args.panel, outcomes=[args.outcome], exclude_states=dq_excluded,
+                      date_min=args.date_min, date_max=args.full_end)
+
+    cfg = SimConfig(
+        outcome=args.outcome, treated=treated, exclude=tuple(exclude), t0s=tuple(args.t0),
+        pre_start=args.pre_start, date_min=args.date_min, fit_end=args.fit_end, full_end=args.full_end,
+        effects=tuple(args.effects), relative=not args.absolute, shape=args.shape, ramp_months=args.ramp_months,
+        noise_scale=args.noise_scale, mults=tuple(args.pre_mults), min_donors=args.min_donors,
+        solver=args.solver, seed=args.seed, batch_size=args.batch_size,
+    )
+    if treated is not None:
+        print(f"WARNING: effects are injected on top of {treated}'s real post-t0 data, so the effect-0 rows are "
+              f"{treated}'s actual rejection rate, not the test's size (use --treated random for size)")
+    if cfg.noise_scale > 0:
+        print("WARNING: --noise-scale > 0 adds noise to the treated series only, which inflates the "
+              "effect-0 rejection rate")
+    results = run_simulation(cube, cfg, args.reps, outdir, jobs=args.jobs)
+
+    summary = rejection_rates(results[results["rep"] < args.reps], alphas=args.alphas)
+    summary.to_csv(outdir / "power_summary.csv", index=False)
+    print(f"Wrote: {outdir / 'power_summary.csv'}")
+    print(summary.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
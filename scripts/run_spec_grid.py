@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import pandas as pd
+
+# allow imports from src/ and scripts/
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from src.prop47_state.cache import DEFAULT_MAX_BYTES, FitCache
+from src.prop47_state.figures import FigureQueue
+from src.prop47_state.grid import expand_grid, load_grid, run_fits, schedule
+from src.prop47_state.report import write_loo_outputs, write_spec_outputs
+from src.prop47_state.robustness import leave_one_out
+from src.prop47_state.store import load_panel
+from run_state_scm import STATE_QC_DEFAULT, dq_exclusions
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Run a declarative robustness grid (TOML, or YAML with PyYAML).")
+    p.add_argument("--grid", type=str, default="configs/robustness_grid.toml")
+    p.add_argument("--panel", type=str, default="data/processed/state_month_covered.parquet",
+                   help="Flat panel parquet or a store directory written by build_state_panel.py")
+    p.add_argument("--state-qc", type=str, default=STATE_QC_DEFAULT,
+                   help="state_qc table each pool takes its exclusions from (unless the pool lists exclude, "
+                        "or defaults.dq_excluded is set)")
+    p.add_argument("--outdir", type=str, default="outputs/grid")
+    p.add_argument("--jobs", type=int, default=1, help="Worker processes for fit and placebo tasks")
+    p.add_argument("--verbose-placebos", action="store_true")
+    p.add_argument("--no-loo", action="store_true",
+                   help="Skip the leave-one-out donor refits (on by default; see defaults.leave_one_out)")
+    p.add_argument("--no-plots", action="store_true", help="Write tables only; skip every figure")
+    p.add_argument("--force-plots", action="store_true",
+                   help="Re-render every figure, even those whose inputs are unchanged")
+    p.add_argument("--cache-dir", type=str, default="data/cache/fits",
+                   help="On-disk cache of treated fits and placebo tables (shared with run_state_scm.py)")
+    p.add_argument("--cache", action=argparse.BooleanOptionalAction, default=False,
+                   help="Read and write the fit cache (off by default: every run refits)")
+    p.add_argument("--refresh-cache", action="store_true", help="Fit everything and overwrite the cache entries")
+    p.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / 2**20)
+    p.add_argument("--dry-run", action="store_true", help="Print the expanded specs and fit tasks, then exit")
+    return p.parse_args()
+
+
+def resolve_pools(cfg: dict, state_qc: str) -> None:
+    """
+    Fill in each pool's exclude list: the pool's own list in the grid if it
+    has one, else defaults.dq_excluded if set, else the same-named pool of
+    the state_qc table (see dq_exclusions).
+    """
+    explicit = cfg["defaults"].get("dq_excluded")
+    for name, pool in cfg["pools"].items():
+        if pool.get("exclude") is None:
+            pool["exclude"] = sorted(dq_exclusions(",".join(explicit) if explicit is not None else None, state_qc,
+                                                   name, treated=cfg["defaults"]["treated"]))
+
+
+def main() -> None:
+    args = parse_args()
+    cfg = load_grid(args.grid)
+    specs = expand_grid(cfg)
+    groups = schedule(specs)
+    print(f"Grid {args.grid}: {len(specs)} specs -> {len(groups)} unique fit tasks")
+    if args.dry_run:
+        for key, members in groups.items():
+            print(f"  {key[0]} {key[1]} t0={key[2].date()} pre={key[3].date()}: {[s.spec_id for s in members]}")
+        return
+
+    outdir = Path(args.outdir)
+    fig_dir = outdir / "figures"
+    tab_dir = outdir / "tables"
+    fig_dir.mkdir(parents=True, exist_ok=True)
+    tab_dir.mkdir(parents=True, exist_ok=True)
+
+    # the panel keeps every state some pool in use still admits; pool_donors drops the rest
+    resolve_pools(cfg, args.state_qc)
+    dq_excluded = set.intersection(*(set(cfg["pools"][p]["exclude"]) for p in sorted({s.pool for s in specs})))
+    outcomes = sorted({s.outcome for s in specs})
+    cube = load_panel(args.panel, outcomes=outcomes, exclude_states=dq_excluded,
+                      date_min=cfg["defaults"]["date_min"], date_max=cfg["defaults"]["full_end"])
+
+    cache = FitCache(args.cache_dir if args.cache or args.refresh_cache else None, max_bytes=int(args.cache_max_mb * 2**20),
+                     read=not args.refresh_cache)
+    results = run_fits(cube, cfg, groups, jobs=args.jobs, verbose=args.verbose_placebos, cache=cache)
+    if cache.enabled:
+        print(cache.report())
+
+    # leave-one-out donor refits: once per fit task, written for every spec that shares it
+    loo = {}
+    if cfg["defaults"]["leave_one_out"] and not args.no_loo:
+        loo = {key: leave_one_out(cube, tr, min_donors=cfg["defaults"]["min_donors"]) for key, (tr, _) in results.items()}
+
+    all_rows = []
+    figures = FigureQueue(enabled=not args.no_plots)
+    for spec in specs:
+        tr, pl_all = results[spec.fit_key]
+        if spec.fit_key in loo:
+            write_loo_outputs(spec.spec_id, tr, loo[spec.fit_key], fig_dir, tab_dir, figures=figures)
+        for row in write_spec_outputs(spec.spec_id, tr, pl_all, list(spec.mults), fig_dir, tab_dir,
+                                      figures=figures):
+            row["pool"] = spec.pool
+            row["covid_rmspe"] = tr.covid_rmspe
+            all_rows.append(row)
+
+    summary = pd.DataFrame(all_rows)
+    front = ["spec_id", "pool", "outcome"]
+    summary = summary[front + [c for c in summary.columns if c not in front]]
+    out = tab_dir / cfg["defaults"]["summary"]
+    summary.to_csv(out, index=False)
+    print(f"Wrote: {out}  specs={len(specs)}  rows={len(summary)}")
+
+    if not args.no_plots:
+        counts = figures.render(jobs=args.jobs, force=args.force_plots)
+        print(f"Figures: rendered={counts['rendered']} unchanged={counts['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
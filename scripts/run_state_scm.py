@@ -3,17 +3,25 @@ from __future__ import annotations
 import argparse
 from pathlib import Path
 import sys
+from typing import Optional, Set
+import numpy as np
 import pandas as pd
 
 # allow imports from src/
 REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.append(str(REPO_ROOT))
 
-from src.prop47_state.scm import (
-    fit_one, placebo_loop,
-    plot_treated_vs_synth, plot_gap, plot_placebo_hist,
-    mstart, normalize_panel_df
-)
+from src.prop47_state.scm import plot_conformal_curve, plot_in_time_placebos
+from src.prop47_state.inference import conformal_inference, in_time_placebos
+from src.prop47_state.cache import DEFAULT_MAX_BYTES, FitCache
+from src.prop47_state.figures import FigureQueue
+from src.prop47_state.profiling import RunLog
+from src.prop47_state.qc import POOLS, fallback_exclusions, pool_exclusions, read_state_qc
+from src.prop47_state.parallel import SharedPanel, parallel_fits, parallel_placebos
+from src.prop47_state.penalized import PENALTIES, PenaltySpec
+from src.prop47_state.report import write_loo_outputs, write_spec_outputs
+from src.prop47_state.robustness import leave_one_out
+from src.prop47_state.store import load_panel
 
 DEFAULT_SPECS = [
     ("S0", "theft_per_100k_coveredpop", "2014-11-01", "2010-01-01"),
@@ -22,12 +30,31 @@ DEFAULT_SPECS = [
     ("N0", "violent_per_100k_coveredpop", "2014-11-01", "2010-01-01"),
 ]
 
-DQ_DEFAULT = {"AR","HI","IN","MI","MS","MT","NE","NH","NY","OH","PA","SD","UT","WV","OR","CZ","PR","GU"}
+STATE_QC_DEFAULT = "data/processed/state_qc.parquet"
+
+
+def dq_exclusions(dq_excluded: Optional[str], state_qc: Optional[str], pool: str = "Pool0",
+                  treated: Optional[str] = None) -> Set[str]:
+    """
+    States kept out of the panel: an explicit comma list wins; otherwise the
+    pool's exclusions from the state_qc table written by build_state_panel.py;
+    otherwise the pool's FALLBACK_EXCLUSIONS.
+    """
+    if dq_excluded is not None:
+        return {s.strip() for s in dq_excluded.split(",") if s.strip()}
+    if state_qc and Path(state_qc).exists():
+        excluded = pool_exclusions(read_state_qc(state_qc), pool, keep=[treated] if treated else [])
+        print(f"Donor pool {pool} from {state_qc}: excluding {sorted(excluded)}")
+        return excluded
+    excluded = fallback_exclusions(pool, keep=[treated] if treated else [])
+    print(f"No state_qc table at {state_qc}; donor pool {pool} from FALLBACK_EXCLUSIONS: excluding {sorted(excluded)}")
+    return excluded
 
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser()
-    p.add_argument("--panel", type=str, default="data/processed/state_month_covered.parquet")
+    p.add_argument("--panel", type=str, default="data/processed/state_month_covered.parquet",
+                   help="Flat panel parquet or a store directory written by build_state_panel.py")
     p.add_argument("--outdir", type=str, default="outputs")
     p.add_argument("--treated", type=str, default="CA")
     p.add_argument("--date-min", type=str, default="2010-01-01")
@@ -35,8 +62,49 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--full-end", type=str, default="2024-12-01")
     p.add_argument("--pre-mults", nargs="+", type=float, default=[2.0, 1.5])
     p.add_argument("--min-donors", type=int, default=5)
-    p.add_argument("--dq-excluded", type=str, default=",".join(sorted(DQ_DEFAULT)))
+    p.add_argument("--dq-excluded", type=str, default=None,
+                   help="Comma list of states to exclude (overrides --state-qc/--pool)")
+    p.add_argument("--state-qc", type=str, default=STATE_QC_DEFAULT,
+                   help="state_qc table from build_state_panel.py; donor pool exclusions come from it")
+    p.add_argument("--pool", type=str, default="Pool0", choices=list(POOLS),
+                   help="Pool0: coverage screens; Pool1: Pool0 minus |corr(coverage, theft)| > 0.5 states")
     p.add_argument("--verbose-placebos", action="store_true")
+    p.add_argument("--solver", type=str, default="cvxpy", choices=["cvxpy", "native"],
+                   help="SCM weight solver: cvxpy (OSQP/SCS) or the built-in active-set solver")
+    p.add_argument("--penalty", type=str, default=None, choices=list(PENALTIES),
+                   help="Penalized SCM (ridge, Abadie-L'Hour pairwise, or ridge-augmented); the treated fit, "
+                        "its placebos and --loo refits all use it")
+    p.add_argument("--penalty-lambda", type=float, default=None,
+                   help="Fixed penalty; default picks it along the path by rolling-origin CV on the pre-period")
+    p.add_argument("--cv-folds", type=int, default=5, help="Rolling-origin CV origins for --penalty")
+    p.add_argument("--cv-horizon", type=int, default=6, help="Months scored after each CV origin")
+    p.add_argument("--jobs", type=int, default=1,
+                   help="Worker processes for spec and placebo fits (1 = serial, in-process)")
+    p.add_argument("--pval-curve", nargs=3, type=float, metavar=("START", "STOP", "STEP"), default=None,
+                   help="Also write each spec's p-value vs pre-RMSPE multiplier curve over START..STOP (inclusive)")
+    p.add_argument("--in-time", action="store_true",
+                   help="Also sweep a fake t0 across each spec's pre-period (in-time placebos)")
+    p.add_argument("--in-time-min-pre", type=int, default=12, help="Shortest fake pre-period (months)")
+    p.add_argument("--conformal", action="store_true",
+                   help="Also run conformal permutation inference for the post1/covid/post2 average effects")
+    p.add_argument("--conformal-perms", type=int, default=5000, help="iid permutations per null (block uses all shifts)")
+    p.add_argument("--conformal-alpha", type=float, default=0.1, help="Confidence sets are {theta : p > alpha}")
+    p.add_argument("--loo", action="store_true",
+                   help="Also refit each spec dropping one active donor at a time (leave-one-out)")
+    p.add_argument("--no-plots", action="store_true", help="Write tables only; skip every figure")
+    p.add_argument("--plot-jobs", type=int, default=None,
+                   help="Worker processes for the figure stage (default: --jobs)")
+    p.add_argument("--force-plots", action="store_true",
+                   help="Re-render every figure, even those whose inputs are unchanged")
+    p.add_argument("--cache-dir", type=str, default="data/cache/fits",
+                   help="On-disk cache of treated fits and placebo tables, reused while panel slice and spec are unchanged")
+    p.add_argument("--cache", action=argparse.BooleanOptionalAction, default=False,
+                   help="Read and write the fit cache (off by default: every run refits)")
+    p.add_argument("--refresh-cache", action="store_true", help="Fit everything and overwrite the cache entries")
+    p.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / 2**20,
+                   help="Least recently used entries are evicted above this size")
+    p.add_argument("--profile", action="store_true",
+                   help="Time each stage and fit, record solver diagnostics and placebo failures in tables/run_log.jsonl")
     return p.parse_args()
 
 
@@ -49,95 +117,122 @@ def main() -> None:
     fig_dir.mkdir(parents=True, exist_ok=True)
     tab_dir.mkdir(parents=True, exist_ok=True)
 
-    dq_excluded = {s.strip() for s in args.dq_excluded.split(",") if s.strip()}
-
-    df = pd.read_parquet(panel_path)
-    df = normalize_panel_df(df)
-    df = df[~df["state_abb"].isin(dq_excluded)].copy()
+    dq_excluded = dq_exclusions(args.dq_excluded, args.state_qc, args.pool, treated=args.treated)
+    log = RunLog(enabled=args.profile)
+    log.add("run", argv=sys.argv[1:], solver=args.solver, jobs=args.jobs)
 
     treated = args.treated
     date_min = args.date_min
     fit_end = args.fit_end
     full_end = args.full_end
 
-    all_rows = []
+    # load once, restricted to non-DQ states and [date_min, full_end] at read
+    # time; every fit below slices this cube
+    with log.stage("load_panel"):
+        panel = load_panel(panel_path, outcomes=sorted({o for _, o, _, _ in DEFAULT_SPECS}),
+                           exclude_states=dq_excluded, date_min=date_min, date_max=full_end)
+
+    donors = [s for s in panel.states if s != treated]
+    penalty = None
+    if args.penalty is not None:
+        penalty = PenaltySpec(args.penalty, lam=args.penalty_lambda,
+                              cv_folds=args.cv_folds, cv_horizon=args.cv_horizon)
+    fit_kwargs = [
+        dict(treated=treated, outcome=outcome, donors=donors,
+             pre_start=pre_start, t0=t0, date_min=date_min, fit_end=fit_end, full_end=full_end,
+             min_donors=args.min_donors, solver=args.solver, penalty=penalty)
+        for _, outcome, t0, pre_start in DEFAULT_SPECS
+    ]
+
+    # fit treated + placebos once per spec; with --jobs the placebos of every spec share one pool
+    spec_ids = [spec_id for spec_id, _, _, _ in DEFAULT_SPECS]
+    placebo_logs = [] if args.profile else None
+    cache = FitCache(args.cache_dir if args.cache or args.refresh_cache else None, max_bytes=int(args.cache_max_mb * 2**20),
+                     read=not args.refresh_cache)
+    if args.jobs > 1:
+        with SharedPanel(panel) as shared, shared.pool(args.jobs) as ex:
+            with log.stage("fits"):
+                fits = cache.fits(panel, fit_kwargs, run=lambda kws: parallel_fits(ex, kws))
+            with log.stage("placebos"):
+                placebos = cache.placebos(
+                    panel, fits, [tr.donors_complete_pre for tr in fits], args.min_donors, args.solver,
+                    run=lambda fs, ds, logs: parallel_placebos(
+                        ex, fs, ds, min_donors=args.min_donors, solver=args.solver,
+                        verbose=args.verbose_placebos, logs=logs,
+                    ),
+                    logs=placebo_logs,
+                )
+    else:
+        fits, placebos = [], []
+        for spec_id, kw in zip(spec_ids, fit_kwargs):
+            with log.stage("fits", spec_id=spec_id):
+                tr = cache.fit_one(panel, **kw)
+            events = [] if args.profile else None
+            with log.stage("placebos", spec_id=spec_id):
+                pl_all = cache.placebo_fits(panel, treated_res=tr, donors_base=tr.donors_complete_pre,
+                                            min_donors=args.min_donors, verbose=args.verbose_placebos,
+                                            solver=args.solver, log=events)
+            fits.append(tr)
+            placebos.append(pl_all)
+            if events is not None:
+                placebo_logs.append(events)
+    if cache.enabled:
+        print(cache.report())
+        log.add("cache", **cache.stats())
+
+    for spec_id, tr in zip(spec_ids, fits):
+        log.fit(tr, spec_id=spec_id, role="treated")
+    for spec_id, events in zip(spec_ids, placebo_logs or []):
+        log.extend(events, spec_id=spec_id)
+
+    curve_mults = []
+    if args.pval_curve is not None:
+        start, stop, step = args.pval_curve
+        curve_mults = np.round(np.arange(start, stop + step / 2, step), 10).tolist()
 
-    for spec_id, outcome, t0, pre_start in DEFAULT_SPECS:
-        donors = sorted([s for s in df["state_abb"].unique() if s != treated])
-
-        # fit treated once
-        tr = fit_one(
-            df, treated=treated, outcome=outcome, donors=donors,
-            pre_start=pre_start, t0=t0, date_min=date_min, fit_end=fit_end, full_end=full_end,
-            min_donors=args.min_donors,
-        )
-
-        # save plots
-        plot_treated_vs_synth(tr, fig_dir / f"{spec_id}_treated_vs_synth.png",
-                              title=f"{spec_id}: {treated} vs Synthetic ({outcome})")
-        plot_gap(tr, fig_dir / f"{spec_id}_gap.png",
-                 title=f"{spec_id}: Gap ({treated} - Synth) ({outcome})")
-
-        # save weights
-        w_out = tr.weights.sort_values(ascending=False).reset_index()
-        w_out.columns = ["donor", "weight"]
-        w_out.to_csv(tab_dir / f"{spec_id}_weights.csv", index=False)
-
-        # placebo runs for each mult
-        for m in args.pre_mults:
-            pl_all, pl_filt, p1, p2 = placebo_loop(
-                df, treated_res=tr, donors_base=tr.donors_complete_pre,
-                pre_rmspe_mult=m, min_donors=args.min_donors, verbose=args.verbose_placebos
-            )
-
-            pl_all.to_csv(tab_dir / f"{spec_id}_placebos_all_m{m}.csv", index=False)
-            pl_filt.to_csv(tab_dir / f"{spec_id}_placebos_filt_m{m}.csv", index=False)
-
-            # placebo hists
-            if len(pl_filt) > 0:
-                plot_placebo_hist(pl_filt, tr.ratio_post1, "ratio_post1",
-                                  fig_dir / f"{spec_id}_hist_ratio_post1_m{m}.png",
-                                  title=f"{spec_id} ratio_post1 (m={m}) p={p1:.3f}")
-                plot_placebo_hist(pl_filt, tr.ratio_post2, "ratio_post2",
-                                  fig_dir / f"{spec_id}_hist_ratio_post2_m{m}.png",
-                                  title=f"{spec_id} ratio_post2 (m={m}) p={p2:.3f}")
-
-            all_rows.append({
-                "spec_id": f"{spec_id}_m{m}",
-                "outcome": outcome,
-                "t0": str(mstart(t0).date()),
-                "pre_start": str(mstart(pre_start).date()),
-                "date_min": str(mstart(date_min).date()),
-                "fit_end": str(mstart(fit_end).date()),
-                "full_end": str(mstart(full_end).date()),
-                "n_donors_requested": len(donors),
-                "n_donors_complete_pre": len(tr.donors_complete_pre),
-                "n_donors_active": len(tr.donors_active),
-                "pre_rmspe": tr.pre_rmspe,
-                "post1_rmspe": tr.post1_rmspe,
-                "post2_rmspe": tr.post2_rmspe,
-                "ratio_post1": tr.ratio_post1,
-                "ratio_post2": tr.ratio_post2,
-                "avg_gap_post1": tr.avg_gap_post1,
-                "avg_gap_covid": tr.avg_gap_covid,
-                "avg_gap_post2": tr.avg_gap_post2,
-                "n_months_pre": tr.n_pre,
-                "n_months_post1": tr.n_post1,
-                "n_months_covid": tr.n_covid,
-                "n_months_post2": tr.n_post2,
-                "n_placebos": len(pl_all),
-                "n_placebos_filtered": len(pl_filt),
-                "pre_rmspe_mult": float(m),
-                "pval_ratio_post1": p1,
-                "pval_ratio_post2": p2,
-                "solver_status": tr.solver_status,
-            })
+    all_rows = []
+    figures = FigureQueue(enabled=not args.no_plots)
+
+    for (spec_id, _, _, _), tr, pl_all in zip(DEFAULT_SPECS, fits, placebos):
+        all_rows.extend(write_spec_outputs(spec_id, tr, pl_all, args.pre_mults, fig_dir, tab_dir,
+                                           curve_mults=curve_mults, log=log, figures=figures))
+
+        if args.loo:
+            with log.stage("loo", spec_id=spec_id):
+                loo = leave_one_out(panel, tr, min_donors=args.min_donors)
+            write_loo_outputs(spec_id, tr, loo, fig_dir, tab_dir, figures=figures)
+
+        if args.conformal:
+            with log.stage("conformal", spec_id=spec_id):
+                conf, conf_curve = conformal_inference(panel, tr, n_perms=args.conformal_perms, alpha=args.conformal_alpha)
+            conf.to_csv(tab_dir / f"{spec_id}_conformal.csv", index=False)
+            conf_curve.to_csv(tab_dir / f"{spec_id}_conformal_curve.csv", index=False)
+            figures.add(plot_conformal_curve, fig_dir / f"{spec_id}_conformal_curve.png",
+                        curve=conf_curve, alpha=args.conformal_alpha,
+                        title=f"{spec_id}: conformal p-value vs effect ({tr.treated}, {tr.outcome})")
+
+        if args.in_time:
+            with log.stage("in_time", spec_id=spec_id):
+                sweep = in_time_placebos(panel, tr, min_pre=args.in_time_min_pre)
+            sweep.to_csv(tab_dir / f"{spec_id}_in_time_placebos.csv", index=False)
+            figures.add(plot_in_time_placebos, fig_dir / f"{spec_id}_in_time_placebos.png",
+                        sweep=sweep, title=f"{spec_id}: in-time placebos ({tr.treated}, {tr.outcome})")
 
     summary = pd.DataFrame(all_rows)
     summary.to_csv(tab_dir / "all_specs_summary.csv", index=False)
     print(f"Wrote: {tab_dir / 'all_specs_summary.csv'}")
     print(summary)
 
+    if not args.no_plots:
+        with log.stage("render_figures", figures=len(figures)):
+            counts = figures.render(jobs=args.plot_jobs or args.jobs, force=args.force_plots)
+        print(f"Figures: rendered={counts['rendered']} unchanged={counts['skipped']}")
+
+    if args.profile:
+        log.write(tab_dir / "run_log.jsonl")
+        print(f"Wrote: {tab_dir / 'run_log.jsonl'}")
+        print(log.stage_totals().to_string(index=False))
+
 
 if __name__ == "__main__":
     main()
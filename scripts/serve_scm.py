@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import signal
+import sys
+import time
+
+# allow imports from src/ and scripts/
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from src.prop47_state.cache import DEFAULT_MAX_BYTES, FitCache
+from src.prop47_state.qc import POOLS
+from src.prop47_state.scm import SOLVERS
+from src.prop47_state.server import DEFAULTS, SCMService, make_server
+from src.prop47_state.store import load_panel
+from run_state_scm import STATE_QC_DEFAULT, dq_exclusions
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Load the panel once and answer fit / placebo / p-value queries as JSON over local HTTP "
+                    "(or a Unix socket). Query from a notebook with src.prop47_state.client.SCMClient."
+    )
+    p.add_argument("--panel", type=str, default="data/processed/state_month_covered.parquet",
+                   help="Flat panel parquet or a store directory written by build_state_panel.py")
+    p.add_argument("--host", type=str, default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8747)
+    p.add_argument("--socket", type=str, default=None, help="Serve on this Unix socket instead of host:port")
+    p.add_argument("--treated", type=str, default=DEFAULTS["treated"])
+    p.add_argument("--date-min", type=str, default=DEFAULTS["date_min"])
+    p.add_argument("--full-end", type=str, default=DEFAULTS["full_end"])
+    p.add_argument("--min-donors", type=int, default=DEFAULTS["min_donors"])
+    p.add_argument("--solver", type=str, default=DEFAULTS["solver"], choices=list(SOLVERS),
+                   help="Default solver for queries that do not set one")
+    p.add_argument("--dq-excluded", type=str, default=None,
+                   help="Comma list of states kept out of the loaded panel (overrides --state-qc/--pool)")
+    p.add_argument("--state-qc", type=str, default=STATE_QC_DEFAULT)
+    p.add_argument("--pool", type=str, default="Pool0", choices=list(POOLS))
+    p.add_argument("--lru-size", type=int, default=256, help="Treated fits (and placebo tables) kept in memory")
+    p.add_argument("--jobs", type=int, default=1, help="Worker processes for placebo solves (1 = in the request thread)")
+    p.add_argument("--cache-dir", type=str, default="data/cache/fits",
+                   help="On-disk fit cache shared with run_state_scm.py / run_spec_grid.py")
+    p.add_argument("--cache", action=argparse.BooleanOptionalAction, default=False,
+                   help="Also read and write the disk cache (off by default: memory LRU only)")
+    p.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / 2**20)
+    p.add_argument("--verbose", action="store_true", help="Log every request")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    t = time.perf_counter()
+    dq_excluded = dq_exclusions(args.dq_excluded, args.state_qc, args.pool, treated=args.treated)
+    cube = load_panel(args.panel, exclude_states=dq_excluded, date_min=args.date_min, date_max=args.full_end)
+    defaults = {"treated": args.treated, "date_min": args.date_min, "full_end": args.full_end,
+                "min_donors": args.min_donors, "solver": args.solver}
+    cache = FitCache(args.cache_dir if args.cache else None, max_bytes=int(args.cache_max_mb * 2**20))
+    service = SCMService(cube, defaults=defaults, lru_size=args.lru_size, cache=cache, jobs=args.jobs)
+    server = make_server(service, host=args.host, port=args.port, socket_path=args.socket, verbose=args.verbose)
+
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"Loaded {args.panel}: units={len(cube.states)} months={len(cube.dates)} outcomes={cube.outcomes} "
+          f"({time.perf_counter() - t:.1f}s)")
+    print(f"Serving SCM queries on {where} (Ctrl-C to stop)")
+    # SIGTERM shuts down like Ctrl-C, so the placebo pool's workers are reaped
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
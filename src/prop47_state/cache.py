@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+from dataclasses import asdict, fields
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .hashing import update_hash
+from .panel import PanelCube, mstart
+from .penalized import PenaltyPath, PenaltySpec, as_penalty
+from .scm import FitResult, fit_one, placebo_fits
+from .simplex import SolverInfo
+
+
+# Bump whenever fitting code changes its results, so entries written by older
+# code are never returned.
+CACHE_VERSION = "2"
+DEFAULT_MAX_BYTES = 512 * 2**20
+
+_WINDOW = ("t0", "pre_start", "date_min", "fit_end", "full_end")
+_FIT_SIGNATURE = inspect.signature(fit_one)
+
+
+# -----------------------------
+# Keys
+# -----------------------------
+
+def _penalty_key(spec: Optional[PenaltySpec]) -> Optional[Dict[str, Any]]:
+    return asdict(spec) if spec is not None else None
+
+
+def _slice_digest(h, cube: PanelCube, states: Sequence[str], outcome: str, date_min, full_end) -> None:
+    """Hash the exact panel slice a fit reads: build_wide's dates, columns and values."""
+    dates, cols, M = cube.wide(list(states), outcome, mstart(date_min), mstart(full_end))
+    update_hash(h, [dates, cols, np.ascontiguousarray(M)])
+
+
+def fit_key(cube: PanelCube, kwargs: Dict[str, Any]) -> str:
+    """Key of fit_one(cube, **kwargs): panel slice, outcome, donors, window, min_donors, solver, penalty."""
+    bound = _FIT_SIGNATURE.bind(None, **kwargs)
+    bound.apply_defaults()
+    a = dict(bound.arguments)
+    a.pop("df")
+    window = [str(mstart(a[k]).date()) for k in _WINDOW]
+
+    h = hashlib.sha256()
+    update_hash(h, [CACHE_VERSION, "fit", a["treated"], a["outcome"], list(a["donors"]), window,
+                    int(a["min_donors"]), a["solver"], _penalty_key(as_penalty(a["penalty"]))])
+    _slice_digest(h, cube, [a["treated"]] + list(a["donors"]), a["outcome"], a["date_min"], a["full_end"])
+    return h.hexdigest()[:24]
+
+
+def placebo_key(cube: PanelCube, tr: FitResult, donors_base: Sequence[str], min_donors: int, solver: str) -> str:
+    """Key of placebo_fits(cube, tr, donors_base, ...): only tr's outcome, window and penalty enter it."""
+    window = [str(getattr(tr, k).date()) for k in _WINDOW]
+    h = hashlib.sha256()
+    update_hash(h, [CACHE_VERSION, "placebos", tr.outcome, list(donors_base), window, int(min_donors), solver,
+                    _penalty_key(tr.penalty_spec)])
+    _slice_digest(h, cube, donors_base, tr.outcome, tr.date_min, tr.full_end)
+    return h.hexdigest()[:24]
+
+
+# -----------------------------
+# (De)serialization: npz of plain arrays plus one JSON string, no pickles
+# -----------------------------
+
+def _json_default(o: Any) -> Any:
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(f"Not JSON serializable: {type(o).__name__}")
+
+
+def _pack_fit(res: FitResult) -> Dict[str, np.ndarray]:
+    arrays: Dict[str, np.ndarray] = {}
+    meta: Dict[str, Any] = {}
+    for f in fields(FitResult):
+        v = getattr(res, f.name)
+        if isinstance(v, pd.DatetimeIndex):
+            arrays[f.name] = v.to_numpy()
+        elif isinstance(v, pd.Timestamp):
+            meta[f.name] = v.isoformat()
+        elif isinstance(v, pd.Series):
+            arrays[f"{f.name}__index"] = np.asarray(v.index.astype(str), dtype=str)
+            arrays[f.name] = v.to_numpy(dtype=float)
+        elif isinstance(v, np.ndarray):
+            arrays[f.name] = v
+        elif isinstance(v, list):
+            arrays[f.name] = np.asarray(v, dtype=str)
+        elif isinstance(v, SolverInfo):
+            meta[f.name] = asdict(v)
+        elif isinstance(v, PenaltyPath):
+            meta[f.name] = {"spec": asdict(v.spec), "lam": v.lam, "n_iter": v.n_iter}
+            for k in ("lambdas", "cv_mse", "pre_rmspe", "n_active", "weights"):
+                arrays[f"{f.name}__{k}"] = getattr(v, k)
+            arrays[f"{f.name}__donors"] = np.asarray(v.donors, dtype=str)
+        else:
+            meta[f.name] = v
+    arrays["__meta__"] = np.asarray(json.dumps(meta, default=_json_default))
+    return arrays
+
+
+def _unpack_fit(z) -> FitResult:
+    meta = json.loads(str(z["__meta__"]))
+    kw: Dict[str, Any] = {}
+    for f in fields(FitResult):
+        if f.name in meta:
+            v = meta[f.name]
+            if f.name in _WINDOW:
+                v = pd.Timestamp(v)
+            elif f.name == "solver_info" and v is not None:
+                v = SolverInfo(**v)
+            elif f.name == "penalty" and v is not None:
+                v = PenaltyPath(spec=PenaltySpec(**v["spec"]), lam=v["lam"], n_iter=v["n_iter"],
+                                donors=z[f"{f.name}__donors"].tolist(),
+                                **{k: z[f"{f.name}__{k}"] for k in ("lambdas", "cv_mse", "pre_rmspe", "n_active", "weights")})
+            kw[f.name] = v
+        elif f"{f.name}__index" in z:
+            kw[f.name] = pd.Series(z[f.name], index=z[f"{f.name}__index"].tolist())
+        elif f.name == "dates":
+            kw[f.name] = pd.DatetimeIndex(z[f.name])
+        elif z[f.name].dtype.kind == "U":
+            kw[f.name] = z[f.name].tolist()
+        else:
+            kw[f.name] = z[f.name]
+    return FitResult(**kw)
+
+
+def _pack_placebos(all_df: pd.DataFrame, failures: Dict[str, str]) -> Dict[str, np.ndarray]:
+    arrays = {f"col__{c}": (all_df[c].to_numpy() if pd.api.types.is_numeric_dtype(all_df[c])
+                            else np.asarray(all_df[c].astype(str), dtype=str))
+              for c in all_df.columns}
+    meta = {"columns": list(all_df.columns), "failures": failures}
+    arrays["__meta__"] = np.asarray(json.dumps(meta, default=_json_default))
+    return arrays
+
+
+def _unpack_placebos(z) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    meta = json.loads(str(z["__meta__"]))
+    cols = meta["columns"]
+    all_df = pd.DataFrame({c: (z[f"col__{c}"].tolist() if z[f"col__{c}"].dtype.kind == "U" else z[f"col__{c}"])
+                           for c in cols}, columns=cols)
+    return all_df, meta["failures"]
+
+
+# -----------------------------
+# Cache
+# -----------------------------
+
+class FitCache:
+    """
+    On-disk, content-addressed cache of treated fits (fit_one) and placebo
+    tables (placebo_fits). Entries are {root}/{kind}_{key}.npz, keyed by a
+    hash of the panel slice the fit reads, the outcome, the donor list, every
+    window date, min_donors, the solver, the penalty and CACHE_VERSION, so any
+    change to the data or the spec misses. Writes are atomic; when the entries
+    exceed max_bytes the least recently used ones are deleted. read=False
+    refreshes entries without using them; FitCache(None) is a pass-through.
+
+        cache = FitCache("data/cache/fits")
+        fits = cache.fits(cube, fit_kwargs, run=lambda kws: [fit_one(cube, **kw) for kw in kws])
+        print(cache.report())
+    """
+
+    def __init__(self, root=None, max_bytes: int = DEFAULT_MAX_BYTES, read: bool = True, write: bool = True):
+        self.root = Path(root) if root is not None else None
+        self.max_bytes = int(max_bytes)
+        self.read = read and self.root is not None
+        self.write = write and self.root is not None
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self._counts_lock = threading.Lock()   # the server counts from its handler threads
+        if self.write:
+            self.root.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.read or self.write
+
+    def _count(self, kind: str, outcome: str) -> None:
+        with self._counts_lock:
+            c = self.counts.setdefault(kind, {"hit": 0, "miss": 0})
+            c[outcome] += 1
+
+    def _snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._counts_lock:
+            return {kind: dict(c) for kind, c in self.counts.items()}
+
+    def _path(self, kind: str, key: str) -> Path:
+        return self.root / f"{kind}_{key}.npz"
+
+    def _get(self, kind: str, key: str):
+        if not self.read:
+            return None
+        p = self._path(kind, key)
+        try:
+            with np.load(p, allow_pickle=False) as z:
+                out = _unpack_fit(z) if kind == "fit" else _unpack_placebos(z)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # unreadable or stale-format entry: drop it and recompute
+            p.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(p)   # recency for LRU eviction
+        except OSError:
+            pass
+        return out
+
+    def _put(self, kind: str, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        if not self.write:
+            return
+        fd, tmp = tempfile.mkstemp(prefix=f".{kind}_", suffix=".tmp", dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self._path(kind, key))
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete least recently used entries until the cache fits in max_bytes; returns how many."""
+        if self.root is None or not self.root.exists():
+            return 0
+        entries = []
+        for p in self.root.glob("*.npz"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        n = 0
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            n += 1
+        return n
+
+    def clear(self) -> int:
+        n = 0
+        if self.root is not None and self.root.exists():
+            for p in self.root.glob("*.npz"):
+                p.unlink(missing_ok=True)
+                n += 1
+        return n
+
+    # -- batch lookups: `run` computes only the misses (serially or in a pool) --
+
+    def fits(self, cube: PanelCube, fit_kwargs: List[Dict[str, Any]],
+             run: Callable[[List[Dict[str, Any]]], List[FitResult]]) -> List[FitResult]:
+        """fit_one for each kwargs dict, in order; run(missing_kwargs) fits the cache misses."""
+        if not self.enabled:
+            return run(fit_kwargs)
+        keys = [fit_key(cube, kw) for kw in fit_kwargs]
+        out: List[Optional[FitResult]] = [self._get("fit", k) for k in keys]
+        for r in out:
+            self._count("fit", "miss" if r is None else "hit")
+        todo = [i for i, r in enumerate(out) if r is None]
+        if todo:
+            for i, res in zip(todo, run([fit_kwargs[i] for i in todo])):
+                out[i] = res
+                self._put("fit", keys[i], _pack_fit(res))
+        return out
+
+    def placebos(self, cube: PanelCube, fits: List[FitResult], donors: List[List[str]],
+                 min_donors: int, solver: str,
+                 run: Callable[[List[FitResult], List[List[str]], Optional[list]], List[pd.DataFrame]],
+                 logs: Optional[List[List[Dict[str, Any]]]] = None) -> List[pd.DataFrame]:
+        """
+        placebo_fits for each (fit, donors_base), in order. run(fits, donors, logs)
+        computes the misses and, like parallel_placebos, extends logs with one
+        event list per fit. Hits restore each fit's placebo_failures and log a
+        single placebo_cache_hit event.
+        """
+        if not self.enabled:
+            return run(fits, donors, logs)
+        keys = [placebo_key(cube, tr, d, min_donors, solver) for tr, d in zip(fits, donors)]
+        out: List[Optional[pd.DataFrame]] = [None] * len(fits)
+        events: List[List[Dict[str, Any]]] = [[] for _ in fits]
+        for i, (tr, key) in enumerate(zip(fits, keys)):
+            hit = self._get("placebos", key)
+            self._count("placebos", "miss" if hit is None else "hit")
+            if hit is not None:
+                out[i], failures = hit
+                tr.placebo_failures.update(failures)
+                events[i] = [{"event": "placebo_cache_hit", "n_placebos": len(out[i]), "n_failures": len(failures)}]
+        todo = [i for i, r in enumerate(out) if r is None]
+        if todo:
+            run_logs: Optional[list] = [] if logs is not None else None
+            for j, (i, all_df) in enumerate(zip(todo, run([fits[i] for i in todo], [donors[i] for i in todo], run_logs))):
+                out[i] = all_df
+                failures = {s: fits[i].placebo_failures[s] for s in donors[i] if s in fits[i].placebo_failures}
+                self._put("placebos", keys[i], _pack_placebos(all_df, failures))
+                if run_logs is not None:
+                    events[i] = run_logs[j]
+        if logs is not None:
+            logs.extend(events)
+        return out
+
+    # -- single-fit conveniences (serial) --
+
+    def fit_one(self, cube: PanelCube, **kwargs: Any) -> FitResult:
+        return self.fits(cube, [kwargs], run=lambda kws: [fit_one(cube, **kw) for kw in kws])[0]
+
+    def placebo_fits(self, cube: PanelCube, treated_res: FitResult, donors_base: List[str],
+                     min_donors: int = 5, verbose: bool = False, solver: str = "native",
+                     log: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+        def run(fits, donors, logs):
+            out = []
+            for tr, d in zip(fits, donors):
+                events = [] if logs is not None else None
+                out.append(placebo_fits(cube, treated_res=tr, donors_base=d, min_donors=min_donors,
+                                        verbose=verbose, solver=solver, log=events))
+                if logs is not None:
+                    logs.append(events)
+            return out
+
+        logs = [] if log is not None else None
+        all_df = self.placebos(cube, [treated_res], [list(donors_base)], min_donors, solver, run, logs=logs)[0]
+        if log is not None:
+            log.extend(logs[0])
+        return all_df
+
+    # -- reporting --
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for kind, c in self._snapshot().items():
+            n = c["hit"] + c["miss"]
+            out[f"{kind}_hits"] = c["hit"]
+            out[f"{kind}_misses"] = c["miss"]
+            out[f"{kind}_hit_rate"] = c["hit"] / n if n else np.nan
+        return out
+
+    def report(self) -> str:
+        if not self.enabled:
+            return "Fit cache: disabled"
+        parts = []
+        counts = self._snapshot()
+        for kind, c in counts.items():
+            n = c["hit"] + c["miss"]
+            parts.append(f"{kind} {c['hit']}/{n} hits ({100.0 * c['hit'] / n:.0f}%)" if n else f"{kind} 0/0")
+        size = sum(p.stat().st_size for p in self.root.glob("*.npz")) if self.root.exists() else 0
+        out = f"Fit cache ({self.root}, {size / 2**20:.1f} MB): " + ", ".join(parts or ["no lookups"])
+        hits = sum(c["hit"] for c in counts.values())
+        if hits:
+            out += f"\nNOTE: {hits} result(s) were read from the cache, not refitted (--refresh-cache to refit)"
+        return out
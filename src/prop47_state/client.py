@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import http.client
+import json
+import socket
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import pandas as pd
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class SCMClient:
+    """
+    Notebook client for scripts/serve_scm.py. Query keywords are the server's
+    QUERY_FIELDS (treated, outcome, t0, pre_start, date_min, fit_end,
+    full_end, donors, exclude, min_donors, solver, mults); unset ones take the
+    server's defaults.
+
+        scm = SCMClient()                                  # or SCMClient(socket_path="/tmp/scm.sock")
+        fit = scm.fit(t0="2015-03-01", exclude=["AZ", "TX"])
+        fit["weights"], fit["series"]                      # pd.Series, DataFrame indexed by date
+        scm.pvalues(t0="2015-03-01", exclude=["AZ", "TX"], mults=[1, 2, 5])
+    """
+
+    def __init__(self, url: str = "http://127.0.0.1:8747", socket_path: Optional[str] = None,
+                 timeout: float = 600.0):
+        u = urlparse(url)
+        self.host, self.port = u.hostname or "127.0.0.1", u.port or 80
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.last: Dict[str, Any] = {}
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self.socket_path is not None:
+            return _UnixHTTPConnection(self.socket_path, self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method: str, path: str, query: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Raw JSON round trip; raises RuntimeError with the server's message on a non-200 reply."""
+        conn = self._connection()
+        try:
+            body = None if query is None else json.dumps(query)
+            headers = {} if body is None else {"Content-Type": "application/json"}
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            out = json.loads(resp.read() or b"{}")
+        finally:
+            conn.close()
+        if resp.status != 200:
+            raise RuntimeError(f"{method} {path} -> {resp.status}: {out.get('error')}")
+        self.last = out
+        return out
+
+    def health(self) -> bool:
+        return bool(self.request("GET", "/health").get("ok"))
+
+    def info(self) -> Dict[str, Any]:
+        return self.request("GET", "/info")
+
+    def stats(self) -> Dict[str, Any]:
+        return self.request("GET", "/stats")
+
+    def fit(self, series: bool = True, **query: Any) -> Dict[str, Any]:
+        """Treated fit: statistics, "weights" as a Series and (series=True) a date-indexed y/y_synth/gap frame."""
+        fit = self.request("POST", "/fit", {**query, "series": series})["fit"]
+        fit["weights"] = pd.Series(fit["weights"], name="weight", dtype=float).sort_values(ascending=False)
+        if series:
+            s = fit["series"]
+            fit["series"] = pd.DataFrame({k: s[k] for k in ("y", "y_synth", "gap")},
+                                         index=pd.DatetimeIndex(s["date"], name="date"), dtype=float)
+        return fit
+
+    def placebos(self, **query: Any) -> pd.DataFrame:
+        """Placebo table (state, pre_rmspe, ratio_post1, ratio_post2) for the query's treated fit."""
+        return pd.DataFrame(self.request("POST", "/placebos", query)["placebos"],
+                            columns=["state", "pre_rmspe", "ratio_post1", "ratio_post2"])
+
+    def pvalues(self, **query: Any) -> pd.DataFrame:
+        """Placebo p-values per pre-RMSPE multiplier ("mults"), as placebo_pvalue_curve returns them."""
+        return pd.DataFrame(self.request("POST", "/pvalues", query)["pvalues"])
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .hashing import update_hash
+from .scm import FitResult
+
+# Bump when a plot function's styling changes, so figures drawn by older code
+# are re-rendered even though their inputs are identical.
+FIGURE_VERSION = "1"
+MANIFEST = ".figure_hashes.json"
+
+# the FitResult fields the plot helpers draw (timings and solver info must not
+# invalidate a figure)
+_FIT_PLOT_FIELDS = ("treated", "outcome", "t0", "dates", "y", "y_synth", "gap")
+
+
+def _hash_fit(h, obj: Any) -> bool:
+    if not isinstance(obj, FitResult):
+        return False
+    h.update(b"FitResult")
+    for f in _FIT_PLOT_FIELDS:
+        h.update(f.encode())
+        update_hash(h, getattr(obj, f), _hash_fit)
+    return True
+
+
+def figure_key(func: Callable, kwargs: Dict[str, Any]) -> str:
+    """Hash of the plot function, FIGURE_VERSION and every input except outpath."""
+    h = hashlib.sha256()
+    h.update(f"{FIGURE_VERSION}:{func.__module__}.{func.__qualname__}".encode())
+    update_hash(h, {k: v for k, v in kwargs.items() if k != "outpath"}, _hash_fit)
+    return h.hexdigest()[:16]
+
+
+@dataclass
+class FigureJob:
+    func: Callable
+    outpath: Path
+    kwargs: Dict[str, Any]
+    key: str
+
+
+def _render_job(job: FigureJob) -> Tuple[str, Optional[str]]:
+    try:
+        job.func(outpath=job.outpath, **job.kwargs)
+        return ("ok", None)
+    except Exception as e:
+        return ("error", f"{type(e).__name__}: {e}")
+
+
+def _read_manifest(fig_dir: Path) -> Dict[str, str]:
+    fp = fig_dir / MANIFEST
+    if not fp.exists():
+        return {}
+    try:
+        with open(fp) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class FigureQueue:
+    """
+    Figures requested during a run, rendered later in one stage. Each figure is
+    keyed by figure_key(); a figure whose file exists and whose key matches the
+    per-directory manifest (.figure_hashes.json) is skipped. A disabled queue
+    (--no-plots) drops every request.
+
+        figures.add(plot_gap, outpath=fig_dir / "S0_gap.png", res=tr, title="...")
+        figures.render(jobs=4)
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.jobs: List[FigureJob] = []
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def add(self, func: Callable, outpath: Path, **kwargs: Any) -> None:
+        if self.enabled:
+            outpath = Path(outpath)
+            self.jobs.append(FigureJob(func, outpath, kwargs, figure_key(func, kwargs)))
+
+    def render(self, jobs: int = 1, force: bool = False) -> Dict[str, int]:
+        """Render queued figures whose key changed (all of them with force); returns counts."""
+        queued, self.jobs = self.jobs, []
+        manifests: Dict[Path, Dict[str, str]] = {}
+        todo = []
+        for job in queued:
+            d = job.outpath.parent
+            if d not in manifests:
+                manifests[d] = _read_manifest(d)
+            if force or not job.outpath.exists() or manifests[d].get(job.outpath.name) != job.key:
+                todo.append(job)
+
+        if jobs > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(todo))) as ex:
+                results = list(ex.map(_render_job, todo))
+        else:
+            results = [_render_job(job) for job in todo]
+
+        errors = []
+        for job, (status, err) in zip(todo, results):
+            if status == "ok":
+                manifests[job.outpath.parent][job.outpath.name] = job.key
+            else:
+                errors.append(f"{job.outpath.name}: {err}")
+        for d, m in manifests.items():
+            d.mkdir(parents=True, exist_ok=True)
+            with open(d / MANIFEST, "w") as f:
+                json.dump(m, f, indent=0, sort_keys=True)
+        if errors:
+            raise RuntimeError("Figure rendering failed for " + "; ".join(errors))
+        return {"rendered": len(todo), "skipped": len(queued) - len(todo)}
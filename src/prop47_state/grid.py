@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import itertools
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .cache import FitCache
+from .panel import PanelCube, mstart
+from .scm import FitResult
+
+
+DEFAULTS: Dict[str, Any] = {
+    "treated": "CA",
+    "date_min": "2010-01-01",
+    "fit_end": "2019-12-01",
+    "full_end": "2024-12-01",
+    "min_donors": 5,
+    "solver": "native",
+    "pre_rmspe_mult": [2.0],
+    "leave_one_out": True,
+    "summary": "all_specs_summary_extended.csv",
+}
+
+
+@dataclass(frozen=True)
+class GridSpec:
+    spec_id: str
+    pool: str
+    outcome: str
+    t0: pd.Timestamp
+    pre_start: pd.Timestamp
+    mults: Tuple[float, ...]
+
+    @property
+    def fit_key(self) -> Tuple[str, str, pd.Timestamp, pd.Timestamp]:
+        """Specs with the same key share the treated fit and the placebo table."""
+        return (self.pool, self.outcome, self.t0, self.pre_start)
+
+
+def load_grid(path) -> Dict[str, Any]:
+    """Read a grid file (.toml, or .yaml/.yml when PyYAML is installed) and fill defaults."""
+    path = Path(path)
+    if path.suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as e:
+            raise ImportError("YAML grids need PyYAML (pip install pyyaml); TOML grids work without it.") from e
+        with open(path) as f:
+            cfg = yaml.safe_load(f) or {}
+    else:
+        import tomllib
+        with open(path, "rb") as f:
+            cfg = tomllib.load(f)
+
+    defaults = dict(DEFAULTS)
+    defaults.update(cfg.get("defaults", {}))
+    cfg["defaults"] = defaults
+    cfg.setdefault("pools", {"Pool0": {}})
+    cfg.setdefault("outcomes", {})
+    return cfg
+
+
+def _as_list(x) -> List[Any]:
+    return list(x) if isinstance(x, (list, tuple)) else [x]
+
+
+def expand_grid(cfg: Dict[str, Any]) -> List[GridSpec]:
+    """
+    Cartesian product of [grid] (pool x outcome x t0 x pre_start) plus any
+    explicit [[specs]] entries. Outcome aliases come from [outcomes]; ids are
+    "{pool}_{alias}_t{YYYYMM}_p{YYYYMM}" unless an explicit spec sets `id`.
+    """
+    defaults = cfg["defaults"]
+    aliases = cfg.get("outcomes", {})
+    reverse = {v: k for k, v in aliases.items()}
+
+    def make(entry: Dict[str, Any], spec_id: Optional[str]) -> GridSpec:
+        outcome = aliases.get(entry["outcome"], entry["outcome"])
+        pool = entry.get("pool", "Pool0")
+        if pool not in cfg["pools"]:
+            raise ValueError(f"Unknown donor pool '{pool}' (defined: {sorted(cfg['pools'])})")
+        t0, pre_start = mstart(entry["t0"]), mstart(entry["pre_start"])
+        mults = tuple(float(m) for m in _as_list(entry.get("pre_rmspe_mult", defaults["pre_rmspe_mult"])))
+        if spec_id is None:
+            spec_id = f"{pool}_{reverse.get(outcome, outcome)}_t{t0:%Y%m}_p{pre_start:%Y%m}"
+        return GridSpec(spec_id, pool, outcome, t0, pre_start, mults)
+
+    specs = []
+    grid = cfg.get("grid")
+    if grid:
+        axes = ["pool", "outcome", "t0", "pre_start"]
+        values = [_as_list(grid.get(a, "Pool0" if a == "pool" else None)) for a in axes]
+        for combo in itertools.product(*values):
+            entry = dict(zip(axes, combo))
+            if "pre_rmspe_mult" in grid:
+                entry["pre_rmspe_mult"] = grid["pre_rmspe_mult"]
+            specs.append(make(entry, None))
+    for entry in cfg.get("specs", []):
+        specs.append(make(entry, entry.get("id")))
+
+    ids = [s.spec_id for s in specs]
+    dupes = sorted({i for i in ids if ids.count(i) > 1})
+    if dupes:
+        raise ValueError(f"Duplicate spec ids in grid: {dupes}")
+    return specs
+
+
+def pool_donors(cfg: Dict[str, Any], pool: str, states: List[str]) -> List[str]:
+    """Donor list for a pool: panel states minus the treated unit and the pool's exclusions."""
+    treated = cfg["defaults"]["treated"]
+    exclude = set(cfg["pools"][pool].get("exclude", []))
+    return sorted(s for s in states if s != treated and s not in exclude)
+
+
+def schedule(specs: List[GridSpec]) -> Dict[Tuple, List[GridSpec]]:
+    """Group specs by fit_key (insertion order kept): one treated fit + placebo table per group."""
+    groups: Dict[Tuple, List[GridSpec]] = {}
+    for s in specs:
+        groups.setdefault(s.fit_key, []).append(s)
+    return groups
+
+
+def run_fits(cube: PanelCube, cfg: Dict[str, Any], groups: Dict[Tuple, List[GridSpec]],
+             jobs: int = 1, verbose: bool = False,
+             cache: Optional[FitCache] = None) -> Dict[Tuple, Tuple[FitResult, pd.DataFrame]]:
+    """
+    Run each unique fit task once: the treated fit, then its placebo table.
+    With jobs > 1 both stages are spread over a process pool sharing the cube.
+    With a cache, only fits and placebo tables missing from it are computed.
+    Returns {fit_key: (treated FitResult, placebo all_df)}.
+    """
+    cache = cache if cache is not None else FitCache()
+    d = cfg["defaults"]
+    keys = list(groups)
+    fit_kwargs = [
+        dict(treated=d["treated"], outcome=outcome, donors=pool_donors(cfg, pool, cube.states),
+             pre_start=pre_start, t0=t0, date_min=d["date_min"], fit_end=d["fit_end"], full_end=d["full_end"],
+             min_donors=d["min_donors"], solver=d["solver"])
+        for pool, outcome, t0, pre_start in keys
+    ]
+
+    if jobs > 1:
+        from .parallel import SharedPanel, parallel_fits, parallel_placebos
+
+        with SharedPanel(cube) as shared, shared.pool(jobs) as ex:
+            fits = cache.fits(cube, fit_kwargs, run=lambda kws: parallel_fits(ex, kws))
+            placebos = cache.placebos(
+                cube, fits, [tr.donors_complete_pre for tr in fits], d["min_donors"], d["solver"],
+                run=lambda fs, ds, logs: parallel_placebos(
+                    ex, fs, ds, min_donors=d["min_donors"], solver=d["solver"], verbose=verbose, logs=logs,
+                ),
+            )
+    else:
+        fits = [cache.fit_one(cube, **kw) for kw in fit_kwargs]
+        placebos = [
+            cache.placebo_fits(cube, treated_res=tr, donors_base=tr.donors_complete_pre,
+                               min_donors=d["min_donors"], verbose=verbose, solver=d["solver"])
+            for tr in fits
+        ]
+    return dict(zip(keys, zip(fits, placebos)))
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from .panel import PanelCube
+
+
+def update_hash(h, obj: Any, custom: Optional[Callable[[Any, Any], bool]] = None) -> None:
+    """
+    Feed a stable, type-tagged encoding of obj into the hashlib object h:
+    PanelCubes, DataFrames, Series, DatetimeIndexes and arrays by content,
+    lists, tuples and dicts (keys sorted) recursively, anything else by repr.
+    custom(h, obj), if given, is tried first at every level and returns True
+    when it has encoded obj itself (e.g. figures hashing only the drawn
+    FitResult fields). Used for figure, fit-cache and simulation keys.
+    """
+    if custom is not None and custom(h, obj):
+        return
+    if isinstance(obj, PanelCube):
+        h.update(b"PanelCube")
+        for part in (np.asarray(obj.values), obj.dates, obj.states, obj.outcomes):
+            update_hash(h, part, custom)
+    elif isinstance(obj, pd.DataFrame):
+        h.update(b"DataFrame")
+        update_hash(h, [str(c) for c in obj.columns], custom)
+        h.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+    elif isinstance(obj, pd.Series):
+        h.update(b"Series")
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, pd.DatetimeIndex):
+        h.update(b"DatetimeIndex")
+        update_hash(h, obj.to_numpy().astype("datetime64[ns]"), custom)
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            update_hash(h, obj.tolist(), custom)
+        else:
+            h.update(f"{obj.dtype}{obj.shape}".encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"[{len(obj)}".encode())
+        for x in obj:
+            update_hash(h, x, custom)
+    elif isinstance(obj, dict):
+        h.update(f"{{{len(obj)}".encode())
+        for k in sorted(obj, key=str):
+            update_hash(h, str(k), custom)
+            update_hash(h, obj[k], custom)
+    else:
+        h.update(repr(obj).encode())
+        h.update(b"\0")
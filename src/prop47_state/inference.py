@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .panel import PanelCube, as_cube
+from .scm import COVID_END, COVID_START, POST2_START, FitResult, WideWindow
+from .simplex import simplex_lsq
+
+
+def in_time_placebos(panel: Union[pd.DataFrame, PanelCube], treated_res: FitResult,
+                     min_pre: int = 12, min_post: int = 1) -> pd.DataFrame:
+    """
+    In-time placebos for the treated unit: move a fake t0 through every month
+    of the real pre-period [pre_start, t0), fit on [pre_start, fake_t0) and
+    score the fake post-period [fake_t0, t0) (never touching real post data).
+
+    Uses the treated fit's complete donors. X'X and X'y are prefix sums over
+    the pre-period rows, so each fake t0 costs one active-set solve on a J x J
+    system, warm-started from the previous month's weights.
+
+    Returns one row per fake t0 with pre/post RMSPE, their ratio, the average
+    fake-post gap, the number of active donors and solver diagnostics.
+    """
+    tr = treated_res
+    cube = as_cube(panel, outcomes=[tr.outcome])
+    donors = list(tr.donors_complete_pre)
+    ww = WideWindow.from_cube(cube, [tr.treated] + donors, tr.outcome,
+                              tr.t0, tr.pre_start, tr.date_min, tr.fit_end, tr.full_end)
+    si = ww.col_idx[tr.treated]
+    di = np.array([ww.col_idx[d] for d in donors])
+
+    dates = ww.dates[ww.pre_rows]
+    y = ww.X_pre[:, si]
+    X = ww.X_pre[:, di]
+    if not (np.all(np.isfinite(y)) and np.all(np.isfinite(X))):
+        raise ValueError("Non-finite values in the pre-period; in-time placebos need a complete pre window.")
+    T0 = y.size
+
+    # prefix sums: G_cum[k] = sum_{t<=k} x_t x_t', c_cum[k] = sum_{t<=k} x_t y_t
+    G_cum = np.cumsum(X[:, :, None] * X[:, None, :], axis=0)
+    c_cum = np.cumsum(X * y[:, None], axis=0)
+    scale2 = float(np.var(y))
+    if not np.isfinite(scale2) or scale2 <= 0:
+        scale2 = 1.0
+
+    rows = []
+    w = None
+    for k in range(min_pre, T0 - min_post + 1):
+        w, info = simplex_lsq(G_cum[k - 1] / scale2, c_cum[k - 1] / scale2, w0=w)
+        gap = y - X @ w
+        pre, post = gap[:k], gap[k:]
+        pre_rmspe = float(np.sqrt(np.mean(pre ** 2)))
+        post_rmspe = float(np.sqrt(np.mean(post ** 2)))
+        active = w > 1e-6
+        rows.append({
+            "fake_t0": dates[k],
+            "n_pre": k,
+            "n_post": int(post.size),
+            "pre_rmspe": pre_rmspe,
+            "post_rmspe": post_rmspe,
+            "ratio_post": post_rmspe / (pre_rmspe + 1e-12),
+            "avg_gap_post": float(np.mean(post)),
+            "n_donors_active": int(active.sum()),
+            "top_donor": donors[int(np.argmax(w))],
+            "top_weight": float(np.max(w)),
+            "solver_iters": info.n_iter,
+            "solver_status": info.status,
+        })
+    return pd.DataFrame(rows)
+
+
+# -----------------------------
+# Conformal / permutation inference
+# -----------------------------
+
+def block_permutations(T: int) -> np.ndarray:
+    """All T cyclic shifts of range(T) (moving-block permutations); row 0 is the identity."""
+    return (np.arange(T)[None, :] + np.arange(T)[:, None]) % T
+
+
+def iid_permutations(T: int, n_perms: int, rng: np.random.Generator) -> np.ndarray:
+    """n_perms random permutations of range(T); row 0 is the identity."""
+    P = rng.permuted(np.tile(np.arange(T), (n_perms, 1)), axis=1)
+    P[0] = np.arange(T)
+    return P
+
+
+def permutation_pvalues(U: np.ndarray, post: np.ndarray, perms: np.ndarray, q: float = 1.0,
+                        max_bytes: int = 64 * 2**20) -> np.ndarray:
+    """
+    Permutation p-values for each residual series (rows of U, shape n x T).
+
+    The statistic is S(u) = (T1^-1/2 * sum_{t in post} |u_t|^q)^(1/q); the
+    p-value is the share of permutations pi (rows of perms, identity
+    included) with S(u_pi) >= S(u). All permutations are scored at once by
+    fancy-indexing U; rows of U are processed in chunks of about max_bytes.
+    """
+    U = np.atleast_2d(U)
+    post_idx = np.flatnonzero(post)
+    Pp = perms[:, post_idx]                          # (B, T1) source index of each permuted post slot
+    T1 = post_idx.size
+    chunk = max(1, int(max_bytes // (8 * Pp.size)))
+
+    out = np.empty(U.shape[0])
+    for lo in range(0, U.shape[0], chunk):
+        A = np.abs(U[lo:lo + chunk])
+        S_perm = (np.sum(A[:, Pp] ** q, axis=2) / np.sqrt(T1)) ** (1.0 / q)      # (n, B)
+        S_obs = (np.sum(A[:, post_idx] ** q, axis=1) / np.sqrt(T1)) ** (1.0 / q)  # (n,)
+        out[lo:lo + chunk] = np.mean(S_perm >= S_obs[:, None] * (1 - 1e-12), axis=1)
+    return out
+
+
+def _segments(tr: FitResult) -> Dict[str, Tuple[pd.Timestamp, pd.Timestamp]]:
+    return {
+        "post1": (tr.t0, tr.fit_end),
+        "covid": (COVID_START, COVID_END),
+        "post2": (POST2_START, tr.full_end),
+    }
+
+
+CONFORMAL_REFITS = ("pre", "null")
+
+
+def _confidence_set(thetas: np.ndarray, pv: np.ndarray, alpha: float, est: float) -> Dict[str, object]:
+    """
+    Classify {theta : p > alpha} on the grid. Only an "interval" (contiguous
+    accepted points, away from both grid edges, containing the grid point
+    nearest the estimate) gets ci_lo/ci_hi; "empty", "unbounded" (touches a
+    grid edge), "not_convex" and "excludes_estimate" sets report NaN bounds.
+    """
+    ok = pv > alpha
+    span = np.flatnonzero(ok)
+    convex = bool(span.size and (span[-1] - span[0] + 1 == span.size))
+    at_edge = bool(ok[0] or ok[-1])
+    if not span.size:
+        status = "empty"
+    elif at_edge:
+        status = "unbounded"
+    elif not convex:
+        status = "not_convex"
+    elif not ok[int(np.argmin(np.abs(thetas - est)))]:
+        status = "excludes_estimate"
+    else:
+        status = "interval"
+    bounded = status == "interval"
+    return {
+        "ci_lo": float(thetas[span[0]]) if bounded else np.nan,
+        "ci_hi": float(thetas[span[-1]]) if bounded else np.nan,
+        "ci_status": status,
+        "ci_convex": convex,
+        "ci_at_grid_edge": at_edge,
+    }
+
+
+def conformal_inference(panel: Union[pd.DataFrame, PanelCube], treated_res: FitResult,
+                        n_perms: int = 5000, alpha: float = 0.1, q: float = 1.0,
+                        n_grid: int = 201, grid_width: float = 3.0, max_widen: int = 3,
+                        refit: str = "pre", seed: Optional[int] = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Conformal inference (Chernozhukov, Wuthrich & Zhu) for a constant effect
+    theta over each post segment (post1, covid, post2).
+
+    For each segment and each theta on a grid, the treated segment values are
+    shifted by -theta and the residual series u(theta) = y - theta * post - X w
+    is kept. With refit="pre" (default) w is fit once on the pre-period rows,
+    so u(theta) is the pre-period fit's gap minus theta after t0 and p(theta)
+    peaks near the segment's gap; the pre-period residuals are cross-fitted
+    (each block of about 12 months predicted by weights fit without it) so
+    that, like the post residuals, they are out of sample. refit="null" is CWZ's refit under each null
+    on pre + segment rows (one Gram system per segment; only X'y moves with
+    theta, so solves are warm-started along the grid); the simplex weights can
+    then absorb level shifts, which flattens p(theta) and can make it rise
+    away from the estimate. The residual matrix is scored against all
+    moving-block permutations and n_perms iid permutations in one batched
+    computation. Serially correlated residuals make the iid scheme
+    anti-conservative; the block scheme is the safer default.
+
+    The grid is centred on the treated fit's average segment gap with half-width
+    grid_width * (segment gap sd + pre RMSPE), n_grid points; theta = 0 is always
+    included. While a scheme's accepted set {theta : p(theta) > alpha} touches
+    a grid edge, the grid is doubled outward at the same spacing (at most
+    max_widen times). Constrained refits can absorb large shifts, so p(theta)
+    need not fall away from the estimate: ci_lo/ci_hi are reported only when
+    the accepted set is an interval inside the grid that contains the
+    estimate, and ci_status says why they are NaN otherwise (empty,
+    unbounded, not_convex, excludes_estimate).
+
+    Returns (summary, curve): summary has one row per (segment, scheme) with
+    the p-value for theta = 0 and the confidence set; curve is the long
+    (segment, scheme, theta, pval) table over the final grid.
+    """
+    if refit not in CONFORMAL_REFITS:
+        raise ValueError(f"Unknown refit '{refit}' (expected one of {list(CONFORMAL_REFITS)})")
+    tr = treated_res
+    cube = as_cube(panel, outcomes=[tr.outcome])
+    donors = list(tr.donors_complete_pre)
+    ww = WideWindow.from_cube(cube, [tr.treated] + donors, tr.outcome,
+                              tr.t0, tr.pre_start, tr.date_min, tr.fit_end, tr.full_end)
+    si = ww.col_idx[tr.treated]
+    rng = np.random.default_rng(seed)
+    pre_end = tr.t0 - pd.offsets.MonthBegin(1)
+
+    summary, curves = [], []
+    for seg, (start, end) in _segments(tr).items():
+        seg_rows = (ww.dates >= start) & (ww.dates <= end) & (ww.dates >= tr.t0)
+        rows = ww.pre_rows | seg_rows
+        if not seg_rows.any():
+            continue
+        y = ww.M[rows, si]
+        if not np.all(np.isfinite(y)):
+            continue
+        seg_donors = [d for d in donors if np.all(np.isfinite(ww.M[rows, ww.col_idx[d]]))]
+        if not seg_donors:
+            continue
+        X = ww.M[rows][:, [ww.col_idx[d] for d in seg_donors]]
+        post = seg_rows[rows]
+
+        # theta grid around the treated fit's segment gap
+        g_seg = tr.gap[(tr.dates >= start) & (tr.dates <= end)]
+        g_pre = tr.gap[(tr.dates >= tr.pre_start) & (tr.dates <= pre_end)]
+        est = float(np.mean(g_seg))
+        half = grid_width * (float(np.std(g_seg)) + float(np.sqrt(np.mean(g_pre ** 2))))
+        step = 2.0 * half / max(n_grid - 1, 1)
+        k = (n_grid - 1) // 2
+
+        scale2 = float(np.var(y[~post]))
+        if not np.isfinite(scale2) or scale2 <= 0:
+            scale2 = 1.0
+        if refit == "pre":
+            pre_i = np.flatnonzero(~post)
+            Xp, yp = X[pre_i], y[pre_i]
+            w_pre, _ = simplex_lsq(Xp.T @ Xp / scale2, Xp.T @ yp / scale2)
+            u_pre = y - X @ w_pre
+            # pre-period residuals cross-fitted by leaving out one block of months at a time
+            for blk in np.array_split(np.arange(pre_i.size), max(1, pre_i.size // 12)):
+                keep = np.setdiff1d(np.arange(pre_i.size), blk)
+                w_b, _ = simplex_lsq(Xp[keep].T @ Xp[keep] / scale2, Xp[keep].T @ yp[keep] / scale2, w0=w_pre)
+                u_pre[pre_i[blk]] = yp[blk] - Xp[blk] @ w_b
+        else:
+            # refit under each null: G fixed, c(theta) = X'y - theta * X_post'1
+            G = X.T @ X
+            c0 = X.T @ y
+            s_post = X[post].sum(axis=0)
+        T = y.size
+        schemes = {
+            "block": block_permutations(T),
+            "iid": iid_permutations(T, n_perms, rng),
+        }
+
+        residuals: Dict[float, np.ndarray] = {}
+        for _ in range(max_widen + 1):
+            thetas = np.union1d(est + step * np.arange(-k, k + 1), [0.0])
+            # walk outward from the estimate for warm starts; residuals of
+            # earlier rounds are reused
+            w = None
+            for t in thetas[np.argsort(np.abs(thetas - est))]:
+                if t in residuals:
+                    continue
+                if refit == "pre":
+                    residuals[t] = u_pre - t * post
+                    continue
+                w, _ = simplex_lsq(G / scale2, (c0 - t * s_post) / scale2, w0=w)
+                residuals[t] = y - t * post - X @ w
+            U = np.stack([residuals[t] for t in thetas])
+            pvs = {scheme: permutation_pvalues(U, post, perms, q=q) for scheme, perms in schemes.items()}
+            if not any(pv[0] > alpha or pv[-1] > alpha for pv in pvs.values()):
+                break
+            k *= 2
+
+        zero = int(np.flatnonzero(thetas == 0.0)[0])
+        for scheme, perms in schemes.items():
+            pv = pvs[scheme]
+            summary.append({
+                "segment": seg,
+                "scheme": scheme,
+                "seg_start": str(start.date()),
+                "seg_end": str(min(end, ww.dates[rows][-1]).date()),
+                "n_pre": int((~post).sum()),
+                "n_post": int(post.sum()),
+                "n_donors": len(seg_donors),
+                "n_perms": int(perms.shape[0]),
+                "q": q,
+                "refit": refit,
+                "avg_gap": est,
+                "pval_zero": float(pv[zero]),
+                "alpha": alpha,
+                "grid_lo": float(thetas[0]),
+                "grid_hi": float(thetas[-1]),
+                **_confidence_set(thetas, pv, alpha, est),
+            })
+            curves.append(pd.DataFrame({"segment": seg, "scheme": scheme, "theta": thetas, "pval": pv}))
+
+    curve = pd.concat(curves, ignore_index=True) if curves else pd.DataFrame(columns=["segment", "scheme", "theta", "pval"])
+    return pd.DataFrame(summary), curve
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+STATE_COL = "state_abb"
+DATE_COL = "date"
+
+
+def mstart(x) -> pd.Timestamp:
+    return pd.to_datetime(x).to_period("M").to_timestamp()
+
+
+def normalize_panel_df(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df.columns = df.columns.astype(str).str.strip()
+    df[DATE_COL] = pd.to_datetime(df[DATE_COL]).dt.to_period("M").dt.to_timestamp()
+    return df
+
+
+def month_index(dates) -> np.ndarray:
+    """Integer month index (year * 12 + month - 1) for month-start dates."""
+    d = pd.DatetimeIndex(dates)
+    return (d.year.to_numpy(dtype=np.int64) * 12 + d.month.to_numpy(dtype=np.int64) - 1)
+
+
+class PanelCube:
+    """
+    Dense dates x states x outcomes float64 panel, built once from the long
+    state-month table. Dates and states are sorted; windows are selected by
+    binary search on the integer month index and states by column index, so
+    fitting code never re-pivots or re-filters a DataFrame.
+
+    `present` (not NaN) mirrors which (date, state) cells pivot_table would keep;
+    `finite` is the completeness mask used for donor screening.
+
+    Units are states by default; unit_col="ori" builds an agency panel from
+    the agency-month table (the "states" are then ORIs).
+    """
+
+    def __init__(self, values: np.ndarray, dates: Iterable, states: Iterable[str], outcomes: Iterable[str],
+                 unit_col: str = STATE_COL):
+        self.values = np.ascontiguousarray(values, dtype=float) if not isinstance(values, np.memmap) else values
+        self.dates = pd.DatetimeIndex(dates)
+        self.states = list(states)
+        self.outcomes = list(outcomes)
+        self.unit_col = unit_col
+        if self.values.shape != (len(self.dates), len(self.states), len(self.outcomes)):
+            raise ValueError(f"values shape {self.values.shape} does not match "
+                             f"(dates, states, outcomes)=({len(self.dates)}, {len(self.states)}, {len(self.outcomes)})")
+
+        self.months = month_index(self.dates)
+        self.state_index: Dict[str, int] = {s: i for i, s in enumerate(self.states)}
+        states_arr = np.asarray(self.states, dtype=str)
+        self._state_order = np.argsort(states_arr, kind="stable")
+        self._states_sorted = states_arr[self._state_order]
+        self.outcome_index: Dict[str, int] = {o: k for k, o in enumerate(self.outcomes)}
+        self.present = ~np.isnan(self.values)
+        self.finite = np.isfinite(self.values)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, outcomes: Optional[List[str]] = None,
+                   normalize: bool = True, unit_col: str = STATE_COL) -> "PanelCube":
+        """
+        Pivot a long (unit, date, outcomes...) frame once; duplicates are averaged
+        like build_wide. When every (unit, date) key is unique (the usual case)
+        the cube is filled by integer codes instead of pivot_table.
+        """
+        if normalize:
+            df = normalize_panel_df(df)
+        if outcomes is None:
+            outcomes = [c for c in df.columns
+                        if c not in (STATE_COL, DATE_COL, unit_col) and pd.api.types.is_numeric_dtype(df[c])]
+        df = df[df[unit_col].notna() & df[DATE_COL].notna()]
+        units = df[unit_col].astype(str).to_numpy()
+        c, states = pd.factorize(units, sort=True)
+        r, dates = pd.factorize(pd.DatetimeIndex(df[DATE_COL]), sort=True)
+        states = list(states)
+
+        values = np.full((len(dates), len(states), len(outcomes)), np.nan)
+        cell = r.astype(np.int64) * len(states) + c
+        if len(df) == 0 or np.bincount(cell, minlength=len(dates) * len(states)).max() <= 1:
+            for k, o in enumerate(outcomes):
+                values[r, c, k] = df[o].to_numpy(dtype=float, na_value=np.nan)
+        else:
+            df = df.assign(**{unit_col: units})
+            for k, o in enumerate(outcomes):
+                Y = df.pivot_table(index=DATE_COL, columns=unit_col, values=o, aggfunc="mean")
+                values[:, :, k] = Y.reindex(index=dates, columns=states).to_numpy(dtype=float)
+        return cls(values, dates, states, outcomes, unit_col=unit_col)
+
+    @classmethod
+    def read_parquet(cls, path, exclude_states: Optional[Iterable[str]] = None,
+                     outcomes: Optional[List[str]] = None, unit_col: str = STATE_COL) -> "PanelCube":
+        df = pd.read_parquet(Path(path))
+        if exclude_states:
+            df = df[~df[STATE_COL].isin(set(exclude_states))]
+        return cls.from_frame(df, outcomes=outcomes, unit_col=unit_col)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Long-format view (one row per date x state) for code that still wants a DataFrame."""
+        T, S, _ = self.values.shape
+        df = pd.DataFrame({
+            self.unit_col: np.tile(np.array(self.states, dtype=object), T),
+            DATE_COL: np.repeat(self.dates.to_numpy(), S),
+        })
+        for k, o in enumerate(self.outcomes):
+            df[o] = np.asarray(self.values[:, :, k]).reshape(-1)
+        return df
+
+    def rows(self, date_min=None, date_max=None) -> slice:
+        """Row slice covering [date_min..date_max] (inclusive, month resolution)."""
+        lo = 0 if date_min is None else int(np.searchsorted(self.months, month_index([mstart(date_min)])[0], "left"))
+        hi = len(self.months) if date_max is None else int(np.searchsorted(self.months, month_index([mstart(date_max)])[0], "right"))
+        return slice(lo, hi)
+
+    def state_positions(self, states: Iterable[str]) -> Tuple[List[str], np.ndarray]:
+        """Known states (sorted, like pivot_table columns) and their column indexes."""
+        req = np.unique(np.asarray(list(states), dtype=str))
+        if req.size == 0 or self._states_sorted.size == 0:
+            return [], np.array([], dtype=int)
+        j = np.searchsorted(self._states_sorted, req).clip(max=self._states_sorted.size - 1)
+        j = j[self._states_sorted[j] == req]
+        return self._states_sorted[j].tolist(), self._state_order[j].astype(int)
+
+    def subset(self, states: Iterable[str]) -> "PanelCube":
+        cols, idx = self.state_positions(states)
+        return PanelCube(self.values[:, idx, :], self.dates, cols, self.outcomes, unit_col=self.unit_col)
+
+    def series(self, state: str, outcome: str, date_min=None, date_max=None) -> pd.Series:
+        r = self.rows(date_min, date_max)
+        v = self.values[r, self.state_index[state], self.outcome_index[outcome]]
+        return pd.Series(np.asarray(v), index=self.dates[r], name=state)
+
+    def wide(self, states: Iterable[str], outcome: str, date_min, date_max
+             ) -> Tuple[pd.DatetimeIndex, List[str], np.ndarray]:
+        """
+        Array equivalent of build_wide(df, states, outcome, date_min, date_max):
+        states with no data for the outcome are dropped, as are dates where every
+        selected state is missing. Returns (dates, columns, matrix).
+        """
+        k = self.outcome_index[outcome]
+        cols, idx = self.state_positions(states)
+        keep = self.present[:, idx, k].any(axis=0)
+        cols = [c for c, ok in zip(cols, keep) if ok]
+        idx = idx[keep]
+
+        r = self.rows(date_min, date_max)
+        row_ok = self.present[r, :, k][:, idx].any(axis=1)
+        M = np.asarray(self.values[r, :, k][:, idx])[row_ok]
+        return self.dates[r][row_ok], cols, M
+
+
+def as_cube(panel, outcomes: Optional[List[str]] = None) -> PanelCube:
+    """Pass a PanelCube through; pivot a long DataFrame (only the requested outcomes)."""
+    if isinstance(panel, PanelCube):
+        return panel
+    return PanelCube.from_frame(panel, outcomes=outcomes)
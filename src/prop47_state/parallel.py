@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .panel import PanelCube, as_cube
+from .scm import FitResult, WideWindow, fit_one, placebo_event, placebo_row
+
+
+# Per-process state set by the pool initializer (the panel is attached once per
+# worker, never pickled per task).
+_WORKER: Dict[str, Any] = {}
+
+
+class SharedPanel:
+    """
+    PanelCube values written once to a temporary .npy file and memory-mapped
+    read-only by every worker. Use as a context manager; pool(jobs) returns a
+    ProcessPoolExecutor whose workers hold a PanelCube over the mapped array.
+    """
+
+    def __init__(self, panel: Union[pd.DataFrame, PanelCube], outcomes: Optional[Sequence[str]] = None):
+        cube = as_cube(panel, outcomes=list(dict.fromkeys(outcomes)) if outcomes else None)
+        self.states = cube.states
+        self.dates = cube.dates
+        self.outcomes = cube.outcomes
+        self.unit_col = cube.unit_col
+
+        self._tmp = tempfile.TemporaryDirectory(prefix="prop47_panel_")
+        self.path = Path(self._tmp.name) / "panel.npy"
+        np.save(self.path, np.asarray(cube.values))
+
+    def meta(self) -> Tuple[str, List[str], np.ndarray, List[str], str]:
+        return (str(self.path), self.states, self.dates.to_numpy(), self.outcomes, self.unit_col)
+
+    def pool(self, jobs: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=jobs, initializer=_attach, initargs=(self.meta(),))
+
+    def close(self) -> None:
+        self._tmp.cleanup()
+
+    def __enter__(self) -> "SharedPanel":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _attach(meta) -> None:
+    path, states, dates, outcomes, unit_col = meta
+    _WORKER.clear()
+    _WORKER["cube"] = PanelCube(np.load(path, mmap_mode="r"), dates, states, outcomes, unit_col=unit_col)
+    _WORKER["windows"] = {}
+
+
+def worker_cube() -> PanelCube:
+    """The PanelCube a SharedPanel.pool worker attached at startup (for task functions in other modules)."""
+    return _WORKER["cube"]
+
+
+# What a placebo task needs from its treated fit: outcome, window and penalty
+# (outcome, t0, pre_start, date_min, fit_end, full_end, penalty spec). Tasks
+# carry this instead of the FitResult, whose series and weights workers never read.
+PlaceboWindow = Tuple[str, pd.Timestamp, pd.Timestamp, pd.Timestamp, pd.Timestamp, pd.Timestamp, Any]
+
+
+def _placebo_window_key(tr: FitResult) -> PlaceboWindow:
+    return (tr.outcome, tr.t0, tr.pre_start, tr.date_min, tr.fit_end, tr.full_end, tr.penalty_spec)
+
+
+def _placebo_window(window: PlaceboWindow, donors_base: Tuple[str, ...]) -> WideWindow:
+    """Worker-side WideWindow for one treated fit's placebos, built once per worker."""
+    key = window[:6] + (donors_base,)
+    windows = _WORKER["windows"]
+    if key not in windows:
+        outcome, t0, pre_start, date_min, fit_end, full_end, _ = window
+        windows[key] = WideWindow.from_cube(_WORKER["cube"], list(donors_base), outcome,
+                                            t0, pre_start, date_min, fit_end, full_end)
+    return windows[key]
+
+
+def _fit_task(kwargs: Dict[str, Any]) -> Tuple[str, Any]:
+    try:
+        return ("ok", fit_one(_WORKER["cube"], **kwargs))
+    except Exception as e:
+        return ("error", e)
+
+
+def _placebo_task(task: Tuple[PlaceboWindow, Tuple[str, ...], str, int, str]) -> Tuple[str, Any, Dict[str, Any]]:
+    window, donors_base, s, min_donors, solver = task
+    try:
+        donors_s = [d for d in donors_base if d != s]
+        res = _placebo_window(window, donors_base).fit(s, donors_s, min_donors=min_donors, solver=solver,
+                                                       penalty=window[6])
+        return ("ok", placebo_row(res), placebo_event(s, res=res))
+    except Exception as e:
+        return ("error", str(e), placebo_event(s, error=e))
+
+
+def parallel_fits(ex: ProcessPoolExecutor, fit_kwargs: List[Dict[str, Any]]) -> List[FitResult]:
+    """Run fit_one for each kwargs dict in the pool; results come back in input order."""
+    out = []
+    for status, val in ex.map(_fit_task, fit_kwargs):
+        if status == "error":
+            raise val
+        out.append(val)
+    return out
+
+
+def parallel_placebos(ex: ProcessPoolExecutor, fits: List[FitResult], donors: List[List[str]],
+                      min_donors: int = 5, solver: str = "native",
+                      verbose: bool = False, chunksize: int = 4,
+                      logs: Optional[List[List[Dict[str, Any]]]] = None) -> List[pd.DataFrame]:
+    """
+    In-space placebos for several treated fits at once, one pool task per
+    (fit, placebo state). Returns one all_df per fit, rows in donors order,
+    matching placebo_batch / placebo_loop. Failures land on each fit's
+    placebo_failures; `logs`, if given, is extended with one event list per fit.
+    Tasks pickle only each fit's window and penalty, the donor tuple, the
+    placebo state, min_donors and the solver; the panel is the shared memmap.
+    """
+    tasks, owner = [], []
+    for i, (tr, donors_base) in enumerate(zip(fits, donors)):
+        window, donors_base = _placebo_window_key(tr), tuple(donors_base)
+        for s in donors_base:
+            tasks.append((window, donors_base, s, min_donors, solver))
+            owner.append(i)
+
+    rows: List[List[Dict[str, Any]]] = [[] for _ in fits]
+    events: List[List[Dict[str, Any]]] = [[] for _ in fits]
+    for (_, _, s, _, _), i, (status, val, event) in zip(tasks, owner, ex.map(_placebo_task, tasks, chunksize=chunksize)):
+        events[i].append(event)
+        if status == "error":
+            fits[i].placebo_failures[s] = val
+            if verbose:
+                print(f"Skipping placebo {s}: {val}")
+            continue
+        rows[i].append(val)
+    if logs is not None:
+        logs.extend(events)
+    return [pd.DataFrame(r).dropna() for r in rows]
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .simplex import SolverInfo, simplex_lsq
+
+
+PENALTIES = ("ridge", "pairwise", "augmented")
+# dimensionless penalty grid; 0 (plain SCM) is always a candidate
+DEFAULT_LAMBDAS = (0.0,) + tuple(float(x) for x in np.logspace(-4, 1, 16))
+
+
+@dataclass(frozen=True)
+class PenaltySpec:
+    """
+    Penalized SCM variant (one of PENALTIES) and how its penalty is set: a
+    fixed lam, or (lam=None) the value in lambdas with the lowest rolling-origin
+    CV error on the pre-period. CV folds train on the first e months of the
+    pre-period and score the next cv_horizon months, for cv_folds origins
+    e = T - k * cv_horizon that leave at least min_train training months.
+    """
+    kind: str
+    lam: Optional[float] = None
+    lambdas: Tuple[float, ...] = DEFAULT_LAMBDAS
+    cv_folds: int = 5
+    cv_horizon: int = 6
+    min_train: int = 24
+
+    def __post_init__(self) -> None:
+        if self.kind not in PENALTIES:
+            raise ValueError(f"Unknown penalty '{self.kind}' (expected one of {list(PENALTIES)})")
+        lambdas = tuple(sorted({float(x) for x in self.lambdas}))
+        if not lambdas or lambdas[0] < 0 or (self.lam is not None and self.lam < 0):
+            raise ValueError("Penalties must be >= 0 and lambdas non-empty.")
+        if self.cv_folds < 1 or self.cv_horizon < 1 or self.min_train < 1:
+            raise ValueError("cv_folds, cv_horizon and min_train must be >= 1.")
+        object.__setattr__(self, "lambdas", lambdas)
+        if self.lam is not None:
+            object.__setattr__(self, "lam", float(self.lam))
+
+
+def as_penalty(penalty: Union[None, str, PenaltySpec]) -> Optional[PenaltySpec]:
+    """None, a PenaltySpec, or a kind name (CV over DEFAULT_LAMBDAS)."""
+    if penalty is None or isinstance(penalty, PenaltySpec):
+        return penalty
+    return PenaltySpec(str(penalty))
+
+
+@dataclass
+class PenaltyPath:
+    spec: PenaltySpec
+    lam: float                 # chosen penalty
+    lambdas: np.ndarray        # path grid, ascending
+    cv_mse: np.ndarray         # rolling-origin CV mean squared error per lambda (NaN with a fixed lam)
+    pre_rmspe: np.ndarray      # pre-period RMSPE of the full pre-period fit per lambda
+    n_active: np.ndarray       # donors with |weight| > 1e-6 per lambda
+    weights: np.ndarray        # (n_lambdas, n_donors) full pre-period weights along the path
+    donors: List[str]
+    n_iter: int                # active-set iterations over every solve (CV folds and path)
+
+    def table(self) -> pd.DataFrame:
+        """One row per lambda: cv_mse, pre_rmspe, n_active and the chosen flag."""
+        return pd.DataFrame({
+            "lambda": self.lambdas,
+            "cv_mse": self.cv_mse,
+            "pre_rmspe": self.pre_rmspe,
+            "n_active": self.n_active,
+            "chosen": self.lambdas == self.lam,
+        })
+
+
+def weight_path(y: np.ndarray, X: np.ndarray, kind: str,
+                lambdas: Sequence[float]) -> Tuple[np.ndarray, List[SolverInfo], int]:
+    """
+    Donor weights for every lambda (ascending) on one pre-period (y: T, X: T x J).
+    Losses are scaled by var(y) as in WideWindow.fit, which makes lambda
+    dimensionless:
+      ridge:     ||y - Xw||^2 / var(y) + lam * T * ||w||^2
+      pairwise:  (||y - Xw||^2 + lam * sum_j w_j ||y - X_j||^2) / var(y)   (Abadie-L'Hour)
+    both on the simplex, each solve warm-started from the previous lambda's
+    weights. augmented is ridge-augmented SCM (Ben-Michael, Feller and
+    Rothstein): plain SCM weights plus the ridge correction
+    Xc'(Xc Xc' + lam * s2 I)^-1 (y - Xw), with Xc the donors centred on their
+    monthly mean and s2 the mean squared singular value of Xc. The
+    correction sums to zero, so weights still sum to 1 but may be negative;
+    one SCM solve and one SVD serve the whole path.
+    Returns (weights, SolverInfo per lambda, total active-set iterations).
+    """
+    T, J = X.shape
+    scale2 = float(np.var(y))
+    if not np.isfinite(scale2) or scale2 <= 0:
+        scale2 = 1.0
+    G = X.T @ X / scale2
+    c = X.T @ y / scale2
+
+    W = np.zeros((len(lambdas), J))
+    infos: List[SolverInfo] = []
+    if kind == "augmented":
+        w_scm, info = simplex_lsq(G, c)
+        Xc = X - X.mean(axis=1, keepdims=True)
+        U, S, Vt = np.linalg.svd(Xc, full_matrices=False)
+        keep = S > S[0] * 1e-10 if S.size and S[0] > 0 else np.zeros(S.size, dtype=bool)
+        U, S, Vt = U[:, keep], S[keep], Vt[keep]
+        s2 = float(np.mean(S**2)) if S.size else 1.0
+        Ur = U.T @ (y - X @ w_scm)
+        for k, lam in enumerate(lambdas):
+            W[k] = w_scm + Vt.T @ (S / (S**2 + lam * s2) * Ur)
+            infos.append(info)
+        return W, infos, info.n_iter
+
+    d = ((X - y[:, None]) ** 2).sum(axis=0) / scale2 if kind == "pairwise" else None
+    w = None
+    for k, lam in enumerate(lambdas):
+        if kind == "ridge":
+            w, info = simplex_lsq(G + lam * T * np.eye(J), c, w0=w)
+        else:
+            w, info = simplex_lsq(G, c - 0.5 * lam * d, w0=w)
+        W[k] = w
+        infos.append(info)
+    return W, infos, sum(i.n_iter for i in infos)
+
+
+def rolling_origin_cv(y: np.ndarray, X: np.ndarray, spec: PenaltySpec,
+                      lambdas: Sequence[float]) -> Tuple[np.ndarray, int]:
+    """
+    Mean squared error over the rolling origins of spec of each lambda's
+    weights, fitted on the months before the origin and scored on the next
+    cv_horizon months. Returns (cv_mse per lambda, total solver iterations).
+    """
+    T = y.size
+    h = spec.cv_horizon
+    ends = [T - k * h for k in range(spec.cv_folds, 0, -1) if T - k * h >= spec.min_train]
+    if not ends:
+        raise ValueError(f"Pre-period of {T} months too short for rolling-origin CV "
+                         f"(min_train={spec.min_train}, horizon={h}).")
+    mse = np.zeros(len(lambdas))
+    n_iter = 0
+    for e in ends:
+        W, _, it = weight_path(y[:e], X[:e], spec.kind, lambdas)
+        err = y[e:e + h, None] - X[e:e + h] @ W.T
+        mse += np.mean(err**2, axis=0)
+        n_iter += it
+    return mse / len(ends), n_iter
+
+
+def fit_penalized(y_pre: np.ndarray, X_pre: np.ndarray, spec: PenaltySpec,
+                  donors: List[str]) -> Tuple[np.ndarray, SolverInfo, PenaltyPath]:
+    """
+    Penalized weights on the full pre-period: the whole lambda path (or the
+    fixed lam), the CV choice among it, and the path for reporting. Ties in
+    CV error go to the larger (more regularized) lambda. The SolverInfo is
+    that of the chosen lambda's solve, with the objective the pre-period SSE
+    in original units.
+    """
+    y = np.asarray(y_pre, dtype=float)
+    X = np.asarray(X_pre, dtype=float)
+    lambdas = np.asarray(spec.lambdas if spec.lam is None else (spec.lam,), dtype=float)
+
+    n_iter = 0
+    cv_mse = np.full(lambdas.size, np.nan)
+    if spec.lam is None:
+        cv_mse, n_iter = rolling_origin_cv(y, X, spec, lambdas)
+        i = int(np.flatnonzero(cv_mse <= np.nanmin(cv_mse))[-1])
+    else:
+        i = 0
+
+    W, infos, it = weight_path(y, X, spec.kind, lambdas)
+    n_iter += it
+    R = y[:, None] - X @ W.T
+    path = PenaltyPath(
+        spec=spec, lam=float(lambdas[i]), lambdas=lambdas, cv_mse=cv_mse,
+        pre_rmspe=np.sqrt(np.mean(R**2, axis=0)),
+        n_active=(np.abs(W) > 1e-6).sum(axis=1),
+        weights=W, donors=list(donors), n_iter=n_iter,
+    )
+    info = replace(infos[i], solver=f"native-{spec.kind}", objective=float(R[:, i] @ R[:, i]))
+    return W[i], info, path
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import json
+import math
+from pathlib import Path
+import time
+from typing import Any, Dict, Iterable, Iterator, List
+
+import pandas as pd
+
+from .scm import FitResult, fit_record
+
+
+def _json_value(v: Any) -> Any:
+    # strict JSON has no NaN/Infinity
+    return None if isinstance(v, float) and not math.isfinite(v) else v
+
+
+class RunLog:
+    """
+    Structured run log written as JSON lines: stage timings ("stage"), per-fit
+    solver diagnostics ("fit"), per-placebo solves and failures
+    ("placebo_fit", "placebo_failure"). A disabled log records nothing, so
+    call sites can use it unconditionally.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.records: List[Dict[str, Any]] = []
+        self._t0 = time.perf_counter()
+
+    def add(self, event: str, **fields: Any) -> None:
+        if self.enabled:
+            self.records.append({"event": event, "elapsed": time.perf_counter() - self._t0, **fields})
+
+    @contextmanager
+    def stage(self, name: str, **fields: Any) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add("stage", stage=name, seconds=time.perf_counter() - t, **fields)
+
+    def fit(self, res: FitResult, **fields: Any) -> None:
+        if self.enabled:
+            self.add("fit", **fit_record(res), **fields)
+
+    def extend(self, events: Iterable[Dict[str, Any]], **fields: Any) -> None:
+        """Add events produced elsewhere (placebo_event dicts), tagging each with fields."""
+        for e in events:
+            e = dict(e)
+            self.add(e.pop("event"), **e, **fields)
+
+    def stage_totals(self) -> pd.DataFrame:
+        st = pd.DataFrame([r for r in self.records if r["event"] == "stage"])
+        if st.empty:
+            return pd.DataFrame(columns=["stage", "calls", "seconds"])
+        return (st.groupby("stage", sort=False)["seconds"].agg(calls="count", seconds="sum")
+                .reset_index().sort_values("seconds", ascending=False))
+
+    def write(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            for r in self.records:
+                f.write(json.dumps({k: _json_value(v) for k, v in r.items()}, default=str, allow_nan=False) + "\n")
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+import pandas as pd
+
+from .panel import DATE_COL, STATE_COL, mstart
+
+
+# Codes that are not US states (territories, malformed); never donors.
+NON_STATES = {"CZ", "PR", "GU", "VI"}
+
+POOLS = ("Pool0", "Pool1")
+
+# Pool exclusions from doc/data_qc_report.md, for panels built before the
+# state_qc table existed
+FALLBACK_EXCLUSIONS = {
+    "Pool0": frozenset({"AR", "HI", "IN", "MI", "MS", "MT", "NE", "NH", "NY", "OH", "PA", "SD", "UT", "WV", "OR",
+                        "CZ", "PR", "GU"}),
+}
+FALLBACK_EXCLUSIONS["Pool1"] = FALLBACK_EXCLUSIONS["Pool0"] | {"AZ", "TX"}
+
+# per-state streaming moments; "pre" moments feed the mean and the correlation
+_MOMENTS = ["n_months", "n_pre", "cov_pre_mean", "cov_pre_m2", "rate_pre_mean", "rate_pre_m2",
+            "cov_rate_pre_c", "cov_pre_min", "n_before", "cov_before_sum", "n_after", "cov_after_sum"]
+
+
+@dataclass(frozen=True)
+class QCRules:
+    """Donor-pool rules from doc/robustness_menu.md (DonorPool0 / DonorPool1)."""
+    pre_start: str = "2010-01-01"
+    t0: str = "2014-11-01"          # pre period is [pre_start, t0)
+    t0_late: str = "2015-01-01"     # coverage swing: mean over (t0_late, t0_late + window] ...
+    window: int = 12                # ... minus mean over [t0 - window, t0)
+    min_coverage_pre: float = 0.95
+    max_coverage_swing: float = 0.10
+    max_abs_corr: float = 0.5
+
+
+class StateQC:
+    """
+    Streaming per-state QC accumulators, fed state-month rows in any number of
+    batches (e.g. one raw year at a time while the panel is built); each
+    state-month must arrive exactly once. Pre-period means, variances and the
+    coverage/theft-rate co-moment are merged with Chan et al.'s pairwise
+    update, so batches never need to be concatenated or re-read.
+
+        qc = StateQC()
+        for part in partials:          # state_abb, date, total_pop, covered_pop, theft
+            qc.update(part)
+        state_qc = qc.table()
+    """
+
+    def __init__(self, rules: QCRules = QCRules()):
+        self.rules = rules
+        self._m = pd.DataFrame(columns=_MOMENTS, dtype=float)
+        self._m.index.name = STATE_COL
+        self._pre_lo, self._t0 = mstart(rules.pre_start), mstart(rules.t0)
+        self._before_lo = self._t0 - pd.DateOffset(months=rules.window)
+        t0_late = mstart(rules.t0_late)
+        self._after = (t0_late + pd.DateOffset(months=1), t0_late + pd.DateOffset(months=rules.window))
+
+    def update(self, part: pd.DataFrame) -> "StateQC":
+        """Add a batch of state-month sums (state_abb, date, total_pop, covered_pop, theft)."""
+        d = pd.DatetimeIndex(part[DATE_COL])
+        cov = (part["covered_pop"] / part["total_pop"]).to_numpy(dtype=float)
+        rate = np.where(part["covered_pop"] > 0, part["theft"] / part["covered_pop"] * 100000.0, np.nan)
+        pre = (d >= self._pre_lo) & (d < self._t0) & np.isfinite(cov) & np.isfinite(rate)
+        before = (d >= self._before_lo) & (d < self._t0) & np.isfinite(cov)
+        after = (d >= self._after[0]) & (d <= self._after[1]) & np.isfinite(cov)
+
+        b = pd.DataFrame({"state": part[STATE_COL].astype(str).to_numpy(), "pre": pre,
+                          "cov": np.where(pre, cov, np.nan), "rate": np.where(pre, rate, np.nan),
+                          "before": np.where(before, cov, 0.0), "after": np.where(after, cov, 0.0),
+                          "n_before": before, "n_after": after})
+        g = b.groupby("state", sort=True)
+        batch = pd.DataFrame({
+            "n_months": g.size(),
+            "n_pre": g["pre"].sum(),
+            "cov_pre_mean": g["cov"].mean(),
+            "rate_pre_mean": g["rate"].mean(),
+            "cov_pre_min": g["cov"].min(),
+            "n_before": g["n_before"].sum(),
+            "cov_before_sum": g["before"].sum(),
+            "n_after": g["n_after"].sum(),
+            "cov_after_sum": g["after"].sum(),
+        }).astype(float)
+        dc = b["cov"] - batch["cov_pre_mean"].reindex(b["state"]).to_numpy()
+        dr = b["rate"] - batch["rate_pre_mean"].reindex(b["state"]).to_numpy()
+        dev = pd.DataFrame({"state": b["state"], "cc": dc * dc, "rr": dr * dr, "cr": dc * dr}).groupby("state", sort=True)
+        batch["cov_pre_m2"] = dev["cc"].sum()
+        batch["rate_pre_m2"] = dev["rr"].sum()
+        batch["cov_rate_pre_c"] = dev["cr"].sum()
+        self._merge(batch.fillna({"cov_pre_mean": 0.0, "rate_pre_mean": 0.0}))
+        return self
+
+    def _merge(self, batch: pd.DataFrame) -> None:
+        states = self._m.index.union(batch.index)
+        a = self._m.reindex(states).fillna({c: 0.0 for c in _MOMENTS if c != "cov_pre_min"})
+        b = batch.reindex(states).fillna({c: 0.0 for c in _MOMENTS if c != "cov_pre_min"})
+
+        na, nb = a["n_pre"], b["n_pre"]
+        n = na + nb
+        w = (nb / n.where(n > 0)).fillna(0.0)
+        dc = b["cov_pre_mean"] - a["cov_pre_mean"]
+        dr = b["rate_pre_mean"] - a["rate_pre_mean"]
+        k = (na * nb / n.where(n > 0)).fillna(0.0)
+
+        m = a.copy()
+        for c in ("n_months", "n_pre", "n_before", "cov_before_sum", "n_after", "cov_after_sum"):
+            m[c] = a[c] + b[c]
+        m["cov_pre_mean"] = a["cov_pre_mean"] + dc * w
+        m["rate_pre_mean"] = a["rate_pre_mean"] + dr * w
+        m["cov_pre_m2"] = a["cov_pre_m2"] + b["cov_pre_m2"] + dc * dc * k
+        m["rate_pre_m2"] = a["rate_pre_m2"] + b["rate_pre_m2"] + dr * dr * k
+        m["cov_rate_pre_c"] = a["cov_rate_pre_c"] + b["cov_rate_pre_c"] + dc * dr * k
+        m["cov_pre_min"] = np.fmin(a["cov_pre_min"], b["cov_pre_min"])
+        self._m = m
+
+    def table(self) -> pd.DataFrame:
+        """
+        One row per state: the QC statistics, one flag per rule and the
+        DonorPool0 / DonorPool1 membership they imply (see pool_exclusions).
+        """
+        r, m = self.rules, self._m
+        n = m["n_pre"]
+        before = m["cov_before_sum"] / m["n_before"].where(m["n_before"] > 0)
+        after = m["cov_after_sum"] / m["n_after"].where(m["n_after"] > 0)
+        denom = np.sqrt(m["cov_pre_m2"] * m["rate_pre_m2"])
+        corr = m["cov_rate_pre_c"] / denom.where(denom > 0)
+
+        out = pd.DataFrame({
+            "n_months": m["n_months"].astype(int),
+            "n_pre": n.astype(int),
+            "mean_coverage_pre": m["cov_pre_mean"].where(n > 0),
+            "min_coverage_pre": m["cov_pre_min"],
+            "coverage_before": before,
+            "coverage_after": after,
+            "coverage_swing": after - before,
+            "corr_coverage_theft_pre": corr,
+        })
+        out["non_state"] = out.index.isin(NON_STATES)
+        out["low_coverage_pre"] = ~(out["mean_coverage_pre"] >= r.min_coverage_pre)
+        out["unstable_coverage"] = out["coverage_swing"].abs() > r.max_coverage_swing
+        out["high_corr_pre"] = out["corr_coverage_theft_pre"].abs() > r.max_abs_corr
+        out["Pool0"] = ~(out["non_state"] | out["low_coverage_pre"] | out["unstable_coverage"])
+        out["Pool1"] = out["Pool0"] & ~out["high_corr_pre"]
+        return out.rename_axis(STATE_COL).reset_index()
+
+
+def read_state_qc(path) -> pd.DataFrame:
+    return pd.read_parquet(Path(path))
+
+
+def pool_exclusions(state_qc: pd.DataFrame, pool: str = "Pool0", keep: Iterable[str] = ()) -> Set[str]:
+    """States outside the pool (never the ones in keep, e.g. the treated state)."""
+    if pool not in POOLS:
+        raise ValueError(f"Unknown QC pool '{pool}' (expected one of {POOLS})")
+    out = set(state_qc.loc[~state_qc[pool].astype(bool), STATE_COL].astype(str))
+    return out - set(keep)
+
+
+def fallback_exclusions(pool: str = "Pool0", keep: Iterable[str] = ()) -> Set[str]:
+    """pool_exclusions from FALLBACK_EXCLUSIONS, when there is no state_qc table."""
+    if pool not in POOLS:
+        raise ValueError(f"Unknown QC pool '{pool}' (expected one of {POOLS})")
+    return set(FALLBACK_EXCLUSIONS[pool]) - set(keep)
+
+
+def describe_pools(state_qc: pd.DataFrame) -> Dict[str, List[str]]:
+    """Excluded states per pool and rule, for build/run logs."""
+    t = state_qc.set_index(STATE_COL)
+    return {
+        "non_state": sorted(t.index[t["non_state"]]),
+        "low_coverage_pre": sorted(t.index[t["low_coverage_pre"]]),
+        "unstable_coverage": sorted(t.index[t["unstable_coverage"]]),
+        "high_corr_pre": sorted(t.index[t["high_corr_pre"]]),
+        "Pool0_excluded": sorted(t.index[~t["Pool0"]]),
+        "Pool1_excluded": sorted(t.index[~t["Pool1"]]),
+    }
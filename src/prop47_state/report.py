@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from .figures import FigureQueue
+from .profiling import RunLog
+from .robustness import LeaveOneOut
+from .scm import (
+    FitResult, placebo_filter_masks, placebo_pvalue_curve,
+    plot_gap, plot_gap_fan, plot_penalty_path, plot_placebo_hist, plot_pval_curve, plot_treated_vs_synth,
+)
+
+
+def write_spec_outputs(spec_id: str, tr: FitResult, pl_all: pd.DataFrame, mults: List[float],
+                       fig_dir: Path, tab_dir: Path,
+                       curve_mults: Optional[List[float]] = None,
+                       log: Optional[RunLog] = None,
+                       figures: Optional[FigureQueue] = None) -> List[Dict[str, Any]]:
+    """
+    Write one spec's artifacts (treated vs synth + gap plots, weights, placebo
+    tables and histograms per multiplier, optional p-value curve, penalty path
+    of a penalized fit) and return its all_specs_summary rows, one per
+    multiplier. Figures are queued on `figures` for a later render stage;
+    without a queue they are rendered before returning.
+
+    `log` times the table writes.
+    """
+    treated, outcome = tr.treated, tr.outcome
+    curve_mults = list(curve_mults or [])
+    log = log or RunLog(enabled=False)
+    fq = figures if figures is not None else FigureQueue()
+
+    # queue plots
+    fq.add(plot_treated_vs_synth, fig_dir / f"{spec_id}_treated_vs_synth.png",
+           res=tr, title=f"{spec_id}: {treated} vs Synthetic ({outcome})")
+    fq.add(plot_gap, fig_dir / f"{spec_id}_gap.png",
+           res=tr, title=f"{spec_id}: Gap ({treated} - Synth) ({outcome})")
+
+    # save weights
+    w_out = tr.weights.sort_values(ascending=False).reset_index()
+    w_out.columns = ["donor", "weight"]
+    w_out.to_csv(tab_dir / f"{spec_id}_weights.csv", index=False)
+
+    if tr.penalty is not None:
+        path = tr.penalty.table()
+        path.to_csv(tab_dir / f"{spec_id}_penalty_path.csv", index=False)
+        if path["cv_mse"].notna().any():
+            fq.add(plot_penalty_path, fig_dir / f"{spec_id}_penalty_path.png",
+                   path=path, title=f"{spec_id}: {tr.penalty.spec.kind} penalty path (lambda={tr.penalty.lam:g})")
+
+    # placebo filtering + p-values for every multiplier from the single placebo table
+    curve = placebo_pvalue_curve(pl_all, tr, list(mults) + curve_mults)
+    masks = placebo_filter_masks(pl_all, tr, mults)
+
+    if curve_mults:
+        curve_out = curve.iloc[len(mults):].reset_index(drop=True)
+        curve_out.to_csv(tab_dir / f"{spec_id}_pval_curve.csv", index=False)
+        fq.add(plot_pval_curve, fig_dir / f"{spec_id}_pval_curve.png",
+               curve=curve_out, title=f"{spec_id}: placebo p-value vs pre-RMSPE multiplier")
+
+    rows = []
+    for j, m in enumerate(mults):
+        pl_filt = pl_all[masks[j]].copy()
+        p1 = curve.at[j, "pval_ratio_post1"]
+        p2 = curve.at[j, "pval_ratio_post2"]
+
+        with log.stage("tables", spec_id=spec_id):
+            pl_all.to_csv(tab_dir / f"{spec_id}_placebos_all_m{m}.csv", index=False)
+            pl_filt.to_csv(tab_dir / f"{spec_id}_placebos_filt_m{m}.csv", index=False)
+
+        # placebo hists
+        if len(pl_filt) > 0:
+            fq.add(plot_placebo_hist, fig_dir / f"{spec_id}_hist_ratio_post1_m{m}.png",
+                   filt=pl_filt, treated_val=tr.ratio_post1, col="ratio_post1",
+                   title=f"{spec_id} ratio_post1 (m={m}) p={p1:.3f}")
+            fq.add(plot_placebo_hist, fig_dir / f"{spec_id}_hist_ratio_post2_m{m}.png",
+                   filt=pl_filt, treated_val=tr.ratio_post2, col="ratio_post2",
+                   title=f"{spec_id} ratio_post2 (m={m}) p={p2:.3f}")
+
+        rows.append({
+            "spec_id": f"{spec_id}_m{m}",
+            "outcome": outcome,
+            "t0": str(tr.t0.date()),
+            "pre_start": str(tr.pre_start.date()),
+            "date_min": str(tr.date_min.date()),
+            "fit_end": str(tr.fit_end.date()),
+            "full_end": str(tr.full_end.date()),
+            "n_donors_requested": len(tr.donors_requested),
+            "n_donors_complete_pre": len(tr.donors_complete_pre),
+            "n_donors_active": len(tr.donors_active),
+            "pre_rmspe": tr.pre_rmspe,
+            "post1_rmspe": tr.post1_rmspe,
+            "post2_rmspe": tr.post2_rmspe,
+            "ratio_post1": tr.ratio_post1,
+            "ratio_post2": tr.ratio_post2,
+            "avg_gap_post1": tr.avg_gap_post1,
+            "avg_gap_covid": tr.avg_gap_covid,
+            "avg_gap_post2": tr.avg_gap_post2,
+            "n_months_pre": tr.n_pre,
+            "n_months_post1": tr.n_post1,
+            "n_months_covid": tr.n_covid,
+            "n_months_post2": tr.n_post2,
+            "n_placebos": len(pl_all),
+            "n_placebos_filtered": len(pl_filt),
+            "pre_rmspe_mult": float(m),
+            "pval_ratio_post1": p1,
+            "pval_ratio_post2": p2,
+            "solver_status": tr.solver_status,
+        })
+        if tr.penalty is not None:
+            rows[-1].update({"penalty": tr.penalty.spec.kind, "penalty_lambda": tr.penalty.lam})
+
+    if figures is None:
+        fq.render()
+    return rows
+
+
+def write_loo_outputs(spec_id: str, tr: FitResult, loo: LeaveOneOut, fig_dir: Path, tab_dir: Path,
+                      figures: Optional[FigureQueue] = None) -> None:
+    """Write one spec's leave-one-out donor tables and the gap-fan figure (queued on `figures` if given)."""
+    loo.summary.to_csv(tab_dir / f"{spec_id}_loo_summary.csv", index=False)
+    loo.weights.to_csv(tab_dir / f"{spec_id}_loo_weights.csv", index=False)
+    loo.gaps.to_csv(tab_dir / f"{spec_id}_loo_gaps.csv", index=False)
+    fq = figures if figures is not None else FigureQueue()
+    fq.add(plot_gap_fan, fig_dir / f"{spec_id}_loo_gap_fan.png",
+           res=tr, gaps=loo.gaps, title=f"{spec_id}: leave-one-out gaps ({tr.treated}, {tr.outcome})")
+    if figures is None:
+        fq.render()
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Union
+
+import pandas as pd
+
+from .panel import PanelCube, as_cube
+from .scm import FitResult, WideWindow
+
+
+@dataclass
+class LeaveOneOut:
+    summary: pd.DataFrame   # one row per dropped donor: RMSPEs, ratios, avg gaps, error
+    weights: pd.DataFrame   # dropped_donor, donor, weight
+    gaps: pd.DataFrame      # dropped_donor, date, gap
+
+
+def _fit_solver(tr: FitResult) -> str:
+    """The SOLVERS entry tr was fitted with (SolverInfo names the backend, e.g. osqp or native-ridge)."""
+    info = tr.solver_info
+    return "cvxpy" if info is not None and not info.solver.startswith("native") else "native"
+
+
+def leave_one_out(panel: Union[pd.DataFrame, PanelCube], treated_res: FitResult,
+                  min_donors: int = 5) -> LeaveOneOut:
+    """
+    Drop each active (nonzero-weight) donor in turn and refit on the treated
+    fit's remaining complete donors, with the treated fit's solver. All refits
+    share one WideWindow (one Gram matrix); dropping a donor is a column mask,
+    and each solve is warm-started from the original weights without the
+    dropped donor; a penalized treated fit is refitted with its PenaltySpec.
+    Pass the spec's min_donors so a refit never uses fewer donors than the
+    treated fit allows; a refit that fails (e.g. too few donors left) is a
+    summary row with `error` and no weights or gaps.
+    """
+    tr = treated_res
+    cube = as_cube(panel, outcomes=[tr.outcome])
+    ww = WideWindow.from_cube(cube, [tr.treated] + list(tr.donors_complete_pre), tr.outcome,
+                              tr.t0, tr.pre_start, tr.date_min, tr.fit_end, tr.full_end)
+    solver = _fit_solver(tr)
+
+    summary, weights, gaps = [], [], []
+    for d in tr.donors_active:
+        donors_d = [x for x in tr.donors_complete_pre if x != d]
+        head = {"dropped_donor": d, "dropped_weight": float(tr.weights[d])}
+        try:
+            res = ww.fit(tr.treated, donors_d, min_donors=min_donors, solver=solver, w0=tr.weights.drop(d),
+                         penalty=tr.penalty_spec)
+        except ValueError as e:
+            summary.append({**head, "error": str(e)})
+            continue
+        summary.append({
+            **head,
+            "n_donors_active": len(res.donors_active),
+            "pre_rmspe": res.pre_rmspe,
+            "post1_rmspe": res.post1_rmspe,
+            "post2_rmspe": res.post2_rmspe,
+            "ratio_post1": res.ratio_post1,
+            "ratio_post2": res.ratio_post2,
+            "avg_gap_post1": res.avg_gap_post1,
+            "avg_gap_covid": res.avg_gap_covid,
+            "avg_gap_post2": res.avg_gap_post2,
+            "solver_status": res.solver_status,
+            "error": None,
+        })
+        weights.append(pd.DataFrame({"dropped_donor": d, "donor": res.weights.index, "weight": res.weights.to_numpy()}))
+        gaps.append(pd.DataFrame({"dropped_donor": d, "date": res.dates, "gap": res.gap}))
+
+    return LeaveOneOut(
+        summary=pd.DataFrame(summary),
+        weights=pd.concat(weights, ignore_index=True) if weights else pd.DataFrame(columns=["dropped_donor", "donor", "weight"]),
+        gaps=pd.concat(gaps, ignore_index=True) if gaps else pd.DataFrame(columns=["dropped_donor", "date", "gap"]),
+    )
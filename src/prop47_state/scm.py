@@ -1,37 +1,30 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional, Any
+import sys
+import time
+from typing import Dict, List, Tuple, Optional, Any, Union
 
 import numpy as np
 import pandas as pd
-import cvxpy as cp
-import matplotlib.pyplot as plt
+
+from .panel import (
+    DATE_COL, STATE_COL, PanelCube,
+    as_cube, mstart, normalize_panel_df,
+)
+from .penalized import PenaltyPath, PenaltySpec, as_penalty, fit_penalized
+from .simplex import SolverInfo, simplex_lsq, simplex_lsq_design
 
 
 # -----------------------------
 # Config defaults (override in scripts)
 # -----------------------------
-STATE_COL = "state_abb"
-DATE_COL = "date"
-
 COVID_START = pd.Timestamp("2020-03-01")
 COVID_END   = pd.Timestamp("2021-12-01")
 POST2_START = pd.Timestamp("2022-01-01")
 
 
-def mstart(x) -> pd.Timestamp:
-    return pd.to_datetime(x).to_period("M").to_timestamp()
-
-
-def normalize_panel_df(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df.columns = df.columns.astype(str).str.strip()
-    df[DATE_COL] = pd.to_datetime(df[DATE_COL]).dt.to_period("M").dt.to_timestamp()
-    return df
-
-
 def build_wide(df: pd.DataFrame, states: List[str], outcome: str,
                date_min: pd.Timestamp, date_max: pd.Timestamp) -> pd.DataFrame:
     sub = df[df[STATE_COL].isin(states)].copy()
@@ -40,11 +33,24 @@ def build_wide(df: pd.DataFrame, states: List[str], outcome: str,
     return Y.loc[date_min:date_max]
 
 
-def solve_scm_weights(y_pre: np.ndarray, X_pre: np.ndarray) -> Tuple[np.ndarray, str]:
+# native solves with more donors than this work on the design matrix instead of
+# forming the J x J Gram matrix (agency-level panels with thousands of donors)
+DENSE_GRAM_MAX_DONORS = 1000
+
+SOLVERS = ("cvxpy", "native")
+
+
+def solve_scm_weights_info(y_pre: np.ndarray, X_pre: np.ndarray, solver: str = "cvxpy",
+                           w0: Optional[np.ndarray] = None) -> Tuple[np.ndarray, SolverInfo]:
     """
     Minimize ||y - X w||^2 s.t. w>=0, sum(w)=1.
-    Returns (weights, status).
+    solver="cvxpy": OSQP (SCS fallback); solver="native": active-set on X'X (see simplex.py).
+    w0 optionally warm-starts either solver.
+    Returns (weights, SolverInfo); the reported objective is in the original units.
     """
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver '{solver}' (expected one of {SOLVERS})")
+
     y_pre = np.asarray(y_pre).reshape(-1)
     X_pre = np.asarray(X_pre)
 
@@ -64,29 +70,65 @@ def solve_scm_weights(y_pre: np.ndarray, X_pre: np.ndarray) -> Tuple[np.ndarray,
     y = y_pre / scale
     X = X_pre / scale
 
+    if solver == "native" and J > DENSE_GRAM_MAX_DONORS:
+        wv, info = simplex_lsq_design(X, y, w0=w0)
+    elif solver == "native":
+        wv, info = simplex_lsq(X.T @ X, X.T @ y, w0=w0)
+    else:
+        wv, info = _solve_cvxpy(y, X, w0)
+
+    wv = np.array(wv).reshape(-1)
+    wv[wv < 0] = 0.0
+    sm = float(wv.sum())
+    if sm <= 0:
+        raise ValueError("Degenerate weights (sum<=0).")
+    wv = wv / sm
+
+    info.objective = float(np.sum((y_pre - X_pre @ wv) ** 2))
+    return wv, info
+
+
+def _solve_cvxpy(y: np.ndarray, X: np.ndarray, w0: Optional[np.ndarray]) -> Tuple[np.ndarray, SolverInfo]:
+    import cvxpy as cp
+
+    J = X.shape[1]
     w = cp.Variable(J)
+    if w0 is not None:
+        w.value = np.asarray(w0, dtype=float).reshape(-1)
     obj = cp.Minimize(cp.sum_squares(y - X @ w))
     cons = [w >= 0, cp.sum(w) == 1]
     prob = cp.Problem(obj, cons)
 
     status = "unknown"
+    fallback = False
     try:
-        prob.solve(solver=cp.OSQP, verbose=False, max_iter=200000, eps_abs=1e-8, eps_rel=1e-8)
+        prob.solve(solver=cp.OSQP, verbose=False, max_iter=200000, eps_abs=1e-8, eps_rel=1e-8,
+                   warm_start=w0 is not None)
         status = prob.status
     except Exception:
+        fallback = True
         prob.solve(solver=cp.SCS, verbose=False, max_iters=200000, eps=1e-6)
         status = prob.status
 
     if w.value is None:
         raise ValueError(f"SCM optimization failed: status={status}")
 
-    wv = np.array(w.value).reshape(-1)
-    wv[wv < 0] = 0.0
-    sm = float(wv.sum())
-    if sm <= 0:
-        raise ValueError("Degenerate weights (sum<=0).")
+    stats = prob.solver_stats
+    n_iter = int(stats.num_iters) if stats is not None and stats.num_iters is not None else -1
+    return np.array(w.value).reshape(-1), SolverInfo(
+        solver="scs" if fallback else "osqp", status=status, n_iter=n_iter,
+        objective=np.nan, fallback=fallback,
+    )
+
 
-    return (wv / sm), status
+def solve_scm_weights(y_pre: np.ndarray, X_pre: np.ndarray, solver: str = "cvxpy",
+                      w0: Optional[np.ndarray] = None) -> Tuple[np.ndarray, str]:
+    """
+    Minimize ||y - X w||^2 s.t. w>=0, sum(w)=1.
+    Returns (weights, status).
+    """
+    w, info = solve_scm_weights_info(y_pre, X_pre, solver=solver, w0=w0)
+    return w, info.status
 
 
 @dataclass
@@ -127,6 +169,22 @@ class FitResult:
     n_covid: int
     n_post2: int
 
+    covid_rmspe: float = np.nan
+
+    # instrumentation: the weight solve, wall time of the whole fit, and (on a
+    # treated fit) placebo states that failed with their reason
+    solver_info: Optional[SolverInfo] = None
+    fit_seconds: float = np.nan
+    placebo_failures: Dict[str, str] = field(default_factory=dict)
+
+    # penalized fits only: the penalty path and the chosen penalty
+    penalty: Optional[PenaltyPath] = None
+
+    @property
+    def penalty_spec(self) -> Optional[PenaltySpec]:
+        """The penalty this fit used; placebos and refits of it reuse the same spec."""
+        return self.penalty.spec if self.penalty is not None else None
+
 
 def _segment_stats(dates: pd.DatetimeIndex, gap: np.ndarray,
                    start: pd.Timestamp, end: pd.Timestamp) -> Tuple[float, float, int]:
@@ -140,15 +198,18 @@ def _segment_stats(dates: pd.DatetimeIndex, gap: np.ndarray,
     return (rmspe, avg, int(g.size))
 
 
-def fit_one(df: pd.DataFrame, treated: str, outcome: str,
+def fit_one(df: Union[pd.DataFrame, PanelCube], treated: str, outcome: str,
             donors: List[str],
             pre_start, t0, date_min, fit_end, full_end,
-            min_donors: int = 5) -> FitResult:
+            min_donors: int = 5, solver: str = "cvxpy",
+            penalty: Union[None, str, PenaltySpec] = None) -> FitResult:
     """
     Fit weights using [date_min..fit_end], evaluate across [date_min..full_end].
     Donors must be complete in pre-period (and in the fit window for stability).
+    df is a PanelCube or a long state-month DataFrame (pivoted once here).
+    penalty selects a penalized variant (see WideWindow.fit).
     """
-    df = normalize_panel_df(df)
+    cube = as_cube(df, outcomes=[outcome])
 
     t0 = mstart(t0)
     pre_start = mstart(pre_start)
@@ -159,59 +220,20 @@ def fit_one(df: pd.DataFrame, treated: str, outcome: str,
     if not (pre_start < t0):
         raise ValueError(f"Bad window: pre_start={pre_start} must be < t0={t0}")
 
-    states = [treated] + list(donors)
-
-    # Build fit window panel
-    Y_fit = build_wide(df, states, outcome, date_min, fit_end)
-    if treated not in Y_fit.columns:
-        raise ValueError(f"Treated '{treated}' missing from panel (fit window).")
+    ww = WideWindow.from_cube(cube, [treated] + list(donors), outcome, t0, pre_start, date_min, fit_end, full_end)
+    return ww.fit(treated, list(donors), min_donors=min_donors, solver=solver, penalty=penalty)
 
-    pre_mask = (Y_fit.index >= pre_start) & (Y_fit.index < t0)
-    if int(pre_mask.sum()) == 0:
-        raise ValueError("No pre-period rows after date filtering.")
-
-    # treated must be finite in pre
-    if not np.all(np.isfinite(Y_fit.loc[pre_mask, treated].to_numpy())):
-        raise ValueError("Treated has non-finite values in pre-period (NaN/Inf).")
-
-    # donors complete in pre and fit window (more stable)
-    donors_complete = []
-    for d in donors:
-        if d not in Y_fit.columns:
-            continue
-        col = Y_fit[d].to_numpy()
-        if np.all(np.isfinite(Y_fit.loc[pre_mask, d].to_numpy())) and np.all(np.isfinite(col)):
-            donors_complete.append(d)
-
-    if len(donors_complete) < min_donors:
-        raise ValueError(f"Too few complete donors in fit window: {len(donors_complete)} (<{min_donors}).")
-
-    y_pre = Y_fit.loc[pre_mask, treated].to_numpy()
-    X_pre = Y_fit.loc[pre_mask, donors_complete].to_numpy()
-
-    w, status = solve_scm_weights(y_pre, X_pre)
-    w_ser = pd.Series(w, index=donors_complete).sort_values(ascending=False)
-
-    # Keep only active donors (sparse weights are normal)
-    active = w_ser[w_ser > 1e-6].index.tolist()
-    if len(active) == 0:
-        # fall back to all
-        active = donors_complete
-
-    # Build full window for evaluation
-    Y_full = build_wide(df, [treated] + active, outcome, date_min, full_end)
-
-    # require treated present
-    if treated not in Y_full.columns:
-        raise ValueError("Treated missing in full window (unexpected).")
-
-    # only evaluate on rows where treated + all active donors are finite
-    Y_full2 = Y_full[[treated] + active].dropna(axis=0, how="any")
-    dates = Y_full2.index
-
-    y = Y_full2[treated].to_numpy()
-    X = Y_full2[active].to_numpy()
 
+def _fit_result(treated: str, outcome: str, t0: pd.Timestamp, pre_start: pd.Timestamp,
+                date_min: pd.Timestamp, fit_end: pd.Timestamp, full_end: pd.Timestamp,
+                donors: List[str], donors_complete: List[str], w_ser: pd.Series,
+                active: List[str], status: str,
+                dates: pd.DatetimeIndex, y: np.ndarray, X: np.ndarray,
+                solver_info: Optional[SolverInfo] = None) -> FitResult:
+    """
+    Shared tail of every fit (WideWindow.fit): renormalize weights over the active
+    donors and compute segment stats on the evaluation rows (dates, y, X[:, active]).
+    """
     # align weights to active donor order
     w_active = w_ser.reindex(active).fillna(0.0).to_numpy()
     sm = float(w_active.sum())
@@ -222,9 +244,7 @@ def fit_one(df: pd.DataFrame, treated: str, outcome: str,
     y_synth = X @ w_active
     gap = y - y_synth
 
-    # Segment stats
-    pre_rmspe, _, n_pre = _segment_stats(dates, gap, pre_start, t0 - pd.offsets.MonthBegin(0) - pd.offsets.Day(1))
-    # easier: define pre_end as last month before t0
+    # Segment stats; pre_end is the last month before t0
     pre_end = (t0 - pd.offsets.MonthBegin(1))
     pre_rmspe, _, n_pre = _segment_stats(dates, gap, pre_start, pre_end)
 
@@ -254,20 +274,28 @@ def fit_one(df: pd.DataFrame, treated: str, outcome: str,
         avg_gap_covid=float(avg_covid) if np.isfinite(avg_covid) else np.nan,
         avg_gap_post2=float(avg_post2) if np.isfinite(avg_post2) else np.nan,
         n_pre=n_pre, n_post1=n_post1, n_covid=n_covid, n_post2=n_post2,
+        covid_rmspe=float(covid_rmspe),
+        solver_info=solver_info,
     )
 
 
-def placebo_loop(df: pd.DataFrame, treated_res: FitResult,
+def placebo_loop(df: Union[pd.DataFrame, PanelCube], treated_res: FitResult,
                  donors_base: List[str],
                  pre_rmspe_mult: float = 2.0,
                  min_donors: int = 5,
-                 verbose: bool = False) -> Tuple[pd.DataFrame, pd.DataFrame, float, float]:
+                 verbose: bool = False,
+                 solver: str = "cvxpy",
+                 log: Optional[List[Dict[str, Any]]] = None) -> Tuple[pd.DataFrame, pd.DataFrame, float, float]:
     """
     In-space placebos:
       - treat each donor s as treated at same t0 with donors_base \ {s}
       - filter by pre_rmspe <= mult * treated_pre_rmspe
       - compute pvals for ratio_post1 and ratio_post2
+    Failed placebos are recorded in treated_res.placebo_failures; `log`, if
+    given, receives one placebo_event per placebo. A penalized treated fit's
+    placebos use the same PenaltySpec (each with its own CV choice).
     """
+    df = as_cube(df, outcomes=[treated_res.outcome])
     rows = []
     for s in donors_base:
         donors_s = [d for d in donors_base if d != s]
@@ -276,7 +304,7 @@ def placebo_loop(df: pd.DataFrame, treated_res: FitResult,
                 df, treated=s, outcome=treated_res.outcome, donors=donors_s,
                 pre_start=treated_res.pre_start, t0=treated_res.t0,
                 date_min=treated_res.date_min, fit_end=treated_res.fit_end, full_end=treated_res.full_end,
-                min_donors=min_donors,
+                min_donors=min_donors, solver=solver, penalty=treated_res.penalty_spec,
             )
             rows.append({
                 "state": s,
@@ -285,11 +313,26 @@ def placebo_loop(df: pd.DataFrame, treated_res: FitResult,
                 "ratio_post2": res_s.ratio_post2,
             })
         except Exception as e:
+            treated_res.placebo_failures[s] = str(e)
+            if log is not None:
+                log.append(placebo_event(s, error=e))
             if verbose:
                 print(f"Skipping placebo {s}: {e}")
             continue
+        if log is not None:
+            log.append(placebo_event(s, res=res_s))
 
     all_df = pd.DataFrame(rows).dropna()
+    filt, p1, p2 = placebo_pvalues(all_df, treated_res, pre_rmspe_mult)
+    return all_df, filt, p1, p2
+
+
+def placebo_pvalues(all_df: pd.DataFrame, treated_res: FitResult,
+                    pre_rmspe_mult: float) -> Tuple[pd.DataFrame, float, float]:
+    """
+    Filter placebos by pre_rmspe <= mult * treated_pre_rmspe and compute
+    rank p-values for ratio_post1 / ratio_post2. Returns (filt, p1, p2).
+    """
     thr = float(pre_rmspe_mult) * float(treated_res.pre_rmspe)
     filt = all_df[all_df["pre_rmspe"] <= thr].copy()
 
@@ -302,13 +345,281 @@ def placebo_loop(df: pd.DataFrame, treated_res: FitResult,
 
     p1 = pval("ratio_post1", treated_res.ratio_post1)
     p2 = pval("ratio_post2", treated_res.ratio_post2)
+    return filt, p1, p2
+
+
+def placebo_batch(df: Union[pd.DataFrame, PanelCube], treated_res: FitResult,
+                  donors_base: List[str],
+                  pre_rmspe_mult: float = 2.0,
+                  min_donors: int = 5,
+                  verbose: bool = False,
+                  solver: str = "native") -> Tuple[pd.DataFrame, pd.DataFrame, float, float]:
+    """
+    Same placebos and outputs as placebo_loop, from one shared dates x states matrix:
+      - one pivot over donors_base for [date_min..full_end]
+      - completeness screening done once per column
+      - each placebo's leave-self-out donor matrix is a column mask, and with
+        solver="native" all placebos share one pre-period Gram matrix
+    """
+    all_df = placebo_fits(df, treated_res, donors_base, min_donors=min_donors, verbose=verbose, solver=solver)
+    filt, p1, p2 = placebo_pvalues(all_df, treated_res, pre_rmspe_mult)
     return all_df, filt, p1, p2
 
 
+def placebo_fits(df: Union[pd.DataFrame, PanelCube], treated_res: FitResult,
+                 donors_base: List[str],
+                 min_donors: int = 5,
+                 verbose: bool = False,
+                 solver: str = "native",
+                 log: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+    """
+    Fitting half of placebo_batch: one row per successful placebo
+    (state, pre_rmspe, ratio_post1, ratio_post2). Independent of pre_rmspe_mult,
+    so it can be computed once and filtered for any number of multipliers.
+    Failures, log and penalties work as in placebo_loop.
+    """
+    ww = WideWindow.for_placebos(as_cube(df, outcomes=[treated_res.outcome]), treated_res, donors_base)
+
+    rows = []
+    for s in donors_base:
+        donors_s = [d for d in donors_base if d != s]
+        try:
+            res_s = ww.fit(s, donors_s, min_donors=min_donors, solver=solver, penalty=treated_res.penalty_spec)
+        except Exception as e:
+            treated_res.placebo_failures[s] = str(e)
+            if log is not None:
+                log.append(placebo_event(s, error=e))
+            if verbose:
+                print(f"Skipping placebo {s}: {e}")
+            continue
+        if log is not None:
+            log.append(placebo_event(s, res=res_s))
+        rows.append(placebo_row(res_s))
+
+    return pd.DataFrame(rows).dropna()
+
+
+def placebo_filter_masks(all_df: pd.DataFrame, treated_res: FitResult,
+                         mults: List[float]) -> np.ndarray:
+    """(n_mults, n_placebos) mask of pre_rmspe <= mult * treated_pre_rmspe."""
+    thr = np.asarray(mults, dtype=float) * float(treated_res.pre_rmspe)
+    pre = all_df["pre_rmspe"].to_numpy(dtype=float) if len(all_df) else np.zeros(0)
+    return pre[None, :] <= thr[:, None]
+
+
+def placebo_pvalue_curve(all_df: pd.DataFrame, treated_res: FitResult,
+                         mults: List[float]) -> pd.DataFrame:
+    """
+    Vectorized placebo_pvalues over many multipliers from one placebo table.
+    Returns one row per multiplier: pre_rmspe_mult, n_placebos_filtered,
+    pval_ratio_post1, pval_ratio_post2 (same values placebo_pvalues gives).
+    """
+    mask = placebo_filter_masks(all_df, treated_res, mults)
+    out = pd.DataFrame({
+        "pre_rmspe_mult": np.asarray(mults, dtype=float),
+        "n_placebos_filtered": mask.sum(axis=1),
+    })
+    for col, treated_val in (("ratio_post1", treated_res.ratio_post1), ("ratio_post2", treated_res.ratio_post2)):
+        vals = all_df[col].to_numpy(dtype=float) if len(all_df) else np.zeros(0)
+        ok = mask & np.isfinite(vals)[None, :]
+        n = ok.sum(axis=1)
+        n_ge = (ok & (vals >= treated_val)[None, :]).sum(axis=1)
+        p = (1 + n_ge) / (1 + n)
+        out[f"pval_{col}"] = np.where((n > 0) & np.isfinite(treated_val), p, np.nan)
+    return out
+
+
+def placebo_row(res: FitResult) -> Dict[str, Any]:
+    return {
+        "state": res.treated,
+        "pre_rmspe": res.pre_rmspe,
+        "ratio_post1": res.ratio_post1,
+        "ratio_post2": res.ratio_post2,
+    }
+
+
+def fit_record(res: FitResult) -> Dict[str, Any]:
+    """Solver diagnostics and timing of one fit, flat and JSON-ready."""
+    info = res.solver_info
+    return {
+        "treated": res.treated,
+        "outcome": res.outcome,
+        "solver": info.solver if info else None,
+        "status": res.solver_status,
+        "n_iter": info.n_iter if info else None,
+        "objective": info.objective if info else None,
+        "fallback": info.fallback if info else None,
+        "kkt_residual": info.kkt_residual if info else None,
+        "n_donors_complete": len(res.donors_complete_pre),
+        "n_donors_active": len(res.donors_active),
+        "fit_seconds": res.fit_seconds,
+    }
+
+
+def placebo_event(state: str, res: Optional[FitResult] = None, error: Optional[BaseException] = None) -> Dict[str, Any]:
+    if res is None:
+        return {"event": "placebo_failure", "placebo": state, "reason": str(error)}
+    return {"event": "placebo_fit", "placebo": state, **fit_record(res)}
+
+
+class WideWindow:
+    """
+    Wide [date_min..full_end] x states matrix (as build_wide returns it) for one
+    outcome and window, plus the per-column screening and the pre-period Gram
+    matrix (built on first use, and only for fits with at most
+    DENSE_GRAM_MAX_DONORS donors). Every fit drawn from it (the treated fit,
+    each placebo) is column masking on the same arrays; fit() raises
+    ValueError for unusable fits.
+    """
+
+    def __init__(self, M: np.ndarray, dates: pd.DatetimeIndex, cols: List[str], outcome: str,
+                 t0: pd.Timestamp, pre_start: pd.Timestamp, date_min: pd.Timestamp,
+                 fit_end: pd.Timestamp, full_end: pd.Timestamp):
+        self.M = M
+        self.dates = dates
+        self.cols = list(cols)
+        self.col_idx = {c: i for i, c in enumerate(self.cols)}
+        cols_arr = np.asarray(self.cols, dtype=str)
+        self._col_order = np.argsort(cols_arr, kind="stable")
+        self._cols_sorted = cols_arr[self._col_order]
+        self.outcome = outcome
+        self.t0, self.pre_start = t0, pre_start
+        self.date_min, self.fit_end, self.full_end = date_min, fit_end, full_end
+
+        fit_rows = dates <= self.fit_end
+        self.pre_rows = fit_rows & (dates >= self.pre_start) & (dates < self.t0)
+        # a donor is usable if finite over the whole fit window (which contains pre)
+        self.complete = np.isfinite(M[fit_rows]).all(axis=0) & fit_rows.any()
+        self.pre_finite = np.isfinite(M[self.pre_rows]).all(axis=0)
+
+        self.X_pre = M[self.pre_rows]
+        self._G: Optional[np.ndarray] = None
+
+    @property
+    def G(self) -> np.ndarray:
+        """Pre-period Gram matrix X'X over all columns (non-finite cells as 0)."""
+        if self._G is None:
+            X0 = np.where(np.isfinite(self.X_pre), self.X_pre, 0.0)
+            self._G = X0.T @ X0
+        return self._G
+
+    def positions(self, names) -> np.ndarray:
+        """Column index of each name (-1 where absent), vectorized over the names."""
+        names = np.asarray(names, dtype=str)
+        if names.size == 0 or self._cols_sorted.size == 0:
+            return np.full(names.size, -1, dtype=int)
+        j = np.searchsorted(self._cols_sorted, names).clip(max=self._cols_sorted.size - 1)
+        return np.where(self._cols_sorted[j] == names, self._col_order[j], -1)
+
+    @classmethod
+    def from_cube(cls, cube: PanelCube, states: List[str], outcome: str,
+                  t0, pre_start, date_min, fit_end, full_end) -> "WideWindow":
+        dates, cols, M = cube.wide(states, outcome, date_min, full_end)
+        return cls(M, dates, cols, outcome, t0, pre_start, date_min, fit_end, full_end)
+
+    @classmethod
+    def for_placebos(cls, cube: PanelCube, treated_res: FitResult, donors_base: List[str]) -> "WideWindow":
+        tr = treated_res
+        return cls.from_cube(cube, list(donors_base), tr.outcome, tr.t0, tr.pre_start,
+                             tr.date_min, tr.fit_end, tr.full_end)
+
+    def fit(self, treated: str, donors: List[str], min_donors: int = 5, solver: str = "native",
+            w0: Optional[pd.Series] = None, penalty: Union[None, str, PenaltySpec] = None) -> FitResult:
+        """
+        w0 (weights indexed by donor) warm-starts the solve; donors missing from it start at 0.
+        penalty (a PenaltySpec or one of penalized.PENALTIES) fits ridge, pairwise
+        (Abadie-L'Hour) or augmented SCM weights instead, with the penalty path
+        and chosen penalty on FitResult.penalty; it always uses the dense native
+        solver, so solver and w0 are ignored.
+        """
+        penalty = as_penalty(penalty)
+        t_start = time.perf_counter()
+        if treated not in self.col_idx:
+            raise ValueError(f"Treated '{treated}' missing from panel (fit window).")
+        if not self.pre_rows.any():
+            raise ValueError("No pre-period rows after date filtering.")
+        si = self.col_idx[treated]
+        if not self.pre_finite[si]:
+            raise ValueError("Treated has non-finite values in pre-period (NaN/Inf).")
+
+        # donors complete in pre and fit window (more stable); one vectorized mask
+        pos = self.positions(donors)
+        keep = pos >= 0
+        keep[keep] = self.complete[pos[keep]]
+        di = pos[keep]
+        donors_complete = [d for d, k in zip(donors, keep) if k]
+        if len(donors_complete) < min_donors:
+            raise ValueError(f"Too few complete donors in fit window: {len(donors_complete)} (<{min_donors}).")
+
+        path = None
+        if penalty is not None:
+            if di.size > DENSE_GRAM_MAX_DONORS:
+                raise ValueError(f"Penalized SCM needs at most {DENSE_GRAM_MAX_DONORS} donors, got {di.size}.")
+            w, info, path = fit_penalized(self.X_pre[:, si], self.X_pre[:, di], penalty, donors_complete)
+        elif solver == "native":
+            scale2 = float(np.var(self.X_pre[:, si]))
+            if not np.isfinite(scale2) or scale2 <= 0:
+                scale2 = 1.0
+            w_start = None
+            if w0 is not None:
+                w_start = w0.reindex(donors_complete).fillna(0.0).to_numpy(dtype=float)
+                if w_start.sum() <= 0:
+                    w_start = None
+            if di.size > DENSE_GRAM_MAX_DONORS:
+                y_pre, X_pre = self.X_pre[:, si], self.X_pre[:, di]
+                scale = np.sqrt(scale2)
+                w, info = simplex_lsq_design(X_pre / scale, y_pre / scale, w0=w_start)
+                r = y_pre - X_pre @ w
+                info.objective = float(r @ r)
+            else:
+                G_dd, g_ds = self.G[np.ix_(di, di)], self.G[di, si]
+                w, info = simplex_lsq(G_dd / scale2, g_ds / scale2, w0=w_start)
+                # pre-period SSE in original units, as solve_scm_weights_info reports it
+                info.objective = float(self.G[si, si] - 2 * g_ds @ w + w @ G_dd @ w)
+        else:
+            w, info = solve_scm_weights_info(self.X_pre[:, si], self.X_pre[:, di], solver=solver)
+        status = info.status
+
+        w_ser = pd.Series(w, index=donors_complete).sort_values(ascending=False)
+
+        # Keep only active donors (sparse weights are normal; augmented SCM weights can be negative)
+        active = w_ser[w_ser.abs() > 1e-6].index.tolist()
+        if len(active) == 0:
+            # fall back to all
+            active = donors_complete
+
+        # only evaluate on rows where treated + all active donors are finite
+        ai = [self.col_idx[d] for d in active]
+        ok = ~np.isnan(self.M[:, [si] + ai]).any(axis=1)
+        res = _fit_result(
+            treated, self.outcome, self.t0, self.pre_start, self.date_min, self.fit_end, self.full_end,
+            donors=donors, donors_complete=donors_complete, w_ser=w_ser, active=active, status=status,
+            dates=self.dates[ok], y=self.M[ok, si], X=self.M[np.ix_(ok, ai)], solver_info=info,
+        )
+        res.penalty = path
+        res.fit_seconds = time.perf_counter() - t_start
+        return res
+
+
 # -----------------------------
 # Plotting helpers
 # -----------------------------
+
+def _pyplot():
+    """
+    pyplot, imported on first use so the fitting code (and pool workers) never
+    load matplotlib. Selects the non-interactive Agg backend unless pyplot is
+    already loaded (e.g. a notebook picked its own backend).
+    """
+    if "matplotlib.pyplot" not in sys.modules:
+        import matplotlib
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
 def plot_treated_vs_synth(res: FitResult, outpath: Path, title: str) -> None:
+    plt = _pyplot()
     outpath.parent.mkdir(parents=True, exist_ok=True)
     plt.figure()
     plt.plot(res.dates, res.y, label=res.treated)
@@ -322,6 +633,7 @@ def plot_treated_vs_synth(res: FitResult, outpath: Path, title: str) -> None:
 
 
 def plot_gap(res: FitResult, outpath: Path, title: str) -> None:
+    plt = _pyplot()
     outpath.parent.mkdir(parents=True, exist_ok=True)
     plt.figure()
     plt.plot(res.dates, res.gap)
@@ -335,6 +647,7 @@ def plot_gap(res: FitResult, outpath: Path, title: str) -> None:
 
 def plot_placebo_hist(filt: pd.DataFrame, treated_val: float, col: str,
                       outpath: Path, title: str) -> None:
+    plt = _pyplot()
     outpath.parent.mkdir(parents=True, exist_ok=True)
     vals = filt[col].to_numpy()
     vals = vals[np.isfinite(vals)]
@@ -346,3 +659,127 @@ def plot_placebo_hist(filt: pd.DataFrame, treated_val: float, col: str,
     plt.tight_layout()
     plt.savefig(outpath, dpi=200)
     plt.close()
+
+
+def plot_pval_curve(curve: pd.DataFrame, outpath: Path, title: str) -> None:
+    plt = _pyplot()
+    outpath.parent.mkdir(parents=True, exist_ok=True)
+    plt.figure()
+    plt.plot(curve["pre_rmspe_mult"], curve["pval_ratio_post1"], marker="o", label="ratio_post1")
+    plt.plot(curve["pre_rmspe_mult"], curve["pval_ratio_post2"], marker="o", label="ratio_post2")
+    plt.xlabel("pre-RMSPE multiplier")
+    plt.ylabel("placebo p-value")
+    plt.ylim(0, 1.05)
+    plt.title(title)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(outpath, dpi=200)
+    plt.close()
+
+
+def plot_panel_series(panel: Union[pd.DataFrame, PanelCube], states: List[str], outcome: str,
+                      outpath: Path, title: str, date_min=None, date_max=None) -> None:
+    plt = _pyplot()
+    cube = as_cube(panel, outcomes=[outcome])
+    outpath.parent.mkdir(parents=True, exist_ok=True)
+    plt.figure()
+    for st in states:
+        ser = cube.series(st, outcome, date_min, date_max)
+        plt.plot(ser.index, ser.to_numpy(), label=st)
+    plt.title(title)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(outpath, dpi=200)
+    plt.close()
+
+
+def plot_in_time_placebos(sweep: pd.DataFrame, outpath: Path, title: str) -> None:
+    plt = _pyplot()
+    outpath.parent.mkdir(parents=True, exist_ok=True)
+    fig, ax1 = plt.subplots()
+    ax1.plot(sweep["fake_t0"], sweep["ratio_post"], label="post/pre RMSPE")
+    ax1.set_ylabel("post/pre RMSPE ratio")
+    ax2 = ax1.twinx()
+    ax2.plot(sweep["fake_t0"], sweep["avg_gap_post"], linestyle="--", color="gray", label="avg post gap")
+    ax2.axhline(0, linewidth=1, color="gray")
+    ax2.set_ylabel("average fake-post gap")
+    ax1.set_title(title)
+    fig.tight_layout()
+    fig.savefig(outpath, dpi=200)
+    plt.close(fig)
+
+
+def plot_gap_fan(res: FitResult, gaps: pd.DataFrame, outpath: Path, title: str) -> None:
+    """Treated gap over leave-one-out gaps (long table: dropped_donor, date, gap)."""
+    plt = _pyplot()
+    outpath.parent.mkdir(parents=True, exist_ok=True)
+    plt.figure()
+    for d, g in gaps.groupby("dropped_donor", sort=False):
+        plt.plot(g["date"], g["gap"], color="gray", linewidth=0.8, alpha=0.7)
+    plt.plot(res.dates, res.gap, color="black", linewidth=1.5, label=f"{res.treated} (all donors)")
+    plt.axhline(0, linewidth=1)
+    plt.axvline(res.t0, linestyle="--")
+    plt.title(title)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(outpath, dpi=200)
+    plt.close()
+
+
+def plot_event_time(event_time: pd.DataFrame, outpath: Path, title: str) -> None:
+    """Mean gap by months since t0 across treated units, with a +/- 2 SE band (staggered.event_time_gaps)."""
+    plt = _pyplot()
+    outpath.parent.mkdir(parents=True, exist_ok=True)
+    et = event_time.sort_values("event_time")
+    x, m, se = et["event_time"].to_numpy(), et["mean_gap"].to_numpy(dtype=float), et["se_gap"].to_numpy(dtype=float)
+    plt.figure()
+    plt.fill_between(x, m - 2 * se, m + 2 * se, color="gray", alpha=0.3, linewidth=0)
+    plt.plot(x, m, color="black", linewidth=1.5, label="mean gap")
+    plt.axhline(0, linewidth=1)
+    plt.axvline(0, linestyle="--")
+    plt.xlabel("months since t0")
+    plt.title(title)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(outpath, dpi=200)
+    plt.close()
+
+
+def plot_penalty_path(path: pd.DataFrame, outpath: Path, title: str) -> None:
+    """CV and in-sample pre-period RMSPE along the penalty path (PenaltyPath.table()), chosen penalty marked."""
+    plt = _pyplot()
+    outpath.parent.mkdir(parents=True, exist_ok=True)
+    lam = path["lambda"].to_numpy(dtype=float)
+    plt.figure()
+    plt.plot(lam, np.sqrt(path["cv_mse"].to_numpy(dtype=float)), marker="o", label="rolling-origin CV RMSPE")
+    plt.plot(lam, path["pre_rmspe"].to_numpy(dtype=float), marker=".", label="pre-period RMSPE")
+    for x in lam[path["chosen"].to_numpy(dtype=bool)]:
+        plt.axvline(x, linestyle="--", color="gray")
+    pos = lam[lam > 0]
+    if pos.size:
+        plt.xscale("symlog", linthresh=float(pos.min()))
+    plt.xlabel("penalty (lambda)")
+    plt.title(title)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(outpath, dpi=200)
+    plt.close()
+
+
+def plot_conformal_curve(curve: pd.DataFrame, alpha: float, outpath: Path, title: str) -> None:
+    """p-value against the null effect theta, one line per (segment, scheme)."""
+    plt = _pyplot()
+    outpath.parent.mkdir(parents=True, exist_ok=True)
+    plt.figure()
+    for (seg, scheme), g in curve.groupby(["segment", "scheme"], sort=False):
+        plt.plot(g["theta"], g["pval"], linestyle="-" if scheme == "iid" else "--", label=f"{seg} ({scheme})")
+    plt.axhline(alpha, linewidth=1, color="gray")
+    plt.axvline(0, linewidth=1, color="gray")
+    plt.xlabel("null average effect (theta)")
+    plt.ylabel("conformal p-value")
+    plt.ylim(0, 1.05)
+    plt.title(title)
+    plt.legend()
+    plt.tight_layout()
+    plt.savefig(outpath, dpi=200)
+    plt.close()
@@ -0,0 +1,437 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import os
+import socketserver
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .cache import FitCache
+from .panel import PanelCube, mstart
+from .scm import SOLVERS, FitResult, fit_one, placebo_fits, placebo_pvalue_curve
+
+# Spec fields a query may set; anything else in the JSON body is rejected.
+QUERY_FIELDS = ("treated", "outcome", "t0", "pre_start", "date_min", "fit_end", "full_end",
+                "donors", "exclude", "min_donors", "solver", "mults", "series")
+_DATE_FIELDS = ("t0", "pre_start", "date_min", "fit_end", "full_end")
+
+DEFAULTS: Dict[str, Any] = {
+    "treated": "CA",
+    "outcome": "theft_per_100k_coveredpop",
+    "t0": "2014-11-01",
+    "pre_start": "2010-01-01",
+    "date_min": "2010-01-01",
+    "fit_end": "2019-12-01",
+    "full_end": "2024-12-01",
+    "min_donors": 5,
+    "solver": "native",
+    "mults": [2.0, 1.5],
+}
+
+
+def _json_ready(v: Any) -> Any:
+    # strict JSON: NaN/Infinity become null, numpy scalars plain Python
+    if isinstance(v, dict):
+        return {str(k): _json_ready(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_json_ready(x) for x in v]
+    if isinstance(v, np.ndarray):
+        return _json_ready(v.tolist())
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, float) and not math.isfinite(v):
+        return None
+    if isinstance(v, pd.Timestamp):
+        return str(v.date())
+    return v
+
+
+def _str_field(q: Dict[str, Any], k: str) -> str:
+    if not isinstance(q[k], str):
+        raise ValueError(f"{k}: expected a string, got {q[k]!r}")
+    return q[k]
+
+
+def _units_field(q: Dict[str, Any], k: str) -> List[str]:
+    v = q.get(k)
+    if v is None:
+        return []
+    if not isinstance(v, (list, tuple)) or not all(isinstance(s, str) for s in v):
+        raise ValueError(f"{k}: expected a list of unit codes, got {v!r}")
+    return list(v)
+
+
+def _min_donors_field(q: Dict[str, Any]) -> int:
+    v = q["min_donors"]
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)):
+        raise ValueError(f"min_donors: expected an integer, got {v!r}")
+    try:
+        n = float(v)
+    except ValueError:
+        raise ValueError(f"min_donors: expected an integer, got {v!r}") from None
+    if not n.is_integer() or n < 1:
+        raise ValueError(f"min_donors: expected an integer >= 1, got {v!r}")
+    return int(n)
+
+
+def _mults_field(q: Dict[str, Any]) -> List[float]:
+    v = q["mults"]
+    if not isinstance(v, (list, tuple)) or not v \
+            or not all(isinstance(m, (int, float)) and not isinstance(m, bool) for m in v):
+        raise ValueError(f"mults: expected a non-empty list of numbers, got {v!r}")
+    mults = [float(m) for m in v]
+    if not all(math.isfinite(m) and m > 0 for m in mults):
+        raise ValueError(f"mults: expected positive finite numbers, got {v!r}")
+    return mults
+
+
+class LRU:
+    """
+    Thread-safe least-recently-used map with single-flight computation:
+    concurrent get_or_compute calls for the same key run compute once, the
+    others wait for its result. Different keys compute concurrently.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = int(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Lock] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return True, self._data[key]
+            return False, None
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """(value, hit): the cached value, or compute() stored under key."""
+        found, value = self._lookup(key)
+        if not found:
+            with self._lock:
+                key_lock = self._inflight.setdefault(key, threading.Lock())
+            with key_lock:
+                found, value = self._lookup(key)
+                if not found:
+                    try:
+                        value = compute()
+                        with self._lock:
+                            self._data[key] = value
+                            while len(self._data) > self.maxsize:
+                                self._data.popitem(last=False)
+                    finally:
+                        with self._lock:
+                            self._inflight.pop(key, None)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value, found
+
+    def stats(self) -> Dict[str, Any]:
+        n = self.hits + self.misses
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / n if n else None}
+
+
+class SCMService:
+    """
+    One loaded panel answering fit / placebo / p-value queries. A query is a
+    dict of QUERY_FIELDS over DEFAULTS (or the defaults passed in): e.g.
+    {"t0": "2015-03-01", "exclude": ["AZ", "TX"]} refits the default spec with
+    a later t0 and two donors dropped. Donors default to every panel state but
+    the treated one. Treated fits and placebo tables are kept in in-memory
+    LRUs (and in the on-disk FitCache, if one is given); with jobs > 1 placebo
+    solves go to a process pool sharing the panel. Methods are thread-safe, so
+    concurrent requests solve concurrently. Bad queries raise ValueError.
+    """
+
+    def __init__(self, cube: PanelCube, defaults: Optional[Dict[str, Any]] = None,
+                 lru_size: int = 256, cache: Optional[FitCache] = None, jobs: int = 1):
+        self.cube = cube
+        self.defaults = {**DEFAULTS, **(defaults or {})}
+        self.cache = cache if cache is not None else FitCache()
+        self.fits = LRU(lru_size)
+        self.placebo_tables = LRU(lru_size)
+        self.jobs = jobs
+        self.verbose = False
+        self.started = time.time()
+        self._shared = self._pool = None
+        if jobs > 1:
+            from .parallel import SharedPanel
+
+            self._shared = SharedPanel(cube)
+            self._pool = self._shared.pool(jobs)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._shared.close()
+            self._pool = self._shared = None
+
+    # -- queries --
+
+    def spec(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Validated spec: defaults overlaid with the query, dates as month starts, donors resolved."""
+        unknown = sorted(set(query) - set(QUERY_FIELDS))
+        if unknown:
+            raise ValueError(f"Unknown query field(s) {unknown}; expected some of {list(QUERY_FIELDS)}")
+        q = {**self.defaults, **{k: v for k, v in query.items() if v is not None}}
+        for k in ("treated", "outcome", "solver"):
+            _str_field(q, k)
+
+        if q["outcome"] not in self.cube.outcome_index:
+            raise ValueError(f"Unknown outcome '{q['outcome']}'; panel has {self.cube.outcomes}")
+        if q["treated"] not in self.cube.state_index:
+            raise ValueError(f"Treated unit '{q['treated']}' not in panel")
+        if q["solver"] not in SOLVERS:
+            raise ValueError(f"Unknown solver '{q['solver']}' (expected one of {list(SOLVERS)})")
+        for k in _DATE_FIELDS:
+            try:
+                if not isinstance(q[k], str) or pd.isna(pd.to_datetime(q[k])):
+                    raise ValueError
+                q[k] = str(mstart(q[k]).date())
+            except (TypeError, ValueError):
+                raise ValueError(f"{k}: cannot parse date {q[k]!r}") from None
+
+        donors = _units_field(q, "donors") or [s for s in self.cube.states if s != q["treated"]]
+        unknown = sorted(set(donors) - set(self.cube.states))
+        if unknown:
+            raise ValueError(f"Donor(s) not in panel: {unknown}")
+        drop = set(_units_field(q, "exclude")) | {q["treated"]}
+        q["donors"] = sorted(set(donors) - drop)
+        q["min_donors"] = _min_donors_field(q)
+        q["mults"] = _mults_field(q)
+        return q
+
+    @staticmethod
+    def _fit_kwargs(q: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: q[k] for k in ("treated", "outcome", "donors", "pre_start", "t0", "date_min",
+                                  "fit_end", "full_end", "min_donors", "solver")}
+
+    def fit(self, query: Dict[str, Any]) -> Tuple[FitResult, bool]:
+        """(treated fit, served from the memory LRU or the disk cache rather than fitted)."""
+        kw = self._fit_kwargs(self.spec(query))
+        key = json.dumps(kw, sort_keys=True)
+
+        def compute() -> Tuple[FitResult, bool]:
+            ran = []
+
+            def run(kws):
+                ran.append(True)
+                return [fit_one(self.cube, **k) for k in kws]
+
+            return self.cache.fits(self.cube, [kw], run=run)[0], not ran
+
+        (tr, from_disk), hit = self.fits.get_or_compute(key, compute)
+        return tr, hit or from_disk
+
+    def placebos(self, query: Dict[str, Any]) -> Tuple[FitResult, pd.DataFrame, bool]:
+        """(treated fit, placebo table over its complete donors, placebo table served from memory or disk)."""
+        q = self.spec(query)
+        tr, _ = self.fit(query)
+        kw = self._fit_kwargs(q)
+        key = json.dumps(kw, sort_keys=True)
+
+        ran = []
+
+        def run(fits, donors, logs):
+            ran.append(True)
+            if self._pool is not None:
+                from .parallel import parallel_placebos
+
+                return parallel_placebos(self._pool, fits, donors, min_donors=q["min_donors"], solver=q["solver"])
+            return [placebo_fits(self.cube, treated_res=t, donors_base=d, min_donors=q["min_donors"],
+                                 solver=q["solver"]) for t, d in zip(fits, donors)]
+
+        def compute() -> Tuple[pd.DataFrame, bool]:
+            all_df = self.cache.placebos(self.cube, [tr], [tr.donors_complete_pre], q["min_donors"], q["solver"],
+                                         run=run)[0]
+            return all_df, not ran
+
+        (all_df, from_disk), hit = self.placebo_tables.get_or_compute(key, compute)
+        return tr, all_df, hit or from_disk
+
+    def pvalues(self, query: Dict[str, Any]) -> Tuple[FitResult, pd.DataFrame, bool]:
+        """(treated fit, placebo_pvalue_curve over the query's mults, placebo table served from memory or disk)."""
+        q = self.spec(query)
+        tr, all_df, hit = self.placebos(query)
+        return tr, placebo_pvalue_curve(all_df, tr, q["mults"]), hit
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "units": self.cube.states,
+            "unit_col": self.cube.unit_col,
+            "outcomes": self.cube.outcomes,
+            "date_min": str(self.cube.dates.min().date()) if len(self.cube.dates) else None,
+            "date_max": str(self.cube.dates.max().date()) if len(self.cube.dates) else None,
+            "defaults": self.defaults,
+            "jobs": self.jobs,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"uptime_seconds": time.time() - self.started, "fits": self.fits.stats(),
+                "placebos": self.placebo_tables.stats(), "disk_cache": self.cache.stats()}
+
+
+# -----------------------------
+# JSON payloads
+# -----------------------------
+
+def fit_payload(tr: FitResult, series: bool = True) -> Dict[str, Any]:
+    """JSON-ready treated fit: spec, fit statistics, weights and (series=True) the y / synth / gap paths."""
+    out = {
+        "treated": tr.treated,
+        "outcome": tr.outcome,
+        "t0": tr.t0,
+        "pre_start": tr.pre_start,
+        "date_min": tr.date_min,
+        "fit_end": tr.fit_end,
+        "full_end": tr.full_end,
+        "n_donors_requested": len(tr.donors_requested),
+        "n_donors_complete_pre": len(tr.donors_complete_pre),
+        "donors_active": tr.donors_active,
+        "weights": {s: float(w) for s, w in tr.weights.items()},
+        "solver_status": tr.solver_status,
+        "fit_seconds": tr.fit_seconds,
+    }
+    for k in ("pre_rmspe", "post1_rmspe", "covid_rmspe", "post2_rmspe", "ratio_post1", "ratio_post2",
+              "avg_gap_post1", "avg_gap_covid", "avg_gap_post2", "n_pre", "n_post1", "n_covid", "n_post2"):
+        out[k] = getattr(tr, k)
+    if series:
+        out["series"] = {"date": [str(d.date()) for d in tr.dates], "y": tr.y, "y_synth": tr.y_synth, "gap": tr.gap}
+    return out
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    return df.to_dict(orient="records")
+
+
+def _make_handler(service: SCMService):
+    routes_get = {
+        "/health": lambda: {"ok": True},
+        "/info": service.info,
+        "/stats": service.stats,
+    }
+
+    def _series(q) -> bool:
+        series = q.pop("series", None)
+        if series is not None and not isinstance(series, bool):
+            raise ValueError(f"series: expected true or false, got {series!r}")
+        return series is not False
+
+    def _fit(q):
+        series = _series(q)
+        tr, hit = service.fit(q)
+        return {"fit": fit_payload(tr, series=series), "cached": hit}
+
+    def _placebos(q):
+        _series(q)
+        tr, all_df, hit = service.placebos(q)
+        return {"fit": fit_payload(tr, series=False), "placebos": _records(all_df),
+                "placebo_failures": tr.placebo_failures, "cached": hit}
+
+    def _pvalues(q):
+        _series(q)
+        tr, curve, hit = service.pvalues(q)
+        return {"fit": fit_payload(tr, series=False), "pvalues": _records(curve), "cached": hit}
+
+    routes_post = {"/fit": _fit, "/placebos": _placebos, "/pvalues": _pvalues}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, code: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(_json_ready(body), allow_nan=False).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _dispatch(self, fn: Callable[[], Dict[str, Any]]) -> None:
+            t = time.perf_counter()
+            try:
+                body = fn()
+            except (ValueError, KeyError) as e:
+                self._send(400, {"error": f"{type(e).__name__}: {e}"})
+                return
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            body["seconds"] = time.perf_counter() - t
+            self._send(200, body)
+
+        def do_GET(self) -> None:
+            route = routes_get.get(self.path.split("?")[0])
+            if route is None:
+                self._send(404, {"error": f"No route GET {self.path}"})
+                return
+            self._dispatch(route)
+
+        def do_POST(self) -> None:
+            route = routes_post.get(self.path)
+            n = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(n) if n else b"{}"
+            if route is None:
+                self._send(404, {"error": f"No route POST {self.path}"})
+                return
+            try:
+                query = json.loads(raw or b"{}")
+                if not isinstance(query, dict):
+                    raise ValueError("query must be a JSON object")
+            except ValueError as e:
+                self._send(400, {"error": f"Bad JSON body: {e}"})
+                return
+            self._dispatch(lambda: route(query))
+
+        def address_string(self) -> str:
+            # Unix-socket peers have no (host, port)
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            if service.verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+
+def make_server(service: SCMService, host: str = "127.0.0.1", port: int = 8747,
+                socket_path: Optional[str] = None, verbose: bool = False):
+    """
+    HTTP server for the service: on host:port, or on a Unix socket when
+    socket_path is given (a stale socket file is replaced). One thread per
+    request. Routes: GET /health, /info, /stats; POST /fit, /placebos,
+    /pvalues with a JSON query body.
+    """
+    service.verbose = verbose
+    handler = _make_handler(service)
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return ThreadingUnixHTTPServer(socket_path, handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class SolverInfo:
+    solver: str
+    status: str
+    n_iter: int
+    objective: float
+    kkt: Dict[str, float] = field(default_factory=dict)
+    fallback: bool = False
+
+    @property
+    def kkt_residual(self) -> float:
+        return float(max(self.kkt.values())) if self.kkt else np.nan
+
+
+def project_simplex(v: np.ndarray) -> np.ndarray:
+    """Euclidean projection onto {w >= 0, sum(w) = 1} (sort-based, O(J log J))."""
+    v = np.asarray(v, dtype=float).reshape(-1)
+    u = np.sort(v)[::-1]
+    css = np.cumsum(u) - 1.0
+    k = np.arange(1, v.size + 1)
+    rho = int(np.nonzero(u - css / k > 0)[0][-1])
+    theta = css[rho] / (rho + 1)
+    return np.maximum(v - theta, 0.0)
+
+
+class _Gram:
+    """Explicit Gram matrix G = X'X (J x J)."""
+
+    def __init__(self, G: np.ndarray):
+        self.G = G
+
+    def sub(self, idx: np.ndarray) -> np.ndarray:
+        return self.G[np.ix_(idx, idx)]
+
+    def matvec(self, w: np.ndarray) -> np.ndarray:
+        return self.G @ w
+
+    def diag(self) -> np.ndarray:
+        return np.diag(self.G)
+
+
+class _Design:
+    """
+    Implicit Gram matrix X'X: only support blocks X_P'X_P and products
+    X'(X w) are formed, O(T J) per product instead of O(T J^2) + J^2 memory.
+    """
+
+    def __init__(self, X: np.ndarray):
+        self.X = X
+
+    def sub(self, idx: np.ndarray) -> np.ndarray:
+        Xi = self.X[:, idx]
+        return Xi.T @ Xi
+
+    def matvec(self, w: np.ndarray) -> np.ndarray:
+        nz = np.flatnonzero(w)
+        return self.X.T @ (self.X[:, nz] @ w[nz])
+
+    def diag(self) -> np.ndarray:
+        return np.einsum("tj,tj->j", self.X, self.X)
+
+
+def _solve_on_support(G, c: np.ndarray, P: np.ndarray) -> np.ndarray:
+    """
+    Equality-constrained LS on the support P:
+      min w'Gw - 2c'w  s.t. sum(w) = 1, w_j = 0 for j not in P.
+    Solved through the KKT system; lstsq keeps it usable when G_PP is singular.
+    G is a _Gram or _Design operator.
+    """
+    idx = np.flatnonzero(P)
+    k = idx.size
+    K = np.zeros((k + 1, k + 1))
+    K[:k, :k] = G.sub(idx)
+    K[:k, k] = 1.0
+    K[k, :k] = 1.0
+    rhs = np.concatenate([c[idx], [1.0]])
+    sol = np.linalg.lstsq(K, rhs, rcond=None)[0]
+    z = np.zeros_like(c)
+    z[idx] = sol[:k]
+    return z
+
+
+def kkt_residuals(G: np.ndarray, c: np.ndarray, w: np.ndarray, tol: float = 0.0) -> Dict[str, float]:
+    """
+    KKT residuals of min w'Gw - 2c'w s.t. w >= 0, sum(w) = 1, scaled by
+    1 + max|c| so they are comparable across problems.
+    """
+    return _kkt_from_gradient(G @ w - c, c, w, tol)
+
+
+def _kkt_from_gradient(g: np.ndarray, c: np.ndarray, w: np.ndarray, tol: float) -> Dict[str, float]:
+    P = w > tol
+    mu = -float(np.mean(g[P])) if P.any() else -float(np.min(g))
+    d = g + mu
+    scale = 1.0 + float(np.max(np.abs(c)))
+    return {
+        "primal_sum": float(abs(w.sum() - 1.0)),
+        "primal_nonneg": float(max(0.0, -w.min())),
+        "stationarity": float(np.max(np.abs(d[P]))) / scale if P.any() else 0.0,
+        "dual_feasibility": float(max(0.0, -d[~P].min())) / scale if (~P).any() else 0.0,
+        "complementarity": float(np.max(np.abs(w * d))) / scale,
+    }
+
+
+def simplex_lsq(G: np.ndarray, c: np.ndarray, w0: Optional[np.ndarray] = None,
+                tol: float = 1e-10, max_iter: Optional[int] = None) -> Tuple[np.ndarray, SolverInfo]:
+    """
+    Active-set (Lawson-Hanson style) solver for
+      min ||y - X w||^2  s.t. w >= 0, sum(w) = 1
+    given the Gram matrix G = X'X and c = X'y. Finite termination; each
+    iteration solves one small KKT system on the current support.
+
+    w0 warm-starts the support (projected onto the simplex first); otherwise
+    the best single donor is used. Returns (weights, SolverInfo) where the
+    objective is reported up to the constant y'y. status is "optimal" when
+    the KKT conditions hold, "stalled" when the anti-cycling guard stopped
+    the search first, and "max_iter" when the iteration budget ran out.
+    """
+    G = np.asarray(G, dtype=float)
+    c = np.asarray(c, dtype=float).reshape(-1)
+    J = c.size
+    if G.shape != (J, J):
+        raise ValueError(f"Gram shape {G.shape} does not match c of length {J}")
+    return _active_set(_Gram(G), c, w0, tol, max_iter)
+
+
+def simplex_lsq_design(X: np.ndarray, y: np.ndarray, w0: Optional[np.ndarray] = None,
+                       tol: float = 1e-10, max_iter: Optional[int] = None) -> Tuple[np.ndarray, SolverInfo]:
+    """
+    simplex_lsq on the design matrix X (T x J) and y instead of X'X and X'y,
+    for J in the thousands: X'X is never formed, each iteration costs O(T J)
+    plus a KKT solve on the support (at most T + 1 donors), and the weights
+    come back sparse. Same algorithm, warm start and SolverInfo.
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float).reshape(-1)
+    if X.ndim != 2 or X.shape[0] != y.size:
+        raise ValueError(f"Design shape {X.shape} does not match y of length {y.size}")
+    return _active_set(_Design(X), X.T @ y, w0, tol, max_iter)
+
+
+def _active_set(G, c: np.ndarray, w0: Optional[np.ndarray], tol: float,
+                max_iter: Optional[int]) -> Tuple[np.ndarray, SolverInfo]:
+    J = c.size
+    if max_iter is None:
+        max_iter = 50 * J + 100
+    diag = G.diag()
+
+    if w0 is not None and np.asarray(w0).size == J and np.all(np.isfinite(w0)):
+        w = project_simplex(w0)
+    else:
+        w = np.zeros(J)
+        w[int(np.argmin(diag - 2.0 * c))] = 1.0
+    P = w > 0
+
+    dual_tol = tol * (1.0 + float(np.max(np.abs(c))))
+    status = "max_iter"
+    n_iter = 0
+    last_added = -1
+    while n_iter < max_iter:
+        # inner loop: move toward the support optimum, dropping blocking coordinates
+        while n_iter < max_iter:
+            n_iter += 1
+            z = _solve_on_support(G, c, P)
+            if np.all(z[P] > 0):
+                w = z
+                break
+            blocking = P & (z <= 0)
+            alpha = float(np.min(w[blocking] / (w[blocking] - z[blocking])))
+            w = w + alpha * (z - w)
+            P = P & (w > tol)
+            w[~P] = 0.0
+            if not P.any():
+                # numerically degenerate step: restart from the best vertex
+                w[int(np.argmin(diag - 2.0 * c))] = 1.0
+                P = w > 0
+
+        g = G.matvec(w) - c
+        d = g - np.mean(g[P])
+        d[P] = np.inf
+        j = int(np.argmin(d))
+        if d[j] >= -dual_tol:
+            status = "optimal"
+            break
+        if j == last_added:
+            # anti-cycling guard: the coordinate just added is still the most
+            # violated, so stop without certifying optimality
+            status = "stalled"
+            break
+        P[j] = True
+        last_added = j
+
+    w = np.maximum(w, 0.0)
+    w = w / w.sum()
+    Gw = G.matvec(w)
+    info = SolverInfo(
+        solver="native", status=status, n_iter=n_iter,
+        objective=float(w @ Gw - 2.0 * c @ w),
+        kkt=_kkt_from_gradient(Gw - c, c, w, tol),
+    )
+    return w, info
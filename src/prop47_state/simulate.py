@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+from concurrent.futures import as_completed
+from dataclasses import asdict, dataclass
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import tempfile
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .hashing import update_hash
+from .panel import PanelCube, mstart
+from .scm import FitResult, WideWindow, placebo_fits, placebo_pvalue_curve
+
+# Bump when replication results would change for the same config (resume refuses other versions).
+SIM_VERSION = "1"
+CONFIG_FILE = "sim_config.json"
+PARTS_DIR = "reps"
+EFFECT_SHAPES = ("step", "ramp")
+
+_PART_RE = re.compile(r"^part-(\d+)-(\d+)\.parquet$")
+
+# per-process placebo tables, keyed by design (pool workers keep theirs across batches)
+_PLACEBOS: Dict[Tuple, pd.DataFrame] = {}
+
+
+@dataclass(frozen=True)
+class SimConfig:
+    """
+    One Monte Carlo study. Each replication draws a treated unit (`treated`, or
+    uniformly from the panel minus `exclude` when treated is None) and a t0
+    from `t0s`, then for every effect size adds effect x profile (+ noise) to
+    the treated outcome from t0 on and runs the fit and placebo test.
+
+    effects are fractions of the treated pre-period mean (relative=True) or
+    outcome units. shape "ramp" phases the effect in linearly over
+    ramp_months. noise_scale adds iid N(0, (noise_scale * treated pre-RMSPE)^2)
+    to every post-t0 month, the same draw for every effect size of a
+    replication (common random numbers). The placebo series get no noise, so
+    noise_scale > 0 raises the treated post/pre ratio under the null and
+    inflates the effect-0 rejection rate; it is off (0) by default.
+    """
+    outcome: str = "theft_per_100k_coveredpop"
+    treated: Optional[str] = "CA"
+    exclude: Tuple[str, ...] = ()
+    t0s: Tuple[str, ...] = ("2014-11-01",)
+    pre_start: str = "2010-01-01"
+    date_min: str = "2010-01-01"
+    fit_end: str = "2019-12-01"
+    full_end: str = "2024-12-01"
+    effects: Tuple[float, ...] = (0.0, 0.05, 0.10, 0.20)
+    relative: bool = True
+    shape: str = "step"
+    ramp_months: int = 12
+    noise_scale: float = 0.0
+    mults: Tuple[float, ...] = (2.0, 1.5)
+    min_donors: int = 5
+    solver: str = "native"
+    seed: int = 47
+    batch_size: int = 50
+
+    def __post_init__(self):
+        if self.shape not in EFFECT_SHAPES:
+            raise ValueError(f"Unknown effect shape '{self.shape}' (expected one of {EFFECT_SHAPES})")
+        if self.treated is not None and self.treated in self.exclude:
+            raise ValueError(f"Treated '{self.treated}' is also excluded")
+        if self.batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+
+
+# -----------------------------
+# One replication
+# -----------------------------
+
+def effect_profile(dates: pd.DatetimeIndex, t0, shape: str = "step", ramp_months: int = 12) -> np.ndarray:
+    """Effect multiplier per date: 0 before t0, then 1 (step) or k / ramp_months capped at 1 (ramp)."""
+    t0 = mstart(t0)
+    k = (dates.year - t0.year) * 12 + (dates.month - t0.month)
+    if shape == "step":
+        return (k >= 0).astype(float)
+    return np.where(k >= 0, np.minimum(1.0, (k + 1) / max(int(ramp_months), 1)), 0.0)
+
+
+def _draw(cfg: SimConfig, units: List[str], rep: int) -> Tuple[str, str, np.random.Generator]:
+    # one independent stream per replication: results do not depend on batching, order or jobs
+    rng = np.random.default_rng(np.random.SeedSequence([cfg.seed, rep]))
+    pool = [u for u in units if u not in set(cfg.exclude)]
+    treated = cfg.treated if cfg.treated is not None else pool[int(rng.integers(len(pool)))]
+    t0 = cfg.t0s[int(rng.integers(len(cfg.t0s)))]
+    return treated, t0, rng
+
+
+def _placebo_table(cube: PanelCube, cfg: SimConfig, base: FitResult,
+                   cache: Dict[Tuple, pd.DataFrame]) -> pd.DataFrame:
+    # the placebo pool excludes the treated unit, so its table does not depend on
+    # the injected effect or noise: one table per (treated, t0) design
+    key = (cfg.outcome, base.treated, base.t0, base.pre_start, base.date_min, base.fit_end, base.full_end,
+           tuple(base.donors_complete_pre), cfg.min_donors, cfg.solver)
+    if key not in cache:
+        cache[key] = placebo_fits(cube, treated_res=base, donors_base=base.donors_complete_pre,
+                                  min_donors=cfg.min_donors, solver=cfg.solver)
+    return cache[key]
+
+
+def replicate(cube: PanelCube, cfg: SimConfig, rep: int,
+              placebo_cache: Optional[Dict[Tuple, pd.DataFrame]] = None) -> List[Dict[str, Any]]:
+    """
+    Rows (one per effect x pre-RMSPE multiplier) for replication rep. Every
+    effect size is a full WideWindow fit on the injected series (warm-started
+    from the no-effect weights, which the pre-period data pins down), tested
+    against the design's placebo table. A failed fit gives rows with `error`.
+    """
+    units = cube.states
+    treated, t0, rng = _draw(cfg, units, rep)
+    donors = [u for u in units if u != treated and u not in set(cfg.exclude)]
+    head = {"rep": rep, "treated": treated, "t0": str(mstart(t0).date())}
+
+    try:
+        ww = WideWindow.from_cube(cube, [treated] + donors, cfg.outcome, mstart(t0), mstart(cfg.pre_start),
+                                  mstart(cfg.date_min), mstart(cfg.fit_end), mstart(cfg.full_end))
+        base = ww.fit(treated, donors, min_donors=cfg.min_donors, solver=cfg.solver)
+        all_df = _placebo_table(cube, cfg, base, placebo_cache if placebo_cache is not None else {})
+    except ValueError as e:
+        return [{**head, "effect": float(eff), "pre_rmspe_mult": float(m), "error": str(e)}
+                for eff in cfg.effects for m in cfg.mults]
+
+    si = ww.col_idx[treated]
+    post = ww.dates >= base.t0
+    profile = effect_profile(ww.dates[post], base.t0, cfg.shape, cfg.ramp_months)
+    noise = rng.standard_normal(int(post.sum())) * cfg.noise_scale * base.pre_rmspe
+    scale = float(np.mean(ww.X_pre[:, si])) if cfg.relative else 1.0
+
+    rows = []
+    for eff in cfg.effects:
+        M = ww.M.copy()
+        M[post, si] += float(eff) * scale * profile + noise
+        w = WideWindow(M, ww.dates, ww.cols, cfg.outcome, ww.t0, ww.pre_start, ww.date_min, ww.fit_end, ww.full_end)
+        try:
+            tr = w.fit(treated, donors, min_donors=cfg.min_donors, solver=cfg.solver, w0=base.weights)
+        except ValueError as e:
+            rows.extend({**head, "effect": float(eff), "pre_rmspe_mult": float(m), "error": str(e)} for m in cfg.mults)
+            continue
+        curve = placebo_pvalue_curve(all_df, tr, list(cfg.mults))
+        for j, m in enumerate(cfg.mults):
+            rows.append({
+                **head,
+                "effect": float(eff),
+                "effect_abs": float(eff) * scale,
+                "pre_rmspe_mult": float(m),
+                "n_placebos": len(all_df),
+                "n_placebos_filtered": int(curve.at[j, "n_placebos_filtered"]),
+                "pre_rmspe": tr.pre_rmspe,
+                "ratio_post1": tr.ratio_post1,
+                "ratio_post2": tr.ratio_post2,
+                "avg_gap_post1": tr.avg_gap_post1,
+                "pval_ratio_post1": float(curve.at[j, "pval_ratio_post1"]),
+                "pval_ratio_post2": float(curve.at[j, "pval_ratio_post2"]),
+                "error": None,
+            })
+    return rows
+
+
+_COLUMNS = ["rep", "treated", "t0", "effect", "effect_abs", "pre_rmspe_mult", "n_placebos", "n_placebos_filtered",
+            "pre_rmspe", "ratio_post1", "ratio_post2", "avg_gap_post1", "pval_ratio_post1", "pval_ratio_post2", "error"]
+
+
+def run_batch(cube: PanelCube, cfg: SimConfig, reps: Sequence[int],
+              placebo_cache: Optional[Dict[Tuple, pd.DataFrame]] = None) -> pd.DataFrame:
+    cache = placebo_cache if placebo_cache is not None else {}
+    rows = [r for rep in reps for r in replicate(cube, cfg, rep, cache)]
+    df = pd.DataFrame(rows, columns=_COLUMNS)
+    df["error"] = df["error"].fillna("").astype(str)
+    return df
+
+
+def _batch_task(task: Tuple[SimConfig, int, int]) -> Tuple[int, int, pd.DataFrame]:
+    from .parallel import worker_cube
+
+    cfg, start, stop = task
+    return start, stop, run_batch(worker_cube(), cfg, range(start, stop), _PLACEBOS)
+
+
+# -----------------------------
+# Resumable study
+# -----------------------------
+
+def panel_digest(cube: PanelCube) -> str:
+    h = hashlib.sha256()
+    update_hash(h, cube)
+    return h.hexdigest()[:16]
+
+
+# SimConfig fields that only schedule the work; every replication's draws and
+# results are the same whatever they are (see _draw), so resuming may change them
+_SCHEDULING_FIELDS = ("batch_size",)
+
+
+def _config_record(cfg: SimConfig, cube: PanelCube) -> Dict[str, Any]:
+    config = {k: v for k, v in asdict(cfg).items() if k not in _SCHEDULING_FIELDS}
+    return {"version": SIM_VERSION, "config": config, "panel": panel_digest(cube)}
+
+
+def done_reps(outdir) -> List[Tuple[int, int]]:
+    """Replication ranges [start, stop) already written under outdir/reps."""
+    d = Path(outdir) / PARTS_DIR
+    out = []
+    if d.exists():
+        for p in d.iterdir():
+            m = _PART_RE.match(p.name)
+            if m:
+                out.append((int(m.group(1)), int(m.group(2))))
+    return sorted(out)
+
+
+def _todo(n_reps: int, batch_size: int, done: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    covered = np.zeros(n_reps, dtype=bool)
+    for a, b in done:
+        covered[a:min(b, n_reps)] = True
+    out = []
+    for a in range(0, n_reps, batch_size):
+        missing = np.flatnonzero(~covered[a:a + batch_size]) + a
+        if missing.size:
+            # gaps inside a batch are contiguous in practice; split defensively
+            for run in np.split(missing, np.flatnonzero(np.diff(missing) > 1) + 1):
+                out.append((int(run[0]), int(run[-1]) + 1))
+    return out
+
+
+def _write_part(d: Path, start: int, stop: int, df: pd.DataFrame) -> None:
+    fd, tmp = tempfile.mkstemp(prefix=".part-", suffix=".tmp", dir=d)
+    os.close(fd)
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, d / f"part-{start:07d}-{stop:07d}.parquet")
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def read_results(outdir) -> pd.DataFrame:
+    """Every replication row written so far, ordered by rep."""
+    parts = [Path(outdir) / PARTS_DIR / f"part-{a:07d}-{b:07d}.parquet" for a, b in done_reps(outdir)]
+    if not parts:
+        return pd.DataFrame(columns=_COLUMNS)
+    df = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+    return df.sort_values(["rep", "effect", "pre_rmspe_mult"], kind="stable", ignore_index=True)
+
+
+def run_simulation(cube: PanelCube, cfg: SimConfig, n_reps: int, outdir, jobs: int = 1,
+                   verbose: bool = True) -> pd.DataFrame:
+    """
+    Run replications 0..n_reps-1 in batches of cfg.batch_size, writing each
+    finished batch to outdir/reps/part-{start}-{stop}.parquet (atomically) as
+    it completes. Rerunning with the same outdir skips replications already
+    on disk, so an interrupted study resumes, and a larger n_reps extends one.
+    outdir/sim_config.json pins the config and panel; a mismatch raises
+    ValueError. batch_size and jobs are not pinned, so a study may resume
+    with different ones. With jobs > 1 batches run in a process pool sharing the
+    panel. Returns read_results(outdir).
+    """
+    outdir = Path(outdir)
+    parts = outdir / PARTS_DIR
+    parts.mkdir(parents=True, exist_ok=True)
+
+    record = _config_record(cfg, cube)
+    cfg_path = outdir / CONFIG_FILE
+    if cfg_path.exists():
+        with open(cfg_path) as f:
+            old = json.load(f)
+        for k in _SCHEDULING_FIELDS:   # records written before they were left out
+            old.get("config", {}).pop(k, None)
+        if old != json.loads(json.dumps(record)):
+            raise ValueError(f"{outdir} holds a study with a different config or panel "
+                             f"(see {cfg_path}); use another outdir")
+    else:
+        with open(cfg_path, "w") as f:
+            json.dump(record, f, indent=1)
+
+    todo = _todo(n_reps, cfg.batch_size, done_reps(outdir))
+    n_todo = sum(b - a for a, b in todo)
+    if verbose:
+        print(f"Simulation {outdir}: {n_reps - n_todo}/{n_reps} replications on disk, {n_todo} to run "
+              f"in {len(todo)} batches (jobs={jobs})")
+
+    t, done = time.perf_counter(), 0
+
+    def _report(start: int, stop: int) -> None:
+        nonlocal done
+        done += stop - start
+        if verbose:
+            el = time.perf_counter() - t
+            print(f"  reps {start}-{stop - 1} done ({done}/{n_todo}, {el:.0f}s, "
+                  f"eta {el / done * (n_todo - done):.0f}s)")
+
+    if todo and jobs > 1:
+        from .parallel import SharedPanel
+
+        with SharedPanel(cube) as shared, shared.pool(jobs) as ex:
+            futures = [ex.submit(_batch_task, (cfg, a, b)) for a, b in todo]
+            for fut in as_completed(futures):
+                start, stop, df = fut.result()
+                _write_part(parts, start, stop, df)
+                _report(start, stop)
+    else:
+        cache: Dict[Tuple, pd.DataFrame] = {}
+        for a, b in todo:
+            _write_part(parts, a, b, run_batch(cube, cfg, range(a, b), cache))
+            _report(a, b)
+
+    return read_results(outdir)
+
+
+# -----------------------------
+# Summary
+# -----------------------------
+
+def rejection_rates(results: pd.DataFrame, alphas: Iterable[float] = (0.05, 0.10)) -> pd.DataFrame:
+    """
+    Rejection rate of the placebo test (p <= alpha) per effect size,
+    pre-RMSPE multiplier and alpha, for ratio_post1 and ratio_post2, with
+    Monte Carlo standard errors. Failed replications are counted
+    (n_failed), not rejected. The effect-0 rows are the test's size only when
+    the treated unit is drawn at random (SimConfig.treated=None) and
+    noise_scale is 0: with a fixed treated unit the effect is injected on top
+    of that unit's real post-t0 data, so effect 0 is its actual rejection rate
+    (including any real effect), not the size.
+    """
+    ok = results["error"] == ""
+    rows = []
+    for (eff, m), g in results.groupby(["effect", "pre_rmspe_mult"], sort=True):
+        good = g[ok.loc[g.index]]
+        n = len(good)
+        for a in alphas:
+            row = {"effect": eff, "pre_rmspe_mult": m, "alpha": float(a), "n_reps": n, "n_failed": len(g) - n}
+            for col in ("ratio_post1", "ratio_post2"):
+                p = good[f"pval_{col}"].to_numpy(dtype=float)
+                r = float(np.mean(p <= a)) if n else np.nan
+                row[f"reject_{col}"] = r
+                row[f"se_{col}"] = float(np.sqrt(r * (1 - r) / n)) if n else np.nan
+            row["mean_effect_abs"] = float(good["effect_abs"].mean()) if n else np.nan
+            # with k placebos kept the smallest attainable p-value is 1 / (k + 1)
+            row["mean_min_pval"] = float(np.mean(1.0 / (1.0 + good["n_placebos_filtered"]))) if n else np.nan
+            rows.append(row)
+    return pd.DataFrame(rows)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .panel import PanelCube, as_cube, mstart
+from .scm import FitResult, WideWindow
+
+
+@dataclass(frozen=True)
+class Assignment:
+    """One treated unit: its t0, optional donor pool (default: every panel unit) and pre_start."""
+    treated: str
+    t0: str
+    donors: Optional[Tuple[str, ...]] = None
+    pre_start: Optional[str] = None
+
+
+@dataclass
+class BatchFit:
+    summary: pd.DataFrame      # one row per assignment (input order): RMSPEs, ratios, avg gaps, error
+    weights: pd.DataFrame      # treated, t0, donor, weight
+    gaps: pd.DataFrame         # treated, t0, date, event_time, y, y_synth, gap
+    event_time: pd.DataFrame   # event_time: n_units, mean/median/sd/se of the gap and of gap / pre_rmspe
+    fits: List[Optional[FitResult]]
+
+
+_SUMMARY_FIELDS = ("pre_rmspe", "post1_rmspe", "covid_rmspe", "post2_rmspe", "ratio_post1", "ratio_post2",
+                   "avg_gap_post1", "avg_gap_covid", "avg_gap_post2", "solver_status", "fit_seconds")
+
+
+def as_assignments(items: Iterable[Union[Assignment, Tuple, Dict[str, Any]]]) -> List[Assignment]:
+    """Assignments from Assignment objects, (treated, t0[, donors[, pre_start]]) tuples or dicts."""
+    out = []
+    for a in items:
+        if isinstance(a, dict):
+            a = Assignment(**a)
+        elif not isinstance(a, Assignment):
+            a = Assignment(*a)
+        donors = tuple(a.donors) if a.donors is not None else None
+        out.append(Assignment(str(a.treated), str(mstart(a.t0).date()), donors,
+                              str(mstart(a.pre_start).date()) if a.pre_start is not None else None))
+    return out
+
+
+def donor_pools(assignments: Sequence[Assignment], units: Sequence[str], full_end,
+                exclude_treated: bool = True) -> List[List[str]]:
+    """
+    Each assignment's donors: its pool (or every unit) minus itself and, with
+    exclude_treated, minus every other treated unit whose t0 falls on or before
+    full_end (units first treated after the evaluation window stay usable).
+    """
+    full_end = mstart(full_end)
+    treated_in_window = {a.treated for a in assignments if mstart(a.t0) <= full_end}
+    out = []
+    for a in assignments:
+        pool = a.donors if a.donors is not None else units
+        drop = ({a.treated} | treated_in_window) if exclude_treated else {a.treated}
+        out.append([d for d in pool if d not in drop])
+    return out
+
+
+def _fit_group(cube: PanelCube, outcome: str, t0, pre_start, date_min, fit_end, full_end,
+               items: List[Tuple[int, str, List[str]]], min_donors: int, solver: str
+               ) -> List[Tuple[int, Optional[FitResult], Optional[str]]]:
+    # one window (one wide matrix, one Gram) for every assignment sharing (t0, pre_start);
+    # each fit is a column mask on it
+    ww = WideWindow.from_cube(cube, cube.states, outcome, mstart(t0), mstart(pre_start),
+                              mstart(date_min), mstart(fit_end), mstart(full_end))
+    out = []
+    for i, treated, donors in items:
+        try:
+            out.append((i, ww.fit(treated, donors, min_donors=min_donors, solver=solver), None))
+        except ValueError as e:
+            out.append((i, None, str(e)))
+    return out
+
+
+def _fit_group_task(task: Tuple) -> List[Tuple[int, Optional[FitResult], Optional[str]]]:
+    from .parallel import worker_cube
+
+    return _fit_group(worker_cube(), *task)
+
+
+def fit_batch(panel: Union[pd.DataFrame, PanelCube], assignments: Iterable[Union[Assignment, Tuple, Dict[str, Any]]],
+              outcome: str, pre_start, date_min, fit_end, full_end,
+              min_donors: int = 5, solver: str = "native", exclude_treated: bool = True,
+              jobs: int = 1) -> BatchFit:
+    """
+    Fit many (treated, t0, donor pool) assignments against one panel: a
+    staggered-adoption study, or every unit in turn for the N x N cross-fit
+    matrix (exclude_treated=False, so each unit's donors are all the others).
+
+    Assignments sharing a window (t0, pre_start) share one WideWindow, so the
+    wide matrix and the pre-period Gram matrix are built once per distinct
+    window and each fit is a column mask plus one small simplex solve: cost is
+    linear in the number of treated units. With jobs > 1 the assignments of
+    each window are split into chunks over a process pool sharing the panel.
+    A failed fit is an error row in summary (and None in fits), as is an
+    assignment whose t0 falls after full_end: it is never fitted, so its
+    whole sample does not enter event_time as pre-period gaps (donor_pools
+    treats it as not yet treated).
+    """
+    cube = as_cube(panel, outcomes=[outcome])
+    assignments = as_assignments(assignments)
+    pools = donor_pools(assignments, cube.states, full_end, exclude_treated=exclude_treated)
+
+    fits: List[Optional[FitResult]] = [None] * len(assignments)
+    errors: List[Optional[str]] = [None] * len(assignments)
+    groups: Dict[Tuple[str, str], List[Tuple[int, str, List[str]]]] = {}
+    for i, (a, donors) in enumerate(zip(assignments, pools)):
+        if mstart(a.t0) > mstart(full_end):
+            errors[i] = f"t0 {a.t0} after full_end {mstart(full_end).date()}"
+            continue
+        key = (a.t0, a.pre_start if a.pre_start is not None else str(mstart(pre_start).date()))
+        groups.setdefault(key, []).append((i, a.treated, donors))
+
+    if jobs > 1 and len(assignments) > 1:
+        from .parallel import SharedPanel
+
+        tasks = []
+        for (t0, ps), items in groups.items():
+            size = max(1, -(-len(items) // jobs))
+            for k in range(0, len(items), size):
+                tasks.append((outcome, t0, ps, date_min, fit_end, full_end, items[k:k + size], min_donors, solver))
+        with SharedPanel(cube) as shared, shared.pool(jobs) as ex:
+            results = [r for chunk in ex.map(_fit_group_task, tasks) for r in chunk]
+    else:
+        results = [r for (t0, ps), items in groups.items()
+                   for r in _fit_group(cube, outcome, t0, ps, date_min, fit_end, full_end, items, min_donors, solver)]
+    for i, res, err in results:
+        fits[i], errors[i] = res, err
+
+    return _assemble(assignments, pools, fits, errors)
+
+
+def _event_months(dates: pd.DatetimeIndex, t0: pd.Timestamp) -> np.ndarray:
+    return (dates.year - t0.year) * 12 + (dates.month - t0.month)
+
+
+def _assemble(assignments: List[Assignment], pools: List[List[str]],
+              fits: List[Optional[FitResult]], errors: List[Optional[str]]) -> BatchFit:
+    summary, weights, gaps = [], [], []
+    for a, donors, res, err in zip(assignments, pools, fits, errors):
+        row: Dict[str, Any] = {"treated": a.treated, "t0": a.t0, "n_donors_requested": len(donors)}
+        if res is None:
+            summary.append({**row, "error": err})
+            continue
+        row.update({
+            "pre_start": str(res.pre_start.date()),
+            "n_donors_complete_pre": len(res.donors_complete_pre),
+            "n_donors_active": len(res.donors_active),
+            **{k: getattr(res, k) for k in _SUMMARY_FIELDS},
+            "error": None,
+        })
+        summary.append(row)
+        weights.append(pd.DataFrame({"treated": a.treated, "t0": a.t0,
+                                     "donor": res.weights.index, "weight": res.weights.to_numpy()}))
+        gaps.append(pd.DataFrame({"treated": a.treated, "t0": a.t0, "date": res.dates,
+                                  "event_time": _event_months(res.dates, res.t0),
+                                  "y": res.y, "y_synth": res.y_synth, "gap": res.gap,
+                                  "gap_std": res.gap / res.pre_rmspe if res.pre_rmspe > 0 else np.nan}))
+
+    gaps_df = (pd.concat(gaps, ignore_index=True) if gaps else
+               pd.DataFrame(columns=["treated", "t0", "date", "event_time", "y", "y_synth", "gap", "gap_std"]))
+    return BatchFit(
+        summary=pd.DataFrame(summary),
+        weights=pd.concat(weights, ignore_index=True) if weights else pd.DataFrame(columns=["treated", "t0", "donor", "weight"]),
+        gaps=gaps_df.drop(columns="gap_std"),
+        event_time=event_time_gaps(gaps_df),
+        fits=fits,
+    )
+
+
+def event_time_gaps(gaps: pd.DataFrame) -> pd.DataFrame:
+    """
+    Gaps stacked on months since each unit's t0 (event_time 0 = t0): per
+    event time, the number of treated units and the mean, median, sd and
+    standard error of the gap, plus the mean of gap / pre_rmspe (comparable
+    across units with different outcome levels) when gaps carries gap_std.
+    """
+    if gaps.empty:
+        return pd.DataFrame(columns=["event_time", "n_units", "mean_gap", "median_gap", "sd_gap", "se_gap"])
+    g = gaps.groupby("event_time", sort=True)
+    out = pd.DataFrame({
+        "n_units": g["gap"].count(),
+        "mean_gap": g["gap"].mean(),
+        "median_gap": g["gap"].median(),
+        "sd_gap": g["gap"].std(ddof=1),
+    })
+    out["se_gap"] = out["sd_gap"] / np.sqrt(out["n_units"])
+    if "gap_std" in gaps:
+        out["mean_gap_std"] = g["gap_std"].mean()
+    return out.reset_index()
+
+
+def cross_fit_matrix(weights: pd.DataFrame) -> pd.DataFrame:
+    """Treated x donor weight matrix (0 where a donor got no weight) from BatchFit.weights."""
+    m = weights.pivot_table(index=["treated", "t0"], columns="donor", values="weight", aggfunc="sum", fill_value=0.0)
+    return m.rename_axis(columns=None)
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .panel import DATE_COL, STATE_COL, PanelCube, mstart, month_index, normalize_panel_df
+
+
+# Bump when the on-disk layout changes; read_metadata refuses other versions.
+STORE_VERSION = "1"
+METADATA = "_metadata.json"
+CUBE_FILE = "cube.npy"
+MONTH_COL = "month"
+YEAR_COL = "year"
+
+# month_index() counts months from year 0; numpy's datetime64[M] counts from 1970-01
+_EPOCH_MONTH = 1970 * 12
+
+
+def month_dates(months: np.ndarray) -> pd.DatetimeIndex:
+    """Inverse of month_index: month-start dates for integer month indexes."""
+    m = np.asarray(months, dtype=np.int64) - _EPOCH_MONTH
+    return pd.DatetimeIndex(m.astype("datetime64[M]").astype("datetime64[ns]"))
+
+
+def compact_dtype(x: np.ndarray, float32_tol: float = 0.0) -> str:
+    """
+    Smallest storage dtype for a float64 column: int32/int64 when every value is
+    a finite integer, float32 when the worst relative round-trip error is within
+    float32_tol (0 = exact only), otherwise float64.
+    """
+    x = np.asarray(x, dtype=float)
+    fin = np.isfinite(x)
+    if x.size and fin.all() and np.array_equal(x, np.round(x)):
+        lo, hi = x.min(), x.max()
+        return "int32" if np.iinfo(np.int32).min <= lo and hi <= np.iinfo(np.int32).max else "int64"
+    v = x[fin]
+    if v.size == 0:
+        return "float32"
+    err = np.abs(v.astype(np.float32).astype(float) - v)
+    rel = float(np.max(err / np.maximum(np.abs(v), np.finfo(float).tiny)))
+    return "float32" if rel <= float32_tol else "float64"
+
+
+def write_store(df: pd.DataFrame, root, unit_col: str = STATE_COL, partition_by: str = STATE_COL,
+                value_cols: Optional[List[str]] = None, float32_tol: float = 0.0,
+                cube: bool = True) -> Dict[str, Any]:
+    """
+    Write a long (unit, date, values...) panel as a Hive-partitioned parquet
+    store under root:
+
+        root/_metadata.json           layout, dtypes, units, month range, per-partition stats
+        root/{partition_by}={v}/part-0.parquet
+        root/cube.npy                 dense dates x units x values float64 array (cube=True)
+
+    Dates are stored as the integer month index ("month", see month_index),
+    units as a dictionary (categorical) column and each value column in the
+    smallest dtype that keeps it exact (see compact_dtype; float32_tol > 0
+    also allows float32 for non-integer columns). partition_by is the unit
+    column, another categorical column (e.g. state_abb for an agency panel)
+    or "year". The cube is built from the float64 values before compaction,
+    so fits over the memory-mapped view match fits over the source frame.
+
+    The store is written to a temporary sibling directory and swapped in, so
+    a failed write never leaves a half-written store behind. Returns the
+    metadata dict.
+    """
+    root = Path(root)
+    df = normalize_panel_df(df)
+    df = df[df[unit_col].notna() & df[DATE_COL].notna()]
+    if value_cols is None:
+        value_cols = [c for c in df.columns
+                      if c not in (STATE_COL, DATE_COL, unit_col) and pd.api.types.is_numeric_dtype(df[c])]
+    cat_cols = list(dict.fromkeys(c for c in (unit_col, STATE_COL) if c in df.columns and c != partition_by))
+
+    out = pd.DataFrame({c: df[c].astype(str).astype("category") for c in cat_cols})
+    out[MONTH_COL] = month_index(df[DATE_COL]).astype(np.int32)
+    dtypes = {}
+    for c in value_cols:
+        x = df[c].to_numpy(dtype=float, na_value=np.nan)
+        dtypes[c] = compact_dtype(x, float32_tol)
+        out[c] = x.astype(dtypes[c])
+    part = out[MONTH_COL] // 12 if partition_by == YEAR_COL else df[partition_by].astype(str)
+    out = out.assign(_part=part.to_numpy()).sort_values(["_part"] + cat_cols[:1] + [MONTH_COL], kind="stable")
+
+    root.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{root.name}.", dir=root.parent))
+    try:
+        partitions = {}
+        for value, g in out.groupby("_part", sort=True, observed=True):
+            d = tmp / f"{partition_by}={value}"
+            d.mkdir()
+            g = g.drop(columns="_part").reset_index(drop=True)
+            g.to_parquet(d / "part-0.parquet", index=False)
+            partitions[str(value)] = {
+                "rows": int(len(g)),
+                "month_min": int(g[MONTH_COL].min()),
+                "month_max": int(g[MONTH_COL].max()),
+            }
+
+        months = out[MONTH_COL].to_numpy()
+        units = sorted(df[unit_col].astype(str).unique())
+        meta: Dict[str, Any] = {
+            "version": STORE_VERSION,
+            "unit_col": unit_col,
+            "partition_by": partition_by,
+            "month_col": MONTH_COL,
+            "month_origin": "year * 12 + month - 1",
+            "rows": int(len(out)),
+            "units": units,
+            "month_min": int(months.min()) if months.size else None,
+            "month_max": int(months.max()) if months.size else None,
+            "columns": {**{c: "category" for c in cat_cols}, MONTH_COL: "int32", **dtypes},
+            "float32_tol": float32_tol,
+            "partitions": partitions,
+        }
+        if cube:
+            pc = PanelCube.from_frame(df, outcomes=value_cols, normalize=False, unit_col=unit_col)
+            np.save(tmp / CUBE_FILE, pc.values)
+            meta["cube"] = {
+                "file": CUBE_FILE,
+                "dtype": str(pc.values.dtype),
+                "shape": list(pc.values.shape),
+                "months": month_index(pc.dates).tolist(),
+                "units": pc.states,
+                "outcomes": pc.outcomes,
+            }
+        with open(tmp / METADATA, "w") as f:
+            json.dump(meta, f, indent=1)
+
+        if root.exists():
+            old = root.with_name(f".{root.name}.old")
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(root, old)
+            os.replace(tmp, root)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp, root)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return meta
+
+
+def is_store(path) -> bool:
+    return (Path(path) / METADATA).is_file()
+
+
+def read_metadata(root) -> Dict[str, Any]:
+    with open(Path(root) / METADATA) as f:
+        meta = json.load(f)
+    if meta.get("version") != STORE_VERSION:
+        raise ValueError(f"{root}: store version {meta.get('version')!r}, this code reads {STORE_VERSION!r}; rebuild it")
+    return meta
+
+
+def _month_bounds(date_min, date_max) -> Tuple[Optional[int], Optional[int]]:
+    lo = None if date_min is None else int(month_index([mstart(date_min)])[0])
+    hi = None if date_max is None else int(month_index([mstart(date_max)])[0])
+    return lo, hi
+
+
+def read_store(root, columns: Optional[List[str]] = None, states: Optional[Iterable[str]] = None,
+               exclude_states: Optional[Iterable[str]] = None, date_min=None, date_max=None) -> pd.DataFrame:
+    """
+    Long frame from a store, reading only what the query needs: state
+    inclusions/exclusions prune whole partitions when the store is
+    partitioned by state, and the date window is pushed into the parquet
+    reader as a month-index filter (row groups outside it are skipped).
+    Returns the unit (and state) as categoricals, "date" rebuilt from the
+    month index and the value columns in their stored dtypes.
+    """
+    import pyarrow.dataset as ds
+
+    root = Path(root)
+    meta = read_metadata(root)
+    unit_col, partition_by = meta["unit_col"], meta["partition_by"]
+    dataset = ds.dataset(root, format="parquet",
+                         partitioning=ds.HivePartitioning.discover(infer_dictionary=partition_by != YEAR_COL),
+                         exclude_invalid_files=True, ignore_prefixes=[".", "_", CUBE_FILE])
+
+    flt = None
+
+    def _and(e):
+        return e if flt is None else flt & e
+
+    if states is not None:
+        flt = _and(ds.field(STATE_COL).isin(sorted(set(states))))
+    if exclude_states:
+        flt = _and(~ds.field(STATE_COL).isin(sorted(set(exclude_states))))
+    lo, hi = _month_bounds(date_min, date_max)
+    if lo is not None:
+        flt = _and(ds.field(MONTH_COL) >= lo)
+    if hi is not None:
+        flt = _and(ds.field(MONTH_COL) <= hi)
+
+    keys = list(dict.fromkeys(c for c in (unit_col, STATE_COL) if c in meta["columns"] or c == partition_by))
+    values = [c for c in meta["columns"] if c not in keys and c != MONTH_COL] if columns is None else list(columns)
+    table = dataset.to_table(columns=keys + [MONTH_COL] + values, filter=flt)
+
+    df = table.to_pandas()
+    for c in keys:
+        df[c] = df[c].astype(str).astype("category") if df[c].dtype != "category" else df[c]
+    df.insert(len(keys), DATE_COL, month_dates(df.pop(MONTH_COL).to_numpy()))
+    return df.sort_values([unit_col, DATE_COL], kind="stable", ignore_index=True)
+
+
+def open_cube(root, outcomes: Optional[List[str]] = None, states: Optional[Iterable[str]] = None,
+              exclude_states: Optional[Iterable[str]] = None, date_min=None, date_max=None) -> PanelCube:
+    """
+    PanelCube over the store's memory-mapped cube.npy. The date window is a
+    basic slice (still a view of the mapped file); selecting states or a
+    subset of outcomes copies just the selected columns.
+    """
+    root = Path(root)
+    meta = read_metadata(root)
+    info = meta.get("cube")
+    if info is None:
+        raise FileNotFoundError(f"{root}: store was written without a cube (write_store(..., cube=True))")
+    values = np.load(root / info["file"], mmap_mode="r")
+    months = np.asarray(info["months"], dtype=np.int64)
+    units, all_outcomes = list(info["units"]), list(info["outcomes"])
+
+    lo, hi = _month_bounds(date_min, date_max)
+    r = slice(0 if lo is None else int(np.searchsorted(months, lo, "left")),
+              len(months) if hi is None else int(np.searchsorted(months, hi, "right")))
+    values, months = values[r], months[r]
+
+    if outcomes is not None and list(outcomes) != all_outcomes:
+        missing = [o for o in outcomes if o not in all_outcomes]
+        if missing:
+            raise KeyError(f"{root}: outcomes not in store cube: {missing}")
+        values = np.asarray(values[:, :, [all_outcomes.index(o) for o in outcomes]])
+        all_outcomes = list(outcomes)
+
+    cube = PanelCube(values, month_dates(months), units, all_outcomes, unit_col=meta["unit_col"])
+    keep = units if states is None else [u for u in units if u in set(states)]
+    if exclude_states:
+        drop = set(exclude_states)
+        keep = [u for u in keep if u not in drop]
+    if len(keep) != len(units):
+        cube = cube.subset(keep)
+    return cube
+
+
+def load_panel(path, outcomes: Optional[List[str]] = None, exclude_states: Optional[Iterable[str]] = None,
+               date_min=None, date_max=None, mmap: bool = True) -> PanelCube:
+    """
+    PanelCube from either layout: a store directory (memory-mapped cube when
+    present and mmap, else read_store with pushdown) or a flat parquet file
+    (state exclusions pushed into the reader). The date window only trims
+    months outside [date_min, date_max]; fits never look outside it.
+    """
+    path = Path(path)
+    if is_store(path):
+        if mmap and (path / CUBE_FILE).exists():
+            return open_cube(path, outcomes=outcomes, exclude_states=exclude_states,
+                             date_min=date_min, date_max=date_max)
+        meta = read_metadata(path)
+        df = read_store(path, columns=outcomes, exclude_states=exclude_states, date_min=date_min, date_max=date_max)
+        return PanelCube.from_frame(df, outcomes=outcomes, normalize=False, unit_col=meta["unit_col"])
+
+    filters = [(STATE_COL, "not in", sorted(set(exclude_states)))] if exclude_states else None
+    df = normalize_panel_df(pd.read_parquet(path, filters=filters))
+    lo, hi = _month_bounds(date_min, date_max)
+    if lo is not None or hi is not None:
+        m = month_index(df[DATE_COL])
+        df = df[((m >= lo) if lo is not None else True) & ((m <= hi) if hi is not None else True)]
+    return PanelCube.from_frame(df, outcomes=outcomes, normalize=False)
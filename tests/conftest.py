@@ -0,0 +1,7 @@
+from pathlib import Path
+import sys
+
+# tests import the package as src.prop47_state and the scripts' helpers, like scripts/ do
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(REPO_ROOT / "scripts"))
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.prop47_state.inference import conformal_inference
+from src.prop47_state.scm import fit_one
+
+THETA = 5.0
+
+
+def _synthetic_panel(seed: int = 0) -> pd.DataFrame:
+    """
+    20 donors from a two-factor model; the treated unit is a convex mix of
+    three donors plus iid noise, with a constant effect THETA from 2015-01.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2010-01-01", "2019-12-01", freq="MS")
+    T, J = dates.size, 20
+    factors = np.c_[np.linspace(0, 20, T), 5 * np.sin(np.arange(T) * 2 * np.pi / 12)]
+    donors = 100 + rng.normal(0, 10, J) + factors @ rng.uniform(0.5, 1.5, size=(2, J)) + rng.normal(0, 1, (T, J))
+    treated = donors[:, :3] @ np.array([0.5, 0.3, 0.2]) + rng.normal(0, 1, T) + THETA * (dates >= "2015-01-01")
+    units = ["TR"] + [f"D{j:02d}" for j in range(J)]
+    values = np.c_[treated, donors]
+    return pd.DataFrame({
+        "state_abb": np.repeat(units, T),
+        "date": np.tile(dates, len(units)),
+        "y": values.T.reshape(-1),
+    })
+
+
+def _fit(df):
+    donors = sorted(set(df["state_abb"]) - {"TR"})
+    return fit_one(df, "TR", "y", donors, pre_start="2010-01-01", t0="2015-01-01", date_min="2010-01-01",
+                   fit_end="2019-12-01", full_end="2019-12-01", solver="native")
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_conformal_set_covers_constant_effect(seed):
+    df = _synthetic_panel(seed)
+    summary, curve = conformal_inference(df, _fit(df), n_perms=2000, alpha=0.1)
+
+    assert list(summary["segment"].unique()) == ["post1"]
+    block = summary.set_index("scheme").loc["block"]
+    assert block["ci_status"] == "interval"
+    assert block["ci_lo"] <= THETA <= block["ci_hi"]
+    assert block["ci_lo"] <= block["avg_gap"] <= block["ci_hi"]
+    assert block["pval_zero"] <= 0.1
+
+    # p(theta) peaks inside the set and falls to its minimum at both grid edges
+    c = curve[curve["scheme"] == "block"]
+    assert block["ci_lo"] <= c.loc[c["pval"].idxmax(), "theta"] <= block["ci_hi"]
+    assert c["pval"].iloc[0] <= 0.1 and c["pval"].iloc[-1] <= 0.1
+
+
+def test_conformal_bounds_only_for_intervals():
+    df = _synthetic_panel(0)
+    summary, _ = conformal_inference(df, _fit(df), n_perms=500, alpha=0.1, refit="null")
+    assert (summary["refit"] == "null").all()
+    bounded = summary["ci_status"] == "interval"
+    assert summary.loc[bounded, ["ci_lo", "ci_hi"]].notna().all().all()
+    assert summary.loc[~bounded, ["ci_lo", "ci_hi"]].isna().all().all()
+    with pytest.raises(ValueError):
+        conformal_inference(df, _fit(df), refit="all")
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from bench_flag_missing import reference, synthetic_year
+from build_state_panel import MISSING_STRATEGIES, flag_missing_frame, strategy_partials
+
+
+def _agency_year_frame() -> pd.DataFrame:
+    """Synthetic agency-months with NaN / 0 / 12 / partial months reported, ties and a shuffled index."""
+    df = synthetic_year(400, 2015, seed=3)
+    agencies = df["ori"].unique()
+    reported = dict(zip(agencies, np.resize([np.nan, 0, 12, 5, 11, 1], agencies.size)))
+    df["number_of_months_reported"] = df["ori"].map(reported)
+    # ties on the ordering key: whole agencies with identical counts every month
+    flat = df["ori"].isin(agencies[::7])
+    df.loc[flat, ["actual_theft_total", "actual_index_violent"]] = 2.0
+    # an agency-year with fewer than 12 rows, and rows in no particular order
+    df = df.drop(df.index[(df["ori"] == agencies[3]) & (df["month"] > 8)])
+    df = df.sample(frac=1.0, random_state=0)
+    df.index = np.random.default_rng(0).permutation(10 * len(df))[:len(df)]
+    return df
+
+
+def test_flag_missing_frame_matches_groupby_apply():
+    df = _agency_year_frame()
+    assert df["number_of_months_reported"].isna().any()
+    assert set(df["number_of_months_reported"].dropna()) >= {0, 12}
+
+    vec = flag_missing_frame(df)
+    pd.testing.assert_frame_equal(vec, reference(df))
+
+    n_rep = df.groupby("ori")["number_of_months_reported"].first()
+    n_flag = vec.groupby("ori")["month_missing"].sum()
+    n_rows = df.groupby("ori").size()
+    assert (n_flag[n_rep[n_rep.isna()].index] == 0).all()
+    assert (n_flag[n_rep[n_rep == 12].index] == 0).all()
+    zero = n_rep[n_rep == 0].index
+    assert (n_flag[zero] == n_rows[zero]).all()
+
+
+def _nan_reported_agency_months() -> pd.DataFrame:
+    """year_agency_frame rows: one ORI-year with NaN months reported, one fully reported ORI-year."""
+    rows = []
+    for ori, n_rep in (("NAN0001", np.nan), ("FULL001", 12.0)):
+        theft = np.arange(1.0, 13.0)
+        for rank, m in enumerate(np.argsort(theft, kind="stable")):
+            rows.append({"state_abb": "ZZ", "ori": ori, "year": 2015, "date": pd.Timestamp(2015, m + 1, 1),
+                         "population": 1000.0, "n_reported": n_rep, "rank": rank,
+                         "actual_theft_total": theft[m], "actual_index_violent": 1.0})
+    return pd.DataFrame(rows)
+
+
+def test_strategies_keep_population_and_crimes_together_when_months_reported_is_nan():
+    df = _nan_reported_agency_months()
+    nan_rows = df["n_reported"].isna().to_numpy()
+    for name, strategy in MISSING_STRATEGIES.items():
+        pop_w, count_w = strategy(df)
+        # a NaN agency is kept whole or dropped whole, never crimes without population
+        np.testing.assert_array_equal(pop_w[nan_rows], count_w[nan_rows], err_msg=name)
+        assert np.isin(pop_w[nan_rows], (0.0, 1.0)).all(), name
+
+        part = strategy_partials(df, name)
+        kept = 2 if name != "drop_partial" else 1
+        assert (part["covered_pop"] == 1000.0 * kept).all(), name
+        assert (part["total_pop"] == 2000.0).all(), name
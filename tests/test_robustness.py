@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from src.prop47_state.robustness import leave_one_out
+from src.prop47_state.scm import WideWindow, fit_one
+
+
+def _panel(n_donors: int = 5, seed: int = 0) -> pd.DataFrame:
+    """Treated unit TR an even mix of donors D00-D02, plus noise, monthly 2010-2019."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2010-01-01", "2019-12-01", freq="MS")
+    donors = {f"D{j:02d}": 100 + 10 * j + np.cumsum(rng.normal(0, 1, dates.size)) for j in range(n_donors)}
+    donors["TR"] = (donors["D00"] + donors["D01"] + donors["D02"]) / 3 + rng.normal(0, 0.5, dates.size)
+    return pd.concat([pd.DataFrame({"state_abb": s, "date": dates, "y": y}) for s, y in donors.items()],
+                     ignore_index=True)
+
+
+def _fit(df: pd.DataFrame, min_donors: int, solver: str = "native"):
+    donors = sorted(set(df["state_abb"]) - {"TR"})
+    return fit_one(df, "TR", "y", donors, pre_start="2010-01-01", t0="2015-01-01", date_min="2010-01-01",
+                   fit_end="2019-12-01", full_end="2019-12-01", min_donors=min_donors, solver=solver)
+
+
+def test_leave_one_out_records_refits_below_min_donors():
+    df = _panel()
+    tr = _fit(df, min_donors=5)
+    loo = leave_one_out(df, tr, min_donors=5)
+
+    assert list(loo.summary["dropped_donor"]) == tr.donors_active
+    assert loo.summary["error"].str.contains("Too few complete donors").all()
+    assert loo.weights.empty and loo.gaps.empty
+
+
+def test_leave_one_out_refits_with_the_treated_solver(monkeypatch):
+    df = _panel()
+    seen = []
+    fit = WideWindow.fit
+
+    def spy(self, *args, **kwargs):
+        seen.append(kwargs["solver"])
+        return fit(self, *args, **kwargs)
+
+    monkeypatch.setattr(WideWindow, "fit", spy)
+    for solver in ("native", "cvxpy"):
+        tr = _fit(df, min_donors=2, solver=solver)
+        seen.clear()
+        loo = leave_one_out(df, tr, min_donors=2)
+        assert seen == [solver] * len(tr.donors_active)
+        assert loo.summary["error"].isna().all()
+        assert set(loo.gaps["dropped_donor"]) == set(tr.donors_active)
@@ -0,0 +1,93 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.prop47_state.scm import DENSE_GRAM_MAX_DONORS, normalize_panel_df, solve_scm_weights_info
+
+cp = pytest.importorskip("cvxpy")
+
+PANEL = Path(__file__).resolve().parents[1] / "data/processed/state_month_covered.parquet"
+WEIGHT_TOL = 1e-4
+OBJ_TOL = 1e-6
+
+
+def _both(y, X):
+    w_c, info_c = solve_scm_weights_info(y, X, solver="cvxpy")
+    w_n, info_n = solve_scm_weights_info(y, X, solver="native")
+    assert info_n.status == "optimal"
+    return w_c, info_c, w_n, info_n
+
+
+def _rel_excess(info_n, info_c) -> float:
+    return (info_n.objective - info_c.objective) / max(info_c.objective, 1e-12)
+
+
+def _spec_problems():
+    if not PANEL.exists():
+        return []
+    from check_native_solver import spec_problems
+    from run_state_scm import DEFAULT_SPECS, STATE_QC_DEFAULT, dq_exclusions
+
+    df = normalize_panel_df(pd.read_parquet(PANEL))
+    df = df[~df["state_abb"].isin(dq_exclusions(None, STATE_QC_DEFAULT, treated="CA"))]
+    return [pytest.param(y, X, id=f"{spec_id}-{label}")
+            for spec_id, outcome, t0, pre_start in DEFAULT_SPECS
+            for label, y, X in spec_problems(df, "CA", outcome, t0, pre_start, "2010-01-01", "2019-12-01")]
+
+
+@pytest.mark.skipif(not PANEL.exists(), reason="processed panel not available")
+@pytest.mark.parametrize("y, X", _spec_problems())
+def test_native_matches_cvxpy_on_default_specs(y, X):
+    w_c, info_c, w_n, info_n = _both(y, X)
+    assert np.max(np.abs(w_c - w_n)) <= WEIGHT_TOL
+    assert _rel_excess(info_n, info_c) <= OBJ_TOL
+
+
+def test_single_donor():
+    rng = np.random.default_rng(0)
+    X = rng.normal(100, 5, size=(48, 1))
+    y = X[:, 0] + rng.normal(0, 1, 48)
+    w_c, info_c, w_n, info_n = _both(y, X)
+    assert w_n.tolist() == [1.0]
+    assert np.allclose(w_c, 1.0, atol=WEIGHT_TOL)
+    assert abs(_rel_excess(info_n, info_c)) <= OBJ_TOL
+
+
+def test_duplicate_donor_columns():
+    # duplicated columns make the weights non-unique: compare the fit, and
+    # the total weight on each duplicated pair
+    rng = np.random.default_rng(1)
+    base = rng.normal(100, 10, size=(58, 6)).cumsum(axis=0) / 10
+    X = np.hstack([base, base[:, :3]])
+    y = base[:, :3] @ np.array([0.5, 0.3, 0.2]) + rng.normal(0, 0.5, 58)
+    w_c, info_c, w_n, info_n = _both(y, X)
+    assert _rel_excess(info_n, info_c) <= OBJ_TOL
+    assert np.max(np.abs(X @ w_n - X @ w_c)) <= 1e-3 * np.abs(y).max()
+    fold = lambda w: np.r_[w[:3] + w[6:], w[3:6]]
+    assert np.max(np.abs(fold(w_n) - fold(w_c))) <= WEIGHT_TOL
+
+
+def test_many_donors_design_path():
+    # J > DENSE_GRAM_MAX_DONORS: the native solver works on the design matrix.
+    # OSQP (the cvxpy default here) takes minutes at this size, so the cvxpy
+    # reference is solved with the interior-point Clarabel instead.
+    if "CLARABEL" not in cp.installed_solvers():
+        pytest.skip("Clarabel not installed")
+    rng = np.random.default_rng(2)
+    T, J = 60, DENSE_GRAM_MAX_DONORS + 200
+    X = 50 + rng.normal(0, 1, size=(T, J)).cumsum(axis=0)
+    y = X[:, :4] @ np.array([0.4, 0.3, 0.2, 0.1]) + rng.normal(0, 0.3, T)
+
+    w = cp.Variable(J)
+    cp.Problem(cp.Minimize(cp.sum_squares(y - X @ w)), [w >= 0, cp.sum(w) == 1]).solve(solver=cp.CLARABEL)
+    w_c = np.maximum(np.asarray(w.value).reshape(-1), 0.0)
+    w_c /= w_c.sum()
+    w_n, info_n = solve_scm_weights_info(y, X, solver="native")
+
+    assert info_n.status == "optimal"
+    assert np.isclose(w_n.sum(), 1.0) and (w_n >= 0).all()
+    obj_c = float(np.sum((y - X @ w_c) ** 2))
+    assert (info_n.objective - obj_c) / obj_c <= 1e-4
+    assert np.max(np.abs(X @ w_n - X @ w_c)) <= 1e-2
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from src.prop47_state.staggered import fit_batch
+
+
+def _panel(n_units: int = 8, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2010-01-01", "2019-12-01", freq="MS")
+    return pd.concat([pd.DataFrame({"state_abb": f"U{j:02d}", "date": dates,
+                                    "y": 100 + 5 * j + np.cumsum(rng.normal(0, 1, dates.size))})
+                      for j in range(n_units)], ignore_index=True)
+
+
+def test_assignment_treated_after_full_end_is_an_error_row():
+    df = _panel()
+    batch = fit_batch(df, [("U00", "2015-01-01"), ("U01", "2030-01-01")], "y", pre_start="2010-01-01",
+                      date_min="2010-01-01", fit_end="2019-12-01", full_end="2019-12-01", min_donors=3)
+
+    summary = batch.summary.set_index("treated")
+    assert pd.isna(summary.at["U00", "error"])
+    assert summary.at["U01", "error"].startswith("t0 2030-01-01 after full_end")
+    assert batch.fits[1] is None
+    # only U00's gaps enter the event-time aggregate; U01 stays a donor (not yet treated)
+    assert set(batch.gaps["treated"]) == {"U00"}
+    assert batch.event_time["event_time"].min() == -60
+    assert (batch.event_time["n_units"] == 1).all()
+    assert "U01" in batch.fits[0].donors_complete_pre